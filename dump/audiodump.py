@@ -1,8 +1,10 @@
 import json
-import multiprocessing as mp
 import os
 import sys
 
+from dumputils import imap_utts
+from dumputils import UttsJsonWriter
+
 
 def processing(i, audiodata):
     if audiodata["utts"][i]["input"][0]["shape"][0] < 10:
@@ -18,8 +20,8 @@ def processing(i, audiodata):
         return {i: audiodata["utts"][i]}
 
 
-def product_helper(args):
-    return processing(*args)
+def product_helper(i, audiodata):
+    return processing(i, audiodata)
 
 
 def audiojson(dumpfile, dumpsrcfile, dset, ifmulticore):
@@ -28,7 +30,6 @@ def audiojson(dumpfile, dumpsrcfile, dset, ifmulticore):
     else:
         ifmulticore = False
 
-    output = {"utts": {}}
     for root, dirs, files in os.walk(os.path.join(dumpsrcfile, dset)):
         for file in files:
             if ".json" in file:
@@ -40,30 +41,15 @@ def audiojson(dumpfile, dumpsrcfile, dset, ifmulticore):
 
     keylist = list(audiodata["utts"].keys())
 
-    results = []
-    if ifmulticore is True:
-        pool = mp.Pool()
-        job_args = [(i, audiodata) for i in keylist]
-        results.extend(pool.map(product_helper, job_args))
-
-    else:
-
-        for i in keylist:
-            results.append(processing(i, audiodata))
-
-    for i in range(len(results)):
-        if results[i] is None:
-            pass
-        else:
-            output["utts"].update(results[i])
-
     savefilename = filename.replace(
         os.path.join(dumpsrcfile, dset), os.path.join(dumpfile, dset)
     )
     if not os.path.exists(savefilename.replace(jsonname, "")):
         os.makedirs(savefilename.replace(jsonname, ""))
-    with open(savefilename, "w", encoding="utf-8") as f:
-        json.dump(output, f, ensure_ascii=False, indent=4)
+    with UttsJsonWriter(savefilename) as writer:
+        for result in imap_utts(product_helper, keylist, audiodata, ifmulticore):
+            if result is not None:
+                writer.update(result)
 
 
 # hand over parameter overview
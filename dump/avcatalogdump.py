@@ -0,0 +1,36 @@
+import json
+import os
+import sys
+
+from dumputils import find_data_json
+from espnet.finetuneav.catalog import UtteranceCatalog
+
+
+def avcatalogdump(dumpfile, catalogdir, dset, jsonfile=None):
+    if jsonfile is None:
+        filename = find_data_json(os.path.join(dumpfile, dset))
+    else:
+        filename = jsonfile
+    jsonname = os.path.basename(filename)
+    with open(filename, encoding="utf-8") as json_file:
+        avdata = json.load(json_file)
+
+    savedir = os.path.join(catalogdir, dset)
+    if not os.path.exists(savedir):
+        os.makedirs(savedir)
+    catalog = UtteranceCatalog.from_utts(avdata["utts"])
+    catalog.save(os.path.join(savedir, os.path.splitext(jsonname)[0] + ".npz"))
+
+
+# hand over parameter overview
+# sys.argv[1] = dumpfile (str), Directory of the audio-visual dump files, e.g.
+#               written by avtraindump.py, avrmsdump.py or avpackdump.py
+# sys.argv[2] = catalogdir (str), Directory to save the catalog, which is given
+#               to asr_train_avrms.py as --train-json or --valid-json
+# sys.argv[3] = dset (str), Which dataset
+# optional
+# sys.argv[4] = jsonfile (str), The data json of the dump, by default the only
+#               json in dumpfile/dset besides the .bin.json indexes
+
+
+avcatalogdump(*sys.argv[1:5])
@@ -0,0 +1,110 @@
+import json
+import os
+import sys
+
+import kaldiio
+import numpy as np
+import torch
+
+from dumputils import find_data_json
+
+# all modalities read by LoadInputsAndTargets, with the loader type they use
+# if the dump file does not give one. "rms" only exists in dump files written
+# by avrmsdump.py
+MODALITIES = {
+    "afeat": "mat",
+    "mfcc": "mat",
+    "vfeat": "pt",
+    "aRMs": "pt",
+    "vRMs": "pt",
+    "AUs": "pt",
+    "rms": "mat",
+}
+# byte alignment of the arrays in the data file
+ALIGNMENT = 64
+
+
+class PackedFeatureWriter(object):
+    """Pack the arrays of one modality into a single data file
+
+    The arrays are written C-ordered and back to back into ``name.bin`` and
+    their byte offset, shape and dtype are saved in the index ``name.bin.json``.
+    The store is read by ``PackedFeatureReader`` in ``finetuneav/io_utils.py``.
+
+    :param: str filepath: path of the data file
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.file = open(filepath, "wb")
+        self.index = {}
+
+    def __setitem__(self, key, array):
+        array = np.ascontiguousarray(array)
+        offset = self.file.tell()
+        padding = -offset % ALIGNMENT
+        self.file.write(b"\0" * padding)
+        self.file.write(array.tobytes())
+        self.index[key] = [offset + padding, list(array.shape), array.dtype.str]
+
+    def close(self):
+        self.file.close()
+        with open(self.filepath + ".json", "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+
+
+def load(filepath, filetype):
+    if filetype == "mat":
+        return kaldiio.load_mat(filepath)
+    elif filetype == "pt":
+        data = torch.load(filepath)
+        if torch.is_tensor(data):
+            data = data.numpy()
+        return np.asarray(data)
+    else:
+        raise NotImplementedError("Not supported: loader_type={}".format(filetype))
+
+
+def avpackdump(dumpfile, packdir, dset, jsonfile=None):
+    if jsonfile is None:
+        filename = find_data_json(os.path.join(dumpfile, dset))
+    else:
+        filename = jsonfile
+    jsonname = os.path.basename(filename)
+    with open(filename, encoding="utf-8") as json_file:
+        avdata = json.load(json_file)
+
+    savedir = os.path.join(packdir, dset)
+    if not os.path.exists(savedir):
+        os.makedirs(savedir)
+    writers = {
+        name: PackedFeatureWriter(os.path.join(savedir, name + ".bin"))
+        for name in MODALITIES
+    }
+    for uttid, info in avdata["utts"].items():
+        for inp in info["input"]:
+            for name, filetype in MODALITIES.items():
+                if name not in inp:
+                    continue
+                array = load(inp[name], inp.get("filetype", filetype))
+                writers[name][uttid] = array
+                inp[name] = writers[name].filepath + ":" + uttid
+            inp["filetype"] = "packed"
+    for writer in writers.values():
+        writer.close()
+
+    with open(os.path.join(savedir, jsonname), "w", encoding="utf-8") as f:
+        json.dump(avdata, f, ensure_ascii=False, indent=4)
+
+
+# hand over parameter overview
+# sys.argv[1] = dumpfile (str), Directory of the audio-visual dump files
+# sys.argv[2] = packdir (str), Directory to save the packed features and the
+#               dump file which refers to them
+# sys.argv[3] = dset (str), Which dataset
+# optional
+# sys.argv[4] = jsonfile (str), The data json of the dump, by default the only
+#               json in dumpfile/dset besides the .bin.json indexes
+
+
+avpackdump(*sys.argv[1:5])
@@ -1,8 +1,10 @@
 import json
-import multiprocessing as mp
 import os
 import sys
 
+from dumputils import imap_utts
+from dumputils import UttsJsonWriter
+
 
 def processing(i, audiodata, mfccdata, vdir, snrdir, vrmdir, dset, videonoise):
     if "noise" in i or "reverb" in i:
@@ -61,8 +63,14 @@ def processing(i, audiodata, mfccdata, vdir, snrdir, vrmdir, dset, videonoise):
     return {i: audiodata["utts"][i]}
 
 
-def product_helper(args):
-    return processing(*args)
+def product_helper(i, shared):
+    return processing(
+        i,
+        shared["audiodata"],
+        shared["mfccdata"],
+        shared["videodata"]["utts"][i.split("-")[0]],
+        *shared["args"],
+    )
 
 
 def avpretraindecodedump(
@@ -84,7 +92,6 @@ def avpretraindecodedump(
         ifmulticore = False
 
     snrdir = os.path.join(snrdir, dset + "_" + audionoise)
-    output = {"utts": {}}
     if videonoise == "None":
         videodset = dset
     else:
@@ -112,43 +119,14 @@ def avpretraindecodedump(
                 videodumpfile = os.path.join(root, file)
     with open(videodumpfile, encoding="UTF-8") as videojson_file:
         videodata = json.load(videojson_file)
-    results = []
-    if ifmulticore is True:
-        keylist = list(audiodata["utts"].keys())
-        pool = mp.Pool()
-        job_args = [
-            (
-                i,
-                audiodata,
-                mfccdata,
-                videodata["utts"][i.split("-")[0]],
-                snrdir,
-                vrmdir,
-                dset,
-                videonoise,
-            )
-            for i in keylist
-        ]
-        results.extend(pool.map(product_helper, job_args))
-    else:
-        keylist = list(audiodata["utts"].keys())
-        results = []
-        for i in keylist:
-            results.append(
-                processing(
-                    i,
-                    audiodata,
-                    mfccdata,
-                    videodata["utts"][i.split("-")[0]],
-                    snrdir,
-                    vrmdir,
-                    dset,
-                    videonoise,
-                )
-            )
+    shared = {
+        "audiodata": audiodata,
+        "mfccdata": mfccdata,
+        "videodata": videodata,
+        "args": (snrdir, vrmdir, dset, videonoise),
+    }
+    keylist = list(audiodata["utts"].keys())
 
-    for i in range(len(results)):
-        output["utts"].update(results[i])
     if videonoise == "None":
         savename = dset + "_" + audionoise
     else:
@@ -159,8 +137,9 @@ def avpretraindecodedump(
     )
     if not os.path.exists(savefilename.replace(jsonname, "")):
         os.makedirs(savefilename.replace(jsonname, ""))
-    with open(savefilename, "w", encoding="utf-8") as f:
-        json.dump(output, f, ensure_ascii=False, indent=4)
+    with UttsJsonWriter(savefilename) as writer:
+        for result in imap_utts(product_helper, keylist, shared, ifmulticore):
+            writer.update(result)
 
 
 # hand over parameter overview
@@ -1,8 +1,10 @@
 import json
-import multiprocessing as mp
 import os
 import sys
 
+from dumputils import imap_utts
+from dumputils import UttsJsonWriter
+
 
 def processing(i, audiodata, mfccdata, vdir, snrdir, vrmdir, dset):
     if "noise" in i or "reverb" in i:
@@ -51,8 +53,14 @@ def processing(i, audiodata, mfccdata, vdir, snrdir, vrmdir, dset):
     return {i: audiodata["utts"][i]}
 
 
-def product_helper(args):
-    return processing(*args)
+def product_helper(i, shared):
+    return processing(
+        i,
+        shared["audiodata"],
+        shared["mfccdata"],
+        shared["videodata"]["utts"][i.split("-")[0]],
+        *shared["args"],
+    )
 
 
 def avpretraindump(
@@ -71,7 +79,6 @@ def avpretraindump(
         ifmulticore = False
 
     snrdir = os.path.join(snrdir, dset)
-    output = {"utts": {}}
     for root, dirs, files in os.walk(os.path.join(dumpaudiofile, dset)):
         for file in files:
             if ".json" in file:
@@ -93,48 +100,22 @@ def avpretraindump(
         videodumpfile, encoding="UTF-8"
     ) as videojson_file:  # I think this should be dumpvideofile
         videodata = json.load(videojson_file)
-    results = []
-    if ifmulticore is True:
-        keylist = list(audiodata["utts"].keys())
-        pool = mp.Pool()
-        job_args = [
-            (
-                i,
-                audiodata,
-                mfccdata,
-                videodata["utts"][i.split("-")[0]],
-                snrdir,
-                vrmdir,
-                dset,
-            )
-            for i in keylist
-        ]
-        results.extend(pool.map(product_helper, job_args))
-    else:
-        keylist = list(audiodata["utts"].keys())
-        for i in keylist:
-            results.append(
-                processing(
-                    i,
-                    audiodata,
-                    mfccdata,
-                    videodata["utts"][i.split("-")[0]],
-                    snrdir,
-                    vrmdir,
-                    dset,
-                )
-            )
-
-    for i in range(len(results)):
-        output["utts"].update(results[i])
+    shared = {
+        "audiodata": audiodata,
+        "mfccdata": mfccdata,
+        "videodata": videodata,
+        "args": (snrdir, vrmdir, dset),
+    }
+    keylist = list(audiodata["utts"].keys())
 
     savefilename = filename.replace(
         os.path.join(dumpaudiofile, dset), os.path.join(dumpfile, dset)
     )
     if not os.path.exists(savefilename.replace(jsonname, "")):
         os.makedirs(savefilename.replace(jsonname, ""))
-    with open(savefilename, "w", encoding="utf-8") as f:
-        json.dump(output, f, ensure_ascii=False, indent=4)
+    with UttsJsonWriter(savefilename) as writer:
+        for result in imap_utts(product_helper, keylist, shared, ifmulticore):
+            writer.update(result)
 
 
 # hand over parameter overview
@@ -0,0 +1,69 @@
+import json
+import os
+import sys
+
+import kaldiio
+import numpy as np
+
+from dumputils import find_data_json
+from dumputils import imap_utts
+from espnet.finetuneav.io_utils import LoadInputsAndTargets
+from espnet.finetuneav.io_utils import make_rms
+
+loader = LoadInputsAndTargets()
+
+
+def processing(i, utts):
+    """Build the aligned reliability measures of one utterance, the same as
+    LoadInputsAndTargets does for a dump file without "rms"."""
+    inp = utts[i]["input"][0]
+    filetype = inp.get("filetype")
+    ax = loader._get_from_loader(inp["afeat"], filetype or "mat")
+    mfcc = loader._get_from_loader(inp["mfcc"], filetype or "mat")
+    arms = loader._get_from_loader(inp["aRMs"], filetype or "pt")
+    vrms = loader._get_from_loader(inp["vRMs"], filetype or "pt")
+    AUs = loader._get_from_loader(inp["AUs"], filetype or "pt")
+    return i, np.float32(make_rms(ax, mfcc, arms, vrms, AUs))
+
+
+def avrmsdump(dumpfile, rmsdir, dset, ifmulticore):
+    if ifmulticore == "true":
+        ifmulticore = True
+    else:
+        ifmulticore = False
+
+    filename = find_data_json(os.path.join(dumpfile, dset))
+    jsonname = os.path.basename(filename)
+    with open(filename, encoding="utf-8") as json_file:
+        avdata = json.load(json_file)
+
+    savedir = os.path.join(rmsdir, dset)
+    if not os.path.exists(savedir):
+        os.makedirs(savedir)
+    results = imap_utts(processing, list(avdata["utts"]), avdata["utts"], ifmulticore)
+
+    arkfile = os.path.join(savedir, "rms.ark")
+    scpfile = os.path.join(savedir, "rms.scp")
+    with kaldiio.WriteHelper("ark,scp:{},{}".format(arkfile, scpfile)) as writer:
+        for i, rms in results:
+            writer(i, rms)
+            avdata["utts"][i]["input"][0]["rmsshape"] = list(rms.shape)
+    with open(scpfile, encoding="utf-8") as f:
+        for line in f:
+            i, rmsfeat = line.strip().split(None, 1)
+            avdata["utts"][i]["input"][0]["rms"] = rmsfeat
+
+    with open(os.path.join(savedir, jsonname), "w", encoding="utf-8") as f:
+        json.dump(avdata, f, ensure_ascii=False, indent=4)
+
+
+# hand over parameter overview
+# sys.argv[1] = dumpfile (str), Directory of the audio-visual dump files, created
+#               by avtraindump.py or avtraindecodedump.py (before avpackdump.py)
+# sys.argv[2] = rmsdir (str), Directory to save the reliability measures and the
+#               dump file which refers to them
+# sys.argv[3] = dset (str), Which dataset
+# sys.argv[4] = ifmulticore (boolean), If multi cpu processing should be used
+
+
+avrmsdump(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4])
@@ -1,8 +1,9 @@
 import json
-import multiprocessing as mp
 import os
 import sys
-import torch
+
+from dumputils import imap_utts
+from dumputils import UttsJsonWriter
 
 
 def processing(
@@ -42,12 +43,6 @@ def processing(
     audiodata["utts"][i]["input"][0]["vfeat"] = os.path.join(
         videofeatdir, videoi + ".pt"
     )
-    videodata = torch.load(os.path.join(videofeatdir, videoi + ".pt"))
-    audiodata["utts"][i]["input"][0]["vshape"] = [
-        videodata.shape[0],
-        videodata.shape[1],
-        videodata.shape[2],
-    ]
     audiodata["utts"][i]["input"][0]["vshape"] = vdir["input"][0]["shape"]
     audiodata["utts"][i]["input"][0]["aRMs"] = os.path.join(snrdir, i + ".pt")
     audiodata["utts"][i]["input"][0]["vRMs"] = os.path.join(vconfdir, videoi + ".pt")
@@ -72,8 +67,14 @@ def processing(
     return {i: audiodata["utts"][i]}
 
 
-def product_helper(args):
-    return processing(*args)
+def product_helper(i, shared):
+    return processing(
+        i,
+        shared["audiodata"],
+        shared["mfccdata"],
+        shared["videodata"]["utts"][i.split("-")[0]],
+        *shared["args"],
+    )
 
 
 def avtraindecodedump(
@@ -96,7 +97,6 @@ def avtraindecodedump(
         ifmulticore = False
 
     snrdir = os.path.join(snrdir, dset + "_" + audionoise)
-    output = {"utts": {}}
     if videonoise == "None":
         videodset = dset
     else:
@@ -124,45 +124,14 @@ def avtraindecodedump(
                 videodumpfile = os.path.join(root, file)
     with open(videodumpfile, encoding="UTF-8") as mfccjson_file:
         videodata = json.load(mfccjson_file)
-    results = []
-    if ifmulticore is True:
-        keylist = list(audiodata["utts"].keys())
-        pool = mp.Pool()
-        job_args = [
-            (
-                i,
-                audiodata,
-                mfccdata,
-                videodata["utts"][i.split("-")[0]],
-                videodir,
-                snrdir,
-                vrmdir,
-                dset,
-                videonoise,
-            )
-            for i in keylist
-        ]
-        results.extend(pool.map(product_helper, job_args))
-    else:
-        keylist = list(audiodata["utts"].keys())
-        results = []
-        for i in keylist:
-            results.append(
-                processing(
-                    i,
-                    audiodata,
-                    mfccdata,
-                    videodata["utts"][i.split("-")[0]],
-                    videodir,
-                    snrdir,
-                    vrmdir,
-                    dset,
-                    videonoise,
-                )
-            )
+    shared = {
+        "audiodata": audiodata,
+        "mfccdata": mfccdata,
+        "videodata": videodata,
+        "args": (videodir, snrdir, vrmdir, dset, videonoise),
+    }
+    keylist = list(audiodata["utts"].keys())
 
-    for i in range(len(results)):
-        output["utts"].update(results[i])
     if videonoise == "None":
         savename = dset + "_" + audionoise
     else:
@@ -173,8 +142,9 @@ def avtraindecodedump(
     )
     if not os.path.exists(savefilename.replace(jsonname, "")):
         os.makedirs(savefilename.replace(jsonname, ""))
-    with open(savefilename, "w", encoding="utf-8") as f:
-        json.dump(output, f, ensure_ascii=False, indent=4)
+    with UttsJsonWriter(savefilename) as writer:
+        for result in imap_utts(product_helper, keylist, shared, ifmulticore):
+            writer.update(result)
 
 
 # hand over parameter overview
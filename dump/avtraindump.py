@@ -1,8 +1,10 @@
 import json
-import multiprocessing as mp
 import os
 import sys
-import torch
+
+from dumputils import imap_utts
+from dumputils import UttsJsonWriter
+from espnet.finetuneav.shapeindex import get_shape
 
 
 def processing(i, audiodata, mfccdata, videodir, snrdir, vrmdir, dset):
@@ -33,12 +35,9 @@ def processing(i, audiodata, mfccdata, videodir, snrdir, vrmdir, dset):
     audiodata["utts"][i]["input"][0]["vfeat"] = os.path.join(
         videofeatdir, videoi + ".pt"
     )
-    videodata = torch.load(os.path.join(videofeatdir, videoi + ".pt"))
-    audiodata["utts"][i]["input"][0]["vshape"] = [
-        videodata.shape[0],
-        videodata.shape[1],
-        videodata.shape[2],
-    ]
+    # read from the shape index or the file header, not the frames
+    vshape = get_shape(os.path.join(videofeatdir, videoi + ".pt"))
+    audiodata["utts"][i]["input"][0]["vshape"] = [vshape[0], vshape[1], vshape[2]]
     audiodata["utts"][i]["input"][0]["aRMs"] = os.path.join(snrdir, i + ".pt")
     audiodata["utts"][i]["input"][0]["vRMs"] = os.path.join(vconfdir, videoi + ".pt")
     audiodata["utts"][i]["input"][0]["aRMshape"] = [
@@ -54,8 +53,8 @@ def processing(i, audiodata, mfccdata, videodir, snrdir, vrmdir, dset):
     return {i: audiodata["utts"][i]}
 
 
-def product_helper(args):
-    return processing(*args)
+def product_helper(i, shared):
+    return processing(i, shared["audiodata"], shared["mfccdata"], *shared["args"])
 
 
 def avpretraindump(
@@ -67,7 +66,6 @@ def avpretraindump(
         ifmulticore = False
 
     snrdir = os.path.join(snrdir, dset)
-    output = {"utts": {}}
     for root, dirs, files in os.walk(os.path.join(dumpaudiofile, dset)):
         for file in files:
             if ".json" in file:
@@ -81,31 +79,21 @@ def avpretraindump(
                 mfccdumpfile = os.path.join(root, file)
     with open(mfccdumpfile, encoding="UTF-8") as mfccjson_file:
         mfccdata = json.load(mfccjson_file)
-    results = []
-    if ifmulticore is True:
-        keylist = list(audiodata["utts"].keys())
-        pool = mp.Pool()
-        job_args = [
-            (i, audiodata, mfccdata, videodir, snrdir, vrmdir, dset) for i in keylist
-        ]
-        results.extend(pool.map(product_helper, job_args))
-    else:
-        keylist = list(audiodata["utts"].keys())
-        for i in keylist:
-            results.append(
-                processing(i, audiodata, mfccdata, videodir, snrdir, vrmdir, dset)
-            )
-
-    for i in range(len(results)):
-        output["utts"].update(results[i])
+    shared = {
+        "audiodata": audiodata,
+        "mfccdata": mfccdata,
+        "args": (videodir, snrdir, vrmdir, dset),
+    }
+    keylist = list(audiodata["utts"].keys())
 
     savefilename = filename.replace(
         os.path.join(dumpaudiofile, dset), os.path.join(dumpfile, dset)
     )
     if not os.path.exists(savefilename.replace(jsonname, "")):
         os.makedirs(savefilename.replace(jsonname, ""))
-    with open(savefilename, "w", encoding="utf-8") as f:
-        json.dump(output, f, ensure_ascii=False, indent=4)
+    with UttsJsonWriter(savefilename) as writer:
+        for result in imap_utts(product_helper, keylist, shared, ifmulticore):
+            writer.update(result)
 
 
 # hand over parameter overview
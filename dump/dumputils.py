@@ -0,0 +1,109 @@
+import json
+import multiprocessing as mp
+import os
+
+# number of utterances sent to a worker at once
+CHUNKSIZE = 64
+
+# read-only data of the running imap_utts, inherited by the forked workers
+_shared = None
+
+
+def _call(args):
+    func, key = args
+    return func(key, _shared)
+
+
+def imap_utts(func, keys, shared, ifmulticore, chunksize=CHUNKSIZE):
+    """Apply func(key, shared) to all utterances
+
+    The workers are forked after `shared`, e.g. the loaded dump files, is set,
+    so they read it from their copy of the parent's memory and only the
+    utterance ids and the results are pickled. The results are yielded as soon
+    as a chunk is done, in no particular order if `ifmulticore` is true.
+
+    :param function func: function of the utterance id and `shared`, defined
+        at module level
+    :param list keys: utterance ids
+    :param shared: data which is only read by func
+    :param bool ifmulticore: If multi cpu processing should be used
+    :param int chunksize: number of utterances sent to a worker at once
+    """
+    global _shared
+    if not ifmulticore:
+        for key in keys:
+            yield func(key, shared)
+        return
+    _shared = shared
+    try:
+        with mp.get_context("fork").Pool() as pool:
+            for result in pool.imap_unordered(
+                _call, ((func, key) for key in keys), chunksize=chunksize
+            ):
+                yield result
+    finally:
+        _shared = None
+
+
+def find_data_json(dumpdir):
+    """Find the data json of a dump directory
+
+    The offset indexes ``name.bin.json`` of avpackdump.py are skipped. The
+    directory must hold exactly one other json file.
+
+    :param str dumpdir: directory of the dump, searched recursively
+    :return: path of the data json
+    :rtype: str
+    """
+    candidates = []
+    for root, dirs, files in os.walk(dumpdir):
+        for file in files:
+            if file.endswith(".json") and not file.endswith(".bin.json"):
+                candidates.append(os.path.join(root, file))
+    if len(candidates) != 1:
+        raise ValueError(
+            "Expected one data json in {}, found {}: {}".format(
+                dumpdir, len(candidates), sorted(candidates)
+            )
+        )
+    return candidates[0]
+
+
+class UttsJsonWriter(object):
+    """Write a dump file utterance by utterance
+
+    The file is the same as json.dump({"utts": utts}, f, ensure_ascii=False,
+    indent=4), without holding all utterances in memory.
+
+    :param str filename: path of the dump file
+    """
+
+    def __init__(self, filename):
+        self.file = open(filename, "w", encoding="utf-8")
+        self.file.write('{\n    "utts": {')
+        self.count = 0
+
+    def __setitem__(self, key, value):
+        entry = json.dumps(value, ensure_ascii=False, indent=4)
+        self.file.write(
+            (",\n" if self.count > 0 else "\n")
+            + " " * 8
+            + json.dumps(key, ensure_ascii=False)
+            + ": "
+            + entry.replace("\n", "\n" + " " * 8)
+        )
+        self.count += 1
+
+    def update(self, utts):
+        for key, value in utts.items():
+            self[key] = value
+
+    def close(self):
+        self.file.write("\n    }\n}" if self.count > 0 else "}\n}")
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
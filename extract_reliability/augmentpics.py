@@ -0,0 +1,102 @@
+import multiprocessing as mp
+import os
+import shutil
+import sys
+import torch
+
+from espnet.finetuneav.shapeindex import append_shape
+from jobqueue import JobManifest
+from jobqueue import valid_pt
+from videoaug import degrade
+from videoaug import utterance_rng
+
+
+def augmentpics(filename, srcdir, savedir, noisetype, seed):
+    """Degrade the mouth regions of an utterance and save them.
+
+    The Conf and AUs of the clean video are copied, as OpenFace is not run on
+    the degraded frames.
+
+    Args:
+        filename (str): The .pt file of the utterance
+        srcdir (str): Dir with the Conf, AUs and Pics of the clean video data
+        savedir (str): Save the Conf, AUs and Pics of the degraded video data
+        noisetype (str): blur or saltandpepper
+        seed (int): The seed of the noise condition
+
+    """
+    try:
+        for rmtype in ["Conf", "AUs"]:
+            shutil.copyfile(
+                os.path.join(srcdir, rmtype, filename),
+                os.path.join(savedir, rmtype, filename),
+            )
+        pics = torch.load(os.path.join(srcdir, "Pics", filename))
+        pics = degrade(
+            pics, noisetype, utterance_rng(filename.split(".")[0], seed), ifroi=True
+        )
+        Picdir = os.path.join(savedir, "Pics", filename)
+        torch.save(pics, Picdir)
+        append_shape(Picdir, pics.shape)
+    except Exception as e:
+        print(e)
+        print("Pass " + filename)
+
+
+def product_helper(args):
+    return augmentpics(*args)
+
+
+def main(srcdir, savedir, noisetype, nj, seed=0, jobdir=None):
+    """Degrade the mouth regions of a dataset part, in parallel.
+
+    The noise is applied to the frames cropped by segvideo, uint8 or
+    normalized, so the videos are not decoded, encoded and cropped again.
+
+    Args:
+        srcdir (str): Dir with the Conf, AUs and Pics of the clean video data,
+                      like LRS2Test
+        savedir (str): Save dir of the degraded video data, like LRS2Test_blur
+        noisetype (str): blur or saltandpepper
+        nj: Number of processes
+        seed: The seed of the noise condition
+        jobdir: Shared job directory. If it is given, the files are claimed
+                in shards, so that many hosts can run at once, and files with
+                valid outputs are skipped.
+
+    """
+    seed = int(seed)
+    for rmtype in ["Conf", "AUs", "Pics"]:
+        os.makedirs(os.path.join(savedir, rmtype), exist_ok=True)
+
+    filelist = [
+        name
+        for name in os.listdir(os.path.join(srcdir, "Pics"))
+        if name.endswith(".pt")
+    ]
+    if jobdir:
+        shards = JobManifest(
+            jobdir,
+            filelist,
+            lambda i: valid_pt(os.path.join(savedir, "Pics", i)),
+        )
+    else:
+        shards = [filelist]
+
+    with mp.Pool(int(nj)) as pool:
+        for filelist in shards:
+            job_args = [(i, srcdir, savedir, noisetype, seed) for i in filelist]
+            pool.map(product_helper, job_args, chunksize=16)
+
+
+# hand over parameter overview
+# sys.argv[1] = srcdir (str): Dir with the Conf, AUs and Pics of the clean data
+# sys.argv[2] = savedir (str): Save dir of the degraded video data
+# sys.argv[3] = noisetype (str): Video noise type blur or saltandpepper
+# sys.argv[4] = nj (int): Number of processes
+# optional
+# sys.argv[5] = seed (int): The seed of the noise condition, default is 0
+# sys.argv[6] = jobdir: Shared job directory to run on many hosts at once.
+
+if __name__ == "__main__":
+    main(*sys.argv[1:7])
@@ -0,0 +1,16 @@
+#! /usr/bin/env bash 
+
+# Copyright 2020 Ruhr-University (Wentao Yu)
+
+# hand over parameters 
+savedir=$1		# Dir of the segmented video data (Conf, AUs and Pics)
+dset=$2			# dataset part (Train, Test, Val)
+noisetype=$3		# video noise type blur or saltandpepper
+nj=${4:-8}		# number of processes, default is 8
+seed=${5:-0}		# seed of the noise condition, default is 0
+jobdir=${6:-}		# shared job directory to run on many hosts at once, optional
+
+# degrade the mouth regions of the clean LRS2 video data
+python3 -u local/extract_reliability/augmentpics.py $savedir/LRS2${dset} $savedir/LRS2${dset}_$noisetype $noisetype $nj $seed $jobdir || exit 1;
+
+exit 0
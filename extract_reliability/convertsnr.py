@@ -5,6 +5,9 @@ from scipy.io import loadmat
 import sys
 import torch
 
+from jobqueue import JobManifest
+from jobqueue import valid_pt
+
 
 def meansnr(filename, savedir, srcdir):
     try:
@@ -27,25 +30,40 @@ def product_helper(args):
     return meansnr(*args)
 
 
-def main(srcdir, savedir, ifmulticore):
+def main(srcdir, savedir, ifmulticore, jobdir=None):
     if ifmulticore == "true":
         ifmulticore = True
     else:
         ifmulticore = False
 
     filelist = os.listdir(srcdir)
+    if jobdir:
+        shards = JobManifest(
+            jobdir,
+            filelist,
+            lambda i: valid_pt(os.path.join(savedir, i.split(".")[0] + ".pt")),
+        )
+    else:
+        shards = [filelist]
 
     if ifmulticore is True:
         pool = mp.Pool()
-        job_args = [(i, savedir, srcdir) for i in filelist]
-        pool.map(product_helper, job_args)
-    else:
-        for i in filelist:
-            meansnr(i, savedir, srcdir)
+    for filelist in shards:
+        if ifmulticore is True:
+            job_args = [(i, savedir, srcdir) for i in filelist]
+            pool.map(product_helper, job_args)
+        else:
+            for i in filelist:
+                meansnr(i, savedir, srcdir)
 
 
 # hand over parameter overview
 # sys.argv[1] = sourcedir (str): The SNR datadir created by DeepXI
 # sys.argv[2] = savedir (str): Save directory of the converted SNR (.pt files)
 # sys.argv[7] = ifmulticore: If use multi processes.
-main(sys.argv[1], sys.argv[2], sys.argv[3])
+# optional
+# sys.argv[4] = jobdir: Shared job directory to run on many hosts at once.
+if len(sys.argv) > 4:
+    main(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4])
+else:
+    main(sys.argv[1], sys.argv[2], sys.argv[3])
@@ -9,10 +9,15 @@ pretrainedmodeldir=$3		# Path to pretrained video model
 dset=$4				# dataset part (Train, Test, Val, pretrain)
 ifcuda=$5			# if use cuda
 ifdebug=${6:-true}  	        # if debug mode should be used, default is true
+batchsize=${7:-1}		# number of clips of similar length per batch, default is 1
+nworkers=${8:-15}		# number of processes loading the clips, default is 15
+nthreads=${9:-0}		# number of torch threads of the model, default is 0 (torch default)
+jobdir=${10:-}			# shared job directory to run on many hosts at once, optional
+ifeval=${11:-false}		# if the model is put in eval mode, needed for batchsize > 1, default is false
 
 mkdir -p $savedir
 
 # running extractvfeatures script
-python3 -u local/extract_reliability/extractvfeatures.py $sdir $savedir $pretrainedmodeldir $dset $ifcuda $ifdebug  || exit 1;
+python3 -u local/extract_reliability/extractvfeatures.py $sdir $savedir $pretrainedmodeldir $dset $ifcuda $ifdebug $batchsize $nworkers $nthreads "$jobdir" $ifeval || exit 1;
 
 exit 0
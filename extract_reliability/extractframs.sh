@@ -18,6 +18,8 @@ if [ $# -gt 8 ];then
 else
   noisetype=None
 fi
+ifuint8=${10:-false}	# if the frames are stored as uint8, default is false
+jobdir=${11:-}		# shared job directory to run on many hosts at once, optional
 
 # general configuration
 if [[ "$corpus" == "LRS2" ]] ; then
@@ -59,6 +61,6 @@ elif [[ "$corpus" == "LRS3" ]] ; then
 fi
 
 # run python script for frame extraction
-python3 -u local/extract_reliability/segvideo.py $sourcedir $savedset $csvsavedir $audiodir/$dset $dset $corpus $ifsegment $ifmulticore
+python3 -u local/extract_reliability/segvideo.py $sourcedir $savedset $csvsavedir $audiodir/$dset $dset $corpus $ifsegment $ifmulticore $ifuint8 $jobdir
 
 exit 0
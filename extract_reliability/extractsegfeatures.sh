@@ -0,0 +1,41 @@
+#! /usr/bin/env bash 
+
+# hand over parameters 
+sdir=$1			# path to dataset
+savedir=$2		# Save the Conf and AUs of the video data for every dataset
+csvdir=$3		# The dir of csv File, which contain Face recognition information
+audiodir=$4		# The dir which saves the audio Info
+featdir=$5		# savedirectory for features for every dataset
+pretrainedmodeldir=$6	# Path to pretrained video model
+dset=$7			# dataset part (Train, Test, Val, pretrain)
+corpus=$8		# LRS2 or LRS3 corpus
+ifsegment=$9		# if do segmentation for pretrain set
+ifcuda=${10}		# if use cuda
+ifdebug=${11:-true}	# if debug mode should be used, default is true
+batchsize=${12:-1}	# number of clips of similar length per batch, default is 1
+nworkers=${13:-15}	# number of processes decoding the videos, default is 15
+nthreads=${14:-0}	# number of torch threads of the model, default is 0 (torch default)
+jobdir=${15:-}		# shared job directory to run on many hosts at once, optional
+ifeval=${16:-false}	# if the model is put in eval mode, needed for batchsize > 1, default is false
+
+# general configuration
+if [[ "$corpus" == "LRS2" ]] ; then
+    if [ "$dset" = "pretrain" ] ; then
+	sourcedir=$sdir/data/lrs2_v1/mvlrs_v1/pretrain
+    else
+	sourcedir=$sdir/data/lrs2_v1/mvlrs_v1/main
+    fi
+elif [[ "$corpus" == "LRS3" ]] ; then
+    sourcedir=$sdir/pretrain
+fi
+savedset=$savedir/${corpus}${dset}
+mkdir -p $savedset/Conf
+mkdir -p $savedset/AUs
+featsavedir=$featdir/${corpus}${dset}
+mkdir -p $featsavedir
+csvsavedir=$csvdir/${corpus}${dset}
+
+# run python script for the fused frame and feature extraction
+python3 -u local/extract_reliability/segvfeatures.py $sourcedir $savedset $csvsavedir $audiodir/$dset $featsavedir $pretrainedmodeldir $dset $corpus $ifsegment $ifcuda $ifdebug $batchsize $nworkers $nthreads "$jobdir" $ifeval || exit 1;
+
+exit 0
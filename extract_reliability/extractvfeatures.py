@@ -1,12 +1,19 @@
 import math
 import numpy as np
 import os
+import queue
 import random
 import sys
+import threading
 import torch
 import torch.nn as nn
 from torch.utils.data import Dataset
 
+from espnet.finetuneav.shapeindex import append_shape
+from espnet.finetuneav.shapeindex import get_shape
+from jobqueue import JobManifest
+from jobqueue import valid_pt
+
 
 class Compose(object):
     """Compose several preprocess together.
@@ -38,10 +45,13 @@ def get_preprocessing_pipelines():
     preprocessing = {}
     # -- LRW config
     crop_size = (88, 88)
-    preprocessing["pretrain"] = Compose([RandomCrop(crop_size), HorizontalFlip(0.5)])
+    (mean, std) = (0.4161, 0.1688)
+    preprocessing["pretrain"] = Compose(
+        [Normalize(mean, std), RandomCrop(crop_size), HorizontalFlip(0.5)]
+    )
     preprocessing["Train"] = preprocessing["pretrain"]
 
-    preprocessing["Test"] = Compose([CenterCrop(crop_size)])
+    preprocessing["Test"] = Compose([Normalize(mean, std), CenterCrop(crop_size)])
 
     preprocessing["Val"] = preprocessing["Test"]
 
@@ -273,6 +283,31 @@ class Lipreading(nn.Module):
                 m.bias.data.zero_()
 
 
+class Normalize(object):
+    def __init__(self, mean, std):
+        self.mean = mean
+        self.std = std
+
+    def __call__(self, frames):
+        """Normalize frames stored as uint8 gray values
+
+        Args:
+            frames (numpy.ndarray): Images to be normalized.
+        Returns:
+            numpy.ndarray: Normalized image, frames which are already
+                           normalized are returned unchanged.
+
+        """
+        if frames.dtype != np.uint8:
+            return frames
+        return (frames / 255.0 - self.mean) / self.std
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(mean={0}, std={1})".format(
+            self.mean, self.std
+        )
+
+
 class CenterCrop(object):
     def __init__(self, size):
         self.size = size
@@ -338,9 +373,137 @@ class HorizontalFlip(object):
         return frames
 
 
-def main(filedir, savedir, pretrainedmodel, dset, ifcuda, debug=False):
-    NWORK = 15
-    filelist = os.listdir(filedir)
+def length_buckets(filedir, filelist, batchsize):
+    """Group the clips into batches of similar length
+
+    Args:
+        filedir (str): source directory of video frame pictures
+        filelist (list): file names of the clips
+        batchsize (int): number of clips per batch
+    Returns:
+        list: indices of the clips of each batch
+
+    """
+    if batchsize == 1:
+        return [[i] for i in range(len(filelist))]
+    lengths = [get_shape(os.path.join(filedir, name))[0] for name in filelist]
+    order = np.argsort(lengths, kind="stable").tolist()
+    return [order[i : i + batchsize] for i in range(0, len(order), batchsize)]
+
+
+def init_worker(worker_id):
+    # the loading workers only crop, one thread each avoids oversubscription
+    torch.set_num_threads(1)
+
+
+class FeatureWriter(object):
+    """Save the features in a background thread
+
+    Args:
+        debug (bool): if the saved files should be printed
+        maxsize (int): maximum number of features waiting to be saved
+
+    """
+
+    def __init__(self, debug=False, maxsize=64):
+        self.debug = debug
+        self.queue = queue.Queue(maxsize)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            filepath, data = item
+            try:
+                torch.save(data, filepath, _use_new_zipfile_serialization=False)
+                append_shape(filepath, data.shape)
+                if self.debug is True:
+                    print("Makefeatures for " + os.path.basename(filepath))
+            except Exception as e:
+                print(e)
+            self.queue.task_done()
+
+    def put(self, filepath, data):
+        self.queue.put((filepath, data))
+
+    def flush(self):
+        """Wait until all features are saved"""
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+def load_model(pretrainedmodel, device, ifeval=False):
+    """Load the pretrained lipreading frontend
+
+    The model stays in train mode by default, so the batch norm layers use
+    the statistics of every clip, as in the original extraction. In eval mode
+    the running statistics of the pretrained model are used instead, which
+    changes the features. The mode does not depend on the batch size.
+
+    Args:
+        pretrainedmodel (str): Path to pretrained video model
+        device (torch.device): device of the model
+        ifeval (bool): If the model is put in eval mode
+    Returns:
+        Lipreading: the model on the device
+
+    """
+    model = Lipreading("temporalConv", inputDim=256, hiddenDim=512)
+    self_state = model.state_dict()
+    loaded_state = torch.load(pretrainedmodel, map_location="cpu")
+    loaded_state = {k: v for k, v in loaded_state.items() if k in self_state}
+    self_state.update(loaded_state)
+    model.load_state_dict(self_state)
+    model = model.to(device)
+    if ifeval is True:
+        model.eval()
+    return model
+
+
+def check_batchsize(batchsize, ifeval):
+    """Refuse batches of several clips in train mode
+
+    In train mode the batch norm statistics would mix the clips of a batch and
+    their padding, so the features would depend on the batch size.
+
+    Args:
+        batchsize (int): number of clips per batch
+        ifeval (bool): If the model is put in eval mode
+
+    """
+    if batchsize > 1 and ifeval is not True:
+        raise ValueError(
+            "batchsize {} needs ifeval true, the batch norm statistics "
+            "of train mode would mix the clips of a batch".format(batchsize)
+        )
+
+
+def main(
+    filedir,
+    savedir,
+    pretrainedmodel,
+    dset,
+    ifcuda,
+    debug=False,
+    batchsize=1,
+    nworkers=15,
+    nthreads=0,
+    jobdir=None,
+    ifeval="false",
+):
+    batchsize = int(batchsize)
+    nworkers = int(nworkers)
+    nthreads = int(nthreads)
+    ifeval = ifeval == "true"
+    check_batchsize(batchsize, ifeval)
+    filelist = [name for name in os.listdir(filedir) if name.endswith(".pt")]
     if ifcuda == "true":
         device = torch.device("cuda:0")
     else:
@@ -349,46 +512,47 @@ def main(filedir, savedir, pretrainedmodel, dset, ifcuda, debug=False):
         debug = True
     else:
         debug = False
+    if nthreads > 0:
+        torch.set_num_threads(nthreads)
 
-    model = Lipreading("temporalConv", inputDim=256, hiddenDim=512)
-    self_state = model.state_dict()
-    if ifcuda is True:
-        loaded_state = torch.load(pretrainedmodel)
-    else:
-        loaded_state = torch.load(pretrainedmodel, map_location="cpu")
-    loaded_state = {k: v for k, v in loaded_state.items() if k in self_state}
-    self_state.update(loaded_state)
-    model.load_state_dict(self_state)
-    model = model.to(device)
+    model = load_model(pretrainedmodel, device, ifeval)
 
     preprocessing = get_preprocessing_pipelines()
-    dataset = LoadInput(filedir, filelist, preprocessing_func=preprocessing[dset])
-    data_loader = torch.utils.data.DataLoader(
-        dataset,
-        batch_size=1,
-        shuffle=False,
-        collate_fn=pad_packed_collate,
-        num_workers=NWORK,
-    )
-    for count, batch in enumerate(data_loader, 0):
-        data = batch[0].to(device)
-        datalength = list(batch[1])
-        name = list(batch[2])
-
-        try:
-            with torch.no_grad():
-                features = model(data)
-            for i in range(len(datalength)):
-                savedata = features[i, : datalength[i], :]
-                torch.save(
-                    savedata,
-                    savedir + "/" + name[i],
-                    _use_new_zipfile_serialization=False,
-                )
-                if debug is True:
-                    print("Makefeatures for " + name[i])
-        except Exception as e:
-            print(e)
+    if jobdir:
+        shards = JobManifest(
+            jobdir, filelist, lambda name: valid_pt(os.path.join(savedir, name))
+        )
+    else:
+        shards = [filelist]
+    writer = FeatureWriter(debug)
+    for filelist in shards:
+        if len(filelist) == 0:
+            continue
+        dataset = LoadInput(filedir, filelist, preprocessing_func=preprocessing[dset])
+        data_loader = torch.utils.data.DataLoader(
+            dataset,
+            batch_sampler=length_buckets(filedir, filelist, batchsize),
+            collate_fn=pad_packed_collate,
+            num_workers=nworkers,
+            worker_init_fn=init_worker,
+        )
+        for count, batch in enumerate(data_loader, 0):
+            data = batch[0].to(device)
+            datalength = list(batch[1])
+            name = list(batch[2])
+
+            try:
+                with torch.inference_mode():
+                    features = model(data)
+                    for i in range(len(datalength)):
+                        # clone, else the features of the whole batch are saved
+                        savedata = features[i, : datalength[i], :].clone()
+                        writer.put(savedir + "/" + name[i], savedata)
+            except Exception as e:
+                print(e)
+        # the shard is finished when all its features are saved
+        writer.flush()
+    writer.close()
 
 
 # hand over parameter overview
@@ -399,9 +563,17 @@ def main(filedir, savedir, pretrainedmodel, dset, ifcuda, debug=False):
 # sys.argv[5] = ifcuda, if use cuda
 # optional
 # sys.argv[6] = debug, if debug should be used
-
-
-if len(sys.argv) > 6:
-    main(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5], sys.argv[6])
-else:
-    main(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5])
+# sys.argv[7] = batchsize, number of clips of similar length per batch
+# sys.argv[8] = nworkers, number of processes loading the clips
+# sys.argv[9] = nthreads, number of torch threads of the model, 0 for the default
+# sys.argv[10] = jobdir, shared job directory to run on many hosts at once,
+#                may be empty
+# sys.argv[11] = ifeval, if the model is put in eval mode, needed for
+#                batchsize > 1, default is false
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 6:
+        main(*sys.argv[1:12])
+    else:
+        main(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5])
@@ -0,0 +1,228 @@
+import os
+import socket
+import threading
+import time
+import torch
+
+from espnet.finetuneav.shapeindex import load_shape_index
+
+# list of all jobs in the job directory
+MANIFEST = "manifest.txt"
+# number of jobs claimed at once
+SHARDSIZE = 500
+# a lock which was not touched for this many seconds belongs to a dead process
+LOCK_TIMEOUT = 600
+
+
+def valid_pt(filepath):
+    """Check if a .pt file was completely written
+
+    A file in the shape index of its directory is complete, as the index line
+    is appended after the file is saved. Other files are loaded.
+
+    Args:
+        filepath (str): path of the .pt file
+
+    """
+    if not os.path.exists(filepath):
+        return False
+    directory, filename = os.path.split(filepath)
+    if filename in load_shape_index(directory):
+        return True
+    try:
+        torch.load(filepath, map_location="cpu")
+    except Exception:
+        return False
+    return True
+
+
+class JobManifest(object):
+    """Claim shards of a list of jobs, shared by many processes and hosts
+
+    The first process writes the job list into the manifest of the job
+    directory, all processes then work on the jobs of the manifest. A shard is
+    claimed by creating its lock file, which is touched while the shard is
+    processed, and marked by a done file when it is finished. Shards of a
+    process which died are claimed again after LOCK_TIMEOUT. The job
+    directory must be on a filesystem shared by all hosts.
+
+    Iterating over the manifest yields the jobs of each claimed shard which are
+    not done yet. The shard is finished when the next shard is requested, if
+    all its jobs are done then. Otherwise it is released, so that its failed
+    jobs are run again by the next process which claims it.
+
+    Args:
+        jobdir (str): job directory
+        keys (list): names of all jobs, without whitespace
+        isdone (function): if the outputs of a job exist and are valid
+        shardsize (int): number of jobs claimed at once
+        timeout (int): seconds after which the lock of a shard is stale
+
+    """
+
+    def __init__(
+        self, jobdir, keys, isdone=None, shardsize=SHARDSIZE, timeout=LOCK_TIMEOUT
+    ):
+        self.jobdir = jobdir
+        self.isdone = isdone
+        self.shardsize = shardsize
+        self.timeout = timeout
+        self.owner = "{}:{}".format(socket.gethostname(), os.getpid())
+        os.makedirs(jobdir, exist_ok=True)
+        self.keys = self._load_manifest(sorted(keys))
+        self.nshards = (len(self.keys) + shardsize - 1) // shardsize
+
+    def _load_manifest(self, keys):
+        manifest = os.path.join(self.jobdir, MANIFEST)
+        if not os.path.exists(manifest):
+            tmpfile = manifest + "." + self.owner
+            with open(tmpfile, "w") as f:
+                f.write("".join(key + "\n" for key in keys))
+            try:
+                # fails if another process wrote the manifest first
+                os.link(tmpfile, manifest)
+            except FileExistsError:
+                pass
+            os.remove(tmpfile)
+        with open(manifest) as f:
+            manifestkeys = [line.rstrip("\n") for line in f]
+        missing = len(set(keys) - set(manifestkeys))
+        if missing > 0:
+            print("{} jobs are not in the manifest {}".format(missing, manifest))
+        return manifestkeys
+
+    def _path(self, index, suffix):
+        return os.path.join(self.jobdir, "shard{:06d}{}".format(index, suffix))
+
+    def _claim(self, index):
+        lockfile = self._path(index, ".lock")
+        try:
+            fd = os.open(lockfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not self._remove_stale(lockfile):
+                return False
+            try:
+                # as for a fresh claim, only one process creates the new lock
+                fd = os.open(lockfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                return False
+        with os.fdopen(fd, "w") as f:
+            f.write(self.owner)
+        if os.path.exists(self._path(index, ".done")):
+            # the shard was finished while the lock was taken over
+            os.remove(lockfile)
+            return False
+        return True
+
+    def _remove_stale(self, lockfile):
+        """Remove the lock of a dead process, True if the lock is free now"""
+        try:
+            age = time.time() - os.path.getmtime(lockfile)
+        except FileNotFoundError:
+            return True
+        if age < self.timeout:
+            return False
+        stalefile = lockfile + ".stale." + self.owner
+        try:
+            # atomic, only one of the processes taking over the lock renames it
+            os.rename(lockfile, stalefile)
+        except FileNotFoundError:
+            return False
+        if time.time() - os.path.getmtime(stalefile) < self.timeout:
+            # the lock was claimed again since it was checked, put it back
+            try:
+                os.link(stalefile, lockfile)
+            except FileExistsError:
+                pass
+            os.remove(stalefile)
+            return False
+        os.remove(stalefile)
+        return True
+
+    def _heartbeat(self, lockfile, stop):
+        while not stop.wait(self.timeout / 4):
+            try:
+                os.utime(lockfile)
+            except FileNotFoundError:
+                # the lock is moved away for a moment by a process checking if
+                # it is stale, it is created again, the process then keeps it
+                try:
+                    fd = os.open(lockfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                except FileExistsError:
+                    continue
+                with os.fdopen(fd, "w") as f:
+                    f.write(self.owner)
+
+    def _release(self, index):
+        try:
+            os.remove(self._path(index, ".lock"))
+        except FileNotFoundError:
+            # moved away for a moment by a process checking if it is stale
+            pass
+
+    def _finish(self, index):
+        open(self._path(index, ".done"), "w").close()
+        self._release(index)
+
+    def ndone(self):
+        """Number of finished shards, by all processes"""
+        return sum(name.endswith(".done") for name in os.listdir(self.jobdir))
+
+    def __iter__(self):
+        start = time.time()
+        njobs = 0
+        nskipped = 0
+        for index in range(self.nshards):
+            if os.path.exists(self._path(index, ".done")) or not self._claim(index):
+                continue
+            stop = threading.Event()
+            heartbeat = threading.Thread(
+                target=self._heartbeat,
+                args=(self._path(index, ".lock"), stop),
+                daemon=True,
+            )
+            heartbeat.start()
+            keys = self.keys[index * self.shardsize : (index + 1) * self.shardsize]
+            try:
+                if self.isdone is not None:
+                    todo = [key for key in keys if not self.isdone(key)]
+                else:
+                    todo = keys
+                yield todo
+            except BaseException:
+                # release the shard at once, if its processing failed
+                self._release(index)
+                raise
+            finally:
+                stop.set()
+                heartbeat.join()
+            if self.isdone is not None:
+                # the jobs catch their errors, so their outputs are checked,
+                # with the shape index lines appended while the shard was run
+                load_shape_index.cache_clear()
+                failed = [key for key in todo if not self.isdone(key)]
+            else:
+                failed = []
+            njobs += len(todo) - len(failed)
+            nskipped += len(keys) - len(todo)
+            if len(failed) > 0:
+                # release the shard, so that the failed jobs are run again
+                self._release(index)
+                print(
+                    "shard {} not done, {} jobs failed, e.g. {}".format(
+                        index, len(failed), failed[0]
+                    )
+                )
+                continue
+            self._finish(index)
+            print(
+                "shard {} done, {} jobs and {} skipped ({:.2f} jobs/s), "
+                "{}/{} shards done".format(
+                    index,
+                    njobs,
+                    nskipped,
+                    njobs / (time.time() - start),
+                    self.ndone(),
+                    self.nshards,
+                )
+            )
@@ -0,0 +1,273 @@
+import collections
+import cv2
+import multiprocessing as mp
+import os
+import sys
+import torch
+
+from extractvfeatures import FeatureWriter
+from extractvfeatures import check_batchsize
+from extractvfeatures import get_preprocessing_pipelines
+from extractvfeatures import load_model
+from extractvfeatures import pad_packed_collate
+from jobqueue import JobManifest
+from jobqueue import valid_pt
+from segvideo import extract_opencv
+from segvideo import extract_pretrain_opencv
+from segvideo import list_jobs
+from segvideo import segment_csvname
+from segvideo import segment_name
+from segvideo import video_name
+
+# number of batches of clips which are sorted by length before batching
+BUCKET_BATCHES = 8
+# number of videos per producer which are decoded ahead of the model
+JOBS_PER_WORKER = 4
+
+
+def init_producer():
+    # each producer decodes one video at a time with one thread
+    cv2.setNumThreads(1)
+    torch.set_num_threads(1)
+
+
+def produce(job):
+    """Decode a video and crop the mouth regions of its utterances.
+
+    Args:
+        job (tuple): ("segments", segdict, csvdir, corpus) for pretrain segments
+                     or ("video", sourcedir, filelist, csvdir, dset)
+
+    Returns:
+        dict: conf, AU and uint8 frames of each utterance
+
+    """
+    try:
+        if job[0] == "segments":
+            _, segdict, csvdir, corpus = job
+            mp4filedir = list(segdict.keys())[0]
+            return extract_pretrain_opencv(
+                mp4filedir,
+                segment_csvname(mp4filedir, csvdir),
+                segdict[mp4filedir],
+                corpus,
+                ifuint8=True,
+            )
+        _, sourcedir, filelist, csvdir, dset = job
+        conf, AUs, pics = extract_opencv(
+            sourcedir + "/" + filelist + ".mp4",
+            os.path.join(csvdir, filelist + ".csv"),
+            ifuint8=True,
+        )
+        return {video_name(filelist, dset): {"conf": conf, "AU": AUs, "frames": pics}}
+    except Exception as e:
+        print(e)
+        return {}
+
+
+def bounded_imap(pool, func, jobs, inflight):
+    """Map func over jobs in the pool, with a bounded number of jobs in flight.
+
+    The producers decode faster than the model embeds the clips, so without a
+    bound the frames of all videos would pile up in the main process.
+
+    Args:
+        pool (multiprocessing.Pool): pool of the producers
+        func (callable): function applied to each job
+        jobs (iterable): jobs of the shard
+        inflight (int): maximum number of jobs submitted but not yet returned
+
+    Yields:
+        the results of the jobs, in the order of the jobs
+
+    """
+    pending = collections.deque()
+    for job in jobs:
+        if len(pending) >= inflight:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(func, (job,)))
+    while pending:
+        yield pending.popleft().get()
+
+
+def embed(model, device, preprocessing, clips, featdir, writer, batchsize):
+    """Run the lipreading frontend on clips in batches of similar length.
+
+    Args:
+        model (Lipreading): The lipreading frontend
+        device (torch.device): device of the model
+        preprocessing (Compose): normalization and crop of the frames
+        clips (list): names and uint8 frames of the clips
+        featdir (str): savedirectory for features
+        writer (FeatureWriter): writer of the features
+        batchsize (int): number of clips per batch
+
+    """
+    clips = sorted(clips, key=lambda clip: len(clip[1]))
+    for start in range(0, len(clips), batchsize):
+        batch = [
+            (preprocessing(frames), name)
+            for name, frames in clips[start : start + batchsize]
+        ]
+        data, lengths, names = pad_packed_collate(batch)
+        try:
+            with torch.inference_mode():
+                features = model(data.to(device))
+                for i in range(len(lengths)):
+                    # clone, else the features of the whole batch are saved
+                    savedata = features[i, : lengths[i], :].clone()
+                    writer.put(os.path.join(featdir, names[i] + ".pt"), savedata)
+        except Exception as e:
+            print(e)
+
+
+def main(
+    sourcedir,
+    savedir,
+    csvdir,
+    audiorefdir,
+    featdir,
+    pretrainedmodel,
+    dset,
+    corpus,
+    ifsegment,
+    ifcuda,
+    debug="false",
+    batchsize=1,
+    nworkers=15,
+    nthreads=0,
+    jobdir=None,
+    ifeval="false",
+):
+    """Extract the video reliability measures and features in one pass.
+
+    The mouth regions are cropped by the producer processes as the videos are
+    decoded and fed to the lipreading frontend in batches. Only Conf, AUs and
+    the features are saved, the frames are not written to disk.
+
+    Args:
+        sourcedir (str): The dataset dir.
+        savedir (str): Save the Conf and AUs of the video data.
+        csvdir (str): The dir of csv File, which contain Face recognition information
+        audiorefdir (str): The dir which saves the audio Info
+        featdir (str): savedirectory for features
+        pretrainedmodel (str): Path to pretrained video model
+        dset (str): Which set. There are pretrain, Train, Val, Test set.
+        corpus (str): Corpus name, LRS2 or LRS3
+        ifsegment: If segmentation for pretrain set is used
+        ifcuda: If use cuda
+        debug: If debug should be used
+        batchsize: number of clips of similar length per batch
+        nworkers: number of processes decoding the videos
+        nthreads: number of torch threads of the model, 0 for the default
+        jobdir: Shared job directory. If it is given, the videos are claimed
+                in shards, so that many hosts can run at once, and videos with
+                valid features are skipped.
+        ifeval: If the lipreading frontend is put in eval mode. It is needed
+                for a batchsize above 1, as the batch norm statistics of
+                train mode would mix the clips of a batch.
+
+    """
+    batchsize = int(batchsize)
+    nworkers = int(nworkers)
+    nthreads = int(nthreads)
+    ifeval = ifeval == "true"
+    check_batchsize(batchsize, ifeval)
+    ifsegment = ifsegment == "true"
+    debug = debug == "true"
+    if ifcuda == "true":
+        device = torch.device("cuda:0")
+    else:
+        device = torch.device("cpu")
+
+    segments, videos = list_jobs(audiorefdir, dset, corpus, ifsegment)
+    jobs = {}
+    for i in segments:
+        jobs[list(i.keys())[0]] = ("segments", i, csvdir, corpus)
+    for i in videos:
+        jobs[i] = ("video", sourcedir, i, csvdir, dset)
+
+    def isdone(key):
+        # the features are saved after Conf and AUs
+        job = jobs[key]
+        if job[0] == "segments":
+            names = [segment_name(i, corpus) for i in job[1][key]]
+        else:
+            names = [video_name(key, dset)]
+        return all(valid_pt(os.path.join(featdir, name + ".pt")) for name in names)
+
+    if jobdir:
+        shards = JobManifest(jobdir, list(jobs.keys()), isdone)
+    else:
+        shards = [list(jobs.keys())]
+    # fork the producers before the model is loaded
+    if nworkers > 0:
+        pool = mp.Pool(nworkers, initializer=init_producer)
+    else:
+        pool = None
+
+    if nthreads > 0:
+        torch.set_num_threads(nthreads)
+    model = load_model(pretrainedmodel, device, ifeval)
+    preprocessing = get_preprocessing_pipelines()[dset]
+    writer = FeatureWriter(debug)
+    for keys in shards:
+        if pool is not None:
+            produced = bounded_imap(
+                pool, produce, (jobs[i] for i in keys), JOBS_PER_WORKER * nworkers
+            )
+        else:
+            produced = map(produce, (jobs[i] for i in keys))
+        clips = []
+        for outputs in produced:
+            for name, output in outputs.items():
+                torch.save(
+                    output["conf"],
+                    os.path.join(savedir, "Conf", name + ".pt"),
+                    _use_new_zipfile_serialization=False,
+                )
+                torch.save(
+                    output["AU"],
+                    os.path.join(savedir, "AUs", name + ".pt"),
+                    _use_new_zipfile_serialization=False,
+                )
+                if len(output["frames"]) == 0:
+                    print("No frames for " + name)
+                    continue
+                clips.append((name, output["frames"]))
+            if len(clips) >= batchsize * BUCKET_BATCHES:
+                embed(model, device, preprocessing, clips, featdir, writer, batchsize)
+                clips = []
+        embed(model, device, preprocessing, clips, featdir, writer, batchsize)
+        # the shard is finished when all its features are saved
+        writer.flush()
+    if pool is not None:
+        pool.close()
+        pool.join()
+    writer.close()
+
+
+# hand over parameter overview
+# sys.argv[1] = sourcedir (str): The dataset dir
+# sys.argv[2] = savedir (str): Save the Conf and AUs of the video data.
+# sys.argv[3] = csvdir (str): The dir of csv File, which contain
+#                             Face recognition information
+# sys.argv[4] = audiorefdir (str): The dir which saves the audio Info
+# sys.argv[5] = featdir (str): savedirectory for features
+# sys.argv[6] = pretrainedmodel (str): Path to pretrained video model
+# sys.argv[7] = dset (str): Which set. There are pretrain, Train, Val, Test set.
+# sys.argv[8] = corpus (str): Corpus name, LRS2 or LRS3
+# sys.argv[9] = ifsegment: If segmentation for pretrain set is used
+# sys.argv[10] = ifcuda: If use cuda
+# optional
+# sys.argv[11] = debug, if debug should be used
+# sys.argv[12] = batchsize, number of clips of similar length per batch
+# sys.argv[13] = nworkers, number of processes decoding the videos
+# sys.argv[14] = nthreads, number of torch threads of the model, 0 for the default
+# sys.argv[15] = jobdir, shared job directory to run on many hosts at once,
+#                may be empty
+# sys.argv[16] = ifeval, if the model is put in eval mode, needed for
+#                batchsize > 1, default is false
+
+if __name__ == "__main__":
+    main(*sys.argv[1:17])
@@ -6,27 +6,38 @@ import pandas as pd
 import sys
 import torch
 
+from espnet.finetuneav.shapeindex import append_shape
+from jobqueue import JobManifest
+from jobqueue import valid_pt
+
+
+# side length of the mouth region of interest, before and after resizing
+ROI_SIZE = 70
+RESIZE = 96
+# side length of the face crops the landmarks refer to
+FACE_SIZE = 160
+# top left corner of the mouth region, if there is no box from the landmarks
+DEFAULT_ROI = (55, 45)
+# statistics used to normalize the gray values
+MEAN = 0.4161
+STD = 0.1688
+# number of frames resized at once, as channels of one image (at most 128)
+RESIZE_CHUNK = 128
 
-def extract_pretrain_opencv(mp4filedir, csvname, segmentslist, corpus):
-    """Using cv2 extract video frames.
+
+def read_openface_csv(csvname):
+    """Read the confidence, action units and lip landmarks of an OpenFace csv
 
     Args:
-        mp4filedir (str): The video file name.
         csvname (str): The csv file saved face recog info
-        segmentslist (list): The list saved segment info
-        corpus (str): With LRS2 or LRS3 corpus
+
+    Returns:
+        conf (np.ndarray): Face recognition confidence of each frame
+        AUdata (np.ndarray): AU12, AU15, AU17, AU23, AU25 and AU26 of each frame
+        x (np.ndarray): x coordinates of the lip landmarks 48 to 67
+        y (np.ndarray): y coordinates of the lip landmarks 48 to 67
 
     """
-    video = []
-    cap = cv2.VideoCapture(mp4filedir)
-    while cap.isOpened():
-        ret, frame = cap.read()  # BGR
-        if ret:
-            video.append(frame)
-        else:
-            break
-    cap.release()
-    video = np.array(video)
     CSV = pd.read_csv(csvname)
     head = CSV.axes[1].values
     for id in range(len(head)):
@@ -53,85 +64,211 @@ def extract_pretrain_opencv(mp4filedir, csvname, segmentslist, corpus):
         elif head[id] == "AU26_r":
             AU26id = id
     conf = CSV.values[:, confid]
-    AUs = []
-    for ids in [AU12id, AU15id, AU17id, AU23id, AU25id, AU26id]:
-        AU = np.expand_dims(CSV.values[:, ids], axis=1)
-        AUs.append(AU)
-
-    AUdata = np.concatenate((AUs), axis=1)
-
-    cropframe = []
+    AUdata = CSV.values[:, [AU12id, AU15id, AU17id, AU23id, AU25id, AU26id]]
     x = CSV.values[:, xstart:xend]
     y = CSV.values[:, ystart:yend]
-    for i in range(len(video)):
-        frame = video[i]
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        a = max(x[i, :])
-        b = max(y[i, :])
-        c = min(x[i, :])
-        d = min(y[i, :])
-
-        if a == c or c == d:
-            d = 55
-            b = 125
-            c = 45
-            a = 115
-
-        midx = int((d + b) / 2.0)
-        midy = int((a + c) / 2.0)
-        W = 70
-        H = 70
-        newd = midx - W / 2
-        newb = midx + W / 2
-        newc = midy - H / 2
-        newa = midy + H / 2
-        if newd < 0:
-            newd = 0
-            newb = 0 + W
-        elif newb > 160:
-            newb = 160
-            newd = 160 - W
-        elif newc < 0:
-            newc = 0
-            newa = 0 + H
-        elif newa > 160:
-            newa = 160
-            newc = 160 - H
-
-        outimage = gray[int(newd) : int(newb), int(newc) : int(newa)]
-        if list(outimage.shape) == [70, 70]:
-            cropframe.append(gray[int(newd) : int(newb), int(newc) : int(newa)])
-        else:
-            cropframe.append(gray[55:125, 45:115])
-
-    cropframe = np.array(cropframe)
-    cropframe = cropframe / 255.0
-    cropframe = [
-        cv2.resize(cropframe[i, :, :], (96, 96)) for i in range(len(cropframe))
-    ]
-    cropframe = np.array(cropframe)
-    mean = 0.4161
-    std = 0.1688
-    cropframe = (cropframe - mean) / std
-    output = {}
+    return conf, AUdata, x, y
+
+
+def _slice_bounds(start, stop, length):
+    """Bounds of the python slice [start:stop] of a sequence, for arrays of slices"""
+    start = np.clip(np.where(start < 0, start + length, start), 0, length)
+    stop = np.clip(np.where(stop < 0, stop + length, stop), 0, length)
+    return start, np.maximum(start, stop)
+
+
+def mouth_boxes(x, y, frameshape):
+    """Compute the mouth region of all frames from the lip landmarks
+
+    The region is a ROI_SIZE square centered on the landmarks and moved into
+    the face crop. If it does not fit into the frame, the default region is used.
+
+    Args:
+        x (np.ndarray): x coordinates of the lip landmarks (frames, 20)
+        y (np.ndarray): y coordinates of the lip landmarks (frames, 20)
+        frameshape (tuple): height and width of the video frames
+
+    Returns:
+        rows (np.ndarray): first row of the region in each frame
+        cols (np.ndarray): first column of the region in each frame
+
+    """
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    a = x.max(axis=1)
+    b = y.max(axis=1)
+    c = x.min(axis=1)
+    d = y.min(axis=1)
+    nobox = (a == c) | (c == d)
+    d = np.where(nobox, DEFAULT_ROI[0], d)
+    b = np.where(nobox, DEFAULT_ROI[0] + ROI_SIZE, b)
+    c = np.where(nobox, DEFAULT_ROI[1], c)
+    a = np.where(nobox, DEFAULT_ROI[1] + ROI_SIZE, a)
+
+    midx = ((d + b) / 2.0).astype(int)
+    midy = ((a + c) / 2.0).astype(int)
+    newd = midx - ROI_SIZE // 2
+    newb = midx + ROI_SIZE // 2
+    newc = midy - ROI_SIZE // 2
+    newa = midy + ROI_SIZE // 2
+    # only the first bound which is exceeded is corrected
+    top = newd < 0
+    bottom = ~top & (newb > FACE_SIZE)
+    left = ~top & ~bottom & (newc < 0)
+    right = ~top & ~bottom & ~left & (newa > FACE_SIZE)
+    newd = np.where(top, 0, np.where(bottom, FACE_SIZE - ROI_SIZE, newd))
+    newb = np.where(top, ROI_SIZE, np.where(bottom, FACE_SIZE, newb))
+    newc = np.where(left, 0, np.where(right, FACE_SIZE - ROI_SIZE, newc))
+    newa = np.where(left, ROI_SIZE, np.where(right, FACE_SIZE, newa))
+
+    rows, rowsend = _slice_bounds(newd, newb, frameshape[0])
+    cols, colsend = _slice_bounds(newc, newa, frameshape[1])
+    valid = (rowsend - rows == ROI_SIZE) & (colsend - cols == ROI_SIZE)
+    rows = np.where(valid, rows, DEFAULT_ROI[0])
+    cols = np.where(valid, cols, DEFAULT_ROI[1])
+    return rows, cols
+
+
+def iter_mouth_rois(filename, x, y, needed=None):
+    """Decode a video and crop the gray mouth region of each frame
+
+    The frames are processed as they are decoded, only the uint8 mouth regions
+    are kept by the caller. Frames which are not needed are skipped with
+    grab(), which still decodes them but without conversion or cropping, and
+    the video is closed after the last needed frame.
+
+    Args:
+        filename (str): The video file name.
+        x (np.ndarray): x coordinates of the lip landmarks (frames, 20)
+        y (np.ndarray): y coordinates of the lip landmarks (frames, 20)
+        needed (np.ndarray): If a frame is needed (boolean per frame),
+                             None if all frames are needed
+
+    Yields:
+        frame index (int) and mouth region (ROI_SIZE, ROI_SIZE) of the frame
+
+    """
+    cap = cv2.VideoCapture(filename)
+    rows = cols = None
+    i = 0
+    try:
+        while cap.isOpened():
+            if needed is not None and i >= len(needed):
+                break
+            if needed is not None and not needed[i]:
+                if not cap.grab():
+                    break
+                i += 1
+                continue
+            ret, frame = cap.read()  # BGR
+            if not ret:
+                break
+            if rows is None:
+                rows, cols = mouth_boxes(x, y, frame.shape[:2])
+            roi = frame[rows[i] : rows[i] + ROI_SIZE, cols[i] : cols[i] + ROI_SIZE]
+            yield i, cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+            i += 1
+    finally:
+        cap.release()
+
+
+def resize_rois(rois, ifuint8=False):
+    """Resize the mouth regions to RESIZE and normalize them
+
+    Args:
+        rois (np.ndarray): uint8 mouth regions (frames, ROI_SIZE, ROI_SIZE)
+        ifuint8 (bool): If the gray values are kept as uint8. They are then
+                        normalized when the frames are loaded for the model.
+
+    Returns:
+        np.ndarray: normalized float64 or uint8 mouth regions
+                    (frames, RESIZE, RESIZE)
+
+    """
+    out = np.empty((len(rois), RESIZE, RESIZE), dtype=np.uint8 if ifuint8 else None)
+    for start in range(0, len(rois), RESIZE_CHUNK):
+        # resize a chunk of frames at once as the channels of one image
+        chunk = rois[start : start + RESIZE_CHUNK].transpose(1, 2, 0)
+        chunk = np.ascontiguousarray(chunk if ifuint8 else chunk / 255.0)
+        resized = cv2.resize(chunk, (RESIZE, RESIZE)).reshape(RESIZE, RESIZE, -1)
+        out[start : start + RESIZE_CHUNK] = resized.transpose(2, 0, 1)
+    if ifuint8:
+        return out
+    return (out - MEAN) / STD
+
+
+def segment_name(segment, corpus):
+    """Get the utterance name of a pretrain segment.
+
+    Args:
+        segment (str): The segment info, name start and end
+        corpus (str): With LRS2 or LRS3 corpus
+
+    """
+    if corpus == "LRS2":
+        return segment.split(" ")[0].split("/")[-1].strip(".wav")
+    else:
+        return segment.split(" ")[0]
+
+
+def extract_pretrain_opencv(mp4filedir, csvname, segmentslist, corpus, ifuint8=False):
+    """Using cv2 extract video frames.
+
+    Only the frames of the segments are converted and cropped, the others are
+    skipped with grab(). No frame after the last segment is decoded.
+
+    Args:
+        mp4filedir (str): The video file name.
+        csvname (str): The csv file saved face recog info
+        segmentslist (list): The list saved segment info
+        corpus (str): With LRS2 or LRS3 corpus
+        ifuint8 (bool): If the frames are stored as uint8 gray values
+
+    """
+    conf, AUdata, x, y = read_openface_csv(csvname)
+    segments = {}
     for k in range(len(segmentslist)):
-        if corpus == "LRS2":
-            filename = segmentslist[k].split(" ")[0].split("/")[-1].strip(".wav")
-        else:
-            filename = segmentslist[k].split(" ")[0]
-        output.update({filename: {}})
+        filename = segment_name(segmentslist[k], corpus)
         seginfo = [segmentslist[k].split(" ")[1], segmentslist[k].split(" ")[2]]
         cutpoint = [float(x) * 25 for x in seginfo]
         start = int(np.floor(cutpoint[0]))
         end = int(np.ceil(cutpoint[1]))
-        output[filename].update({"conf": conf[start:end]})
-        output[filename].update({"AU": AUdata[start:end, :]})
-        output[filename].update({"frames": cropframe[start:end, :, :]})
+        segments[filename] = range(len(conf))[start:end]
+
+    needed = np.zeros(len(conf), dtype=bool)
+    for frames in segments.values():
+        needed[frames.start : frames.stop] = True
+    last = np.flatnonzero(needed)
+    needed = needed[: last[-1] + 1] if len(last) > 0 else needed[:0]
+    rois = dict(iter_mouth_rois(mp4filedir, x, y, needed))
+
+    output = {}
+    for filename, frames in segments.items():
+        framerois = [rois[i] for i in frames if i in rois]
+        framerois = np.array(framerois).reshape(-1, ROI_SIZE, ROI_SIZE)
+        output.update({filename: {}})
+        output[filename].update({"conf": conf[frames.start : frames.stop]})
+        output[filename].update({"AU": AUdata[frames.start : frames.stop, :]})
+        output[filename].update({"frames": resize_rois(framerois, ifuint8)})
 
     return output
 
 
-def segpretrainvideo(segdict, savedir, csvdir, corpus):
+def segment_csvname(mp4filedir, csvdir):
+    """Get the csv file of a pretrain video
+
+    Args:
+        mp4filedir (str): The video file name.
+        csvdir (str): The dir of csv File, which contain Face recognition information
+
+    """
+    filename = "/".join(
+        [mp4filedir.split("/")[-2], mp4filedir.split("/")[-1].split(".")[0]]
+    )
+    return os.path.join(csvdir, filename + ".csv")
+
+
+def segpretrainvideo(segdict, savedir, csvdir, corpus, ifuint8=False):
     """Segment video files, save data in pt files.
 
     Args:
@@ -139,16 +276,16 @@ def segpretrainvideo(segdict, savedir, csvdir, corpus):
         savedir (str): Save the segmented video files.
         csvdir (str): The dir of csv File, which contain Face recognition information
         corpus (str): With LRS2 or LRS3 corpus
+        ifuint8 (bool): If the frames are stored as uint8 gray values
 
     """
 
     mp4filedir = list(segdict.keys())[0]
     segmentslist = segdict[mp4filedir]
-    filename = "/".join(
-        [mp4filedir.split("/")[-2], mp4filedir.split("/")[-1].split(".")[0]]
+    csvdirfile = segment_csvname(mp4filedir, csvdir)
+    segmented = extract_pretrain_opencv(
+        mp4filedir, csvdirfile, segmentslist, corpus, ifuint8
     )
-    csvdirfile = os.path.join(csvdir, filename + ".csv")
-    segmented = extract_pretrain_opencv(mp4filedir, csvdirfile, segmentslist, corpus)
 
     filekeys = segmented.keys()
     for file in filekeys:
@@ -163,117 +300,43 @@ def segpretrainvideo(segdict, savedir, csvdir, corpus):
         torch.save(
             segmented[file]["frames"], Picdir, _use_new_zipfile_serialization=False
         )
+        append_shape(Picdir, np.shape(segmented[file]["frames"]))
 
 
-def extract_opencv(filename, csvname):
+def extract_opencv(filename, csvname, ifuint8=False):
     """Using cv2 extract video frames.
 
     Args:
         filename (str): The video file name.
         csvname (str): The csv file saved face recog info
+        ifuint8 (bool): If the frames are stored as uint8 gray values
 
     """
-    video = []
-    cap = cv2.VideoCapture(filename)
-    while cap.isOpened():
-        ret, frame = cap.read()  # BGR
-        if ret:
-            video.append(frame)
-        else:
-            break
-    cap.release()
-    video = np.array(video)
-    CSV = pd.read_csv(csvname)
-    head = CSV.axes[1].values
-    for id in range(len(head)):
-        if head[id] == "confidence":
-            confid = id
-        elif head[id] == "x_48":
-            xstart = id
-        elif head[id] == "x_67":
-            xend = id + 1
-        elif head[id] == "y_48":
-            ystart = id
-        elif head[id] == "y_67":
-            yend = id + 1
-        elif head[id] == "AU12_r":
-            AU12id = id
-        elif head[id] == "AU15_r":
-            AU15id = id
-        elif head[id] == "AU17_r":
-            AU17id = id
-        elif head[id] == "AU23_r":
-            AU23id = id
-        elif head[id] == "AU25_r":
-            AU25id = id
-        elif head[id] == "AU26_r":
-            AU26id = id
-    conf = CSV.values[:, confid]
-    AUs = []
-    for ids in [AU12id, AU15id, AU17id, AU23id, AU25id, AU26id]:
-        AU = np.expand_dims(CSV.values[:, ids], axis=1)
-        AUs.append(AU)
+    conf, AUdata, x, y = read_openface_csv(csvname)
+    rois = [roi for _, roi in iter_mouth_rois(filename, x, y)]
+    rois = np.array(rois).reshape(-1, ROI_SIZE, ROI_SIZE)
+    cropframe = resize_rois(rois, ifuint8)
 
-    AUdata = np.concatenate((AUs), axis=1)
+    return conf, AUdata, cropframe
 
-    cropframe = []
-    x = CSV.values[:, xstart:xend]
-    y = CSV.values[:, ystart:yend]
-    for i in range(len(video)):
-        frame = video[i]
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        a = max(x[i, :])
-        b = max(y[i, :])
-        c = min(x[i, :])
-        d = min(y[i, :])
-
-        if a == c or c == d:
-            d = 55
-            b = 125
-            c = 45
-            a = 115
-
-        midx = int((d + b) / 2.0)
-        midy = int((a + c) / 2.0)
-        W = 70
-        H = 70
-        newd = midx - W / 2
-        newb = midx + W / 2
-        newc = midy - H / 2
-        newa = midy + H / 2
-        if newd < 0:
-            newd = 0
-            newb = 0 + W
-        elif newb > 160:
-            newb = 160
-            newd = 160 - W
-        elif newc < 0:
-            newc = 0
-            newa = 0 + H
-        elif newa > 160:
-            newa = 160
-            newc = 160 - H
-
-        outimage = gray[int(newd) : int(newb), int(newc) : int(newa)]
-        if list(outimage.shape) == [70, 70]:
-            cropframe.append(gray[int(newd) : int(newb), int(newc) : int(newa)])
-        else:
-            cropframe.append(gray[55:125, 45:115])
-
-    cropframe = np.array(cropframe)
-    cropframe = cropframe / 255.0
-    cropframe = [
-        cv2.resize(cropframe[i, :, :], (96, 96)) for i in range(len(cropframe))
-    ]
-    cropframe = np.array(cropframe)
-    mean = 0.4161
-    std = 0.1688
-    cropframe = (cropframe - mean) / std
 
-    return conf, AUdata, cropframe
+def video_name(filelist, dset):
+    """Get the utterance name of a LRS2 video
+
+    Args:
+        filelist (str): The dir of the mp4 file, it should be
+                        like '5535415699068794046/00001'
+        dset (str): Which set. There are pretrain, Train, Val, Test set.
+
+    """
+    filelist = filelist.split("/")
+    if dset == "pretrain":
+        return "LRS2_" + filelist[0] + "_" + filelist[1] + "p"
+    else:
+        return "LRS2_" + filelist[0] + "_" + filelist[1] + "m"
 
 
-def segvideo(sourcedir, filelist, savedir, csvdir, dset):
+def segvideo(sourcedir, filelist, savedir, csvdir, dset, ifuint8=False):
     """Segment video files, save data in pt files.
 
     Args:
@@ -282,38 +345,42 @@ def segvideo(sourcedir, filelist, savedir, csvdir, dset):
                         like '5535415699068794046/00001'
         savedir (str): Save the segmented video files.
         csvdir (str): The dir of csv File, which contain Face recognition information
+        ifuint8 (bool): If the frames are stored as uint8 gray values
 
     """
     mp4filedir = sourcedir + "/" + filelist + ".mp4"
     print(mp4filedir)
     csvdir = os.path.join(csvdir, filelist + ".csv")
-    filelist = filelist.split("/")
-    conf, AUs, pics = extract_opencv(mp4filedir, csvdir)
+    conf, AUs, pics = extract_opencv(mp4filedir, csvdir, ifuint8)
 
-    if dset == "pretrain":
-        confdir = os.path.join(
-            savedir, "Conf", "LRS2_" + filelist[0] + "_" + filelist[1] + "p.pt"
-        )
-        AUdir = os.path.join(
-            savedir, "AUs", "LRS2_" + filelist[0] + "_" + filelist[1] + "p.pt"
-        )
-        Picdir = os.path.join(
-            savedir, "Pics", "LRS2_" + filelist[0] + "_" + filelist[1] + "p.pt"
-        )
-    else:
-        confdir = os.path.join(
-            savedir, "Conf", "LRS2_" + filelist[0] + "_" + filelist[1] + "m.pt"
-        )
-        AUdir = os.path.join(
-            savedir, "AUs", "LRS2_" + filelist[0] + "_" + filelist[1] + "m.pt"
-        )
-        Picdir = os.path.join(
-            savedir, "Pics", "LRS2_" + filelist[0] + "_" + filelist[1] + "m.pt"
-        )
+    name = video_name(filelist, dset)
+    confdir = os.path.join(savedir, "Conf", name + ".pt")
+    AUdir = os.path.join(savedir, "AUs", name + ".pt")
+    Picdir = os.path.join(savedir, "Pics", name + ".pt")
 
     torch.save(conf, confdir)
     torch.save(AUs, AUdir)
     torch.save(pics, Picdir)
+    append_shape(Picdir, np.shape(pics))
+
+
+def outputs_done(savedir, name):
+    """Check if the outputs of an utterance were completely written.
+
+    The Pics are saved last and then added to the shape index, so Conf and AUs
+    are complete if the Pics are valid.
+
+    Args:
+        savedir (str): Save the segmented video data.
+        name (str): The utterance name
+
+    """
+    return valid_pt(os.path.join(savedir, "Pics", name + ".pt"))
+
+
+def product_helperjob(job):
+    helper, args = job
+    return helper(args)
 
 
 def product_helper(args):
@@ -324,7 +391,77 @@ def product_helperpretrain(args):
     return segpretrainvideo(*args)
 
 
-def main(sourcedir, savedir, csvdir, audiorefdir, dset, corpus, ifsegment, ifmulticore):
+def list_jobs(audiorefdir, dset, corpus, ifsegment):
+    """List the videos and the pretrain segments to extract.
+
+    Args:
+        audiorefdir (str): The dir which saves the audio Info
+        dset (str): Which set. There are pretrain, Train, Val, Test set.
+        corpus (str): Corpus name, LRS2 or LRS3
+        ifsegment (bool): If segmentation for pretrain set is used
+
+    Returns:
+        segments (list): Dicts of one mp4 file and the list of its segments
+        videos (list): Videos which are not segmented, like
+                       '5535415699068794046/00001'
+
+    """
+    filelistdir = os.path.join(audiorefdir, "text")
+    with open(filelistdir) as filelists:
+        filelist = filelists.readlines()
+
+    if ifsegment is False:
+        for i in range(len(filelist)):
+            filelist[i] = filelist[i].strip("\n")
+            filelist[i] = filelist[i].split(" ")[0]
+            filelist[i] = "/".join(
+                [filelist[i].split("_")[1], filelist[i].split("_")[2][:-1]]
+            )
+        return [], filelist
+
+    nosegmentlist = []
+    for i in range(len(filelist)):
+        filelist[i] = filelist[i].strip("\n")
+        filelist[i] = filelist[i].split(" ")[0]
+        filelist[i] = filelist[i].split("_")
+        if len(filelist[i]) == 5:
+            pass
+        else:
+            nosegmentlist.append(("/".join([filelist[i][1], filelist[i][2][:-1]])))
+    if dset != "pretrain":
+        return [], nosegmentlist
+
+    segfiledir = os.path.join(audiorefdir, "seginfo.txt")
+    segdict = {}
+    with open(segfiledir) as segfilelists:
+        seglist = segfilelists.readlines()
+    for i in seglist:
+        segdict.update({i.split(" ")[1]: []})
+    for j in seglist:
+        splittext = j.split(" ")
+        name = splittext[1]
+
+        values = " ".join([splittext[0], splittext[2], splittext[3]])
+        segdict[name].append(values)
+    segments = [{i: segdict[i]} for i in segdict.keys()]
+    if corpus == "LRS2":
+        return segments, nosegmentlist
+    else:
+        return segments, []
+
+
+def main(
+    sourcedir,
+    savedir,
+    csvdir,
+    audiorefdir,
+    dset,
+    corpus,
+    ifsegment,
+    ifmulticore,
+    ifuint8="false",
+    jobdir=None,
+):
     """Segment video files, save data in pt files.
 
     Args:
@@ -335,8 +472,14 @@ def main(sourcedir, savedir, csvdir, audiorefdir, dset, corpus, ifsegment, ifmul
         dset (str): Which set. There are pretrain, Train, Val, Test set.
         ifsegment: If segmentation for pretrain set is used
         ifmulticore: If use multi processes.
+        ifuint8: If the frames are stored as uint8 gray values, 8 times smaller.
+                 They are normalized when they are loaded for the model.
+        jobdir: Shared job directory. If it is given, the videos are claimed
+                in shards, so that many hosts can run at once, and videos with
+                valid outputs are skipped.
 
     """
+    ifuint8 = ifuint8 == "true"
     if ifmulticore == "true":
         ifmulticore = True
     else:
@@ -346,93 +489,34 @@ def main(sourcedir, savedir, csvdir, audiorefdir, dset, corpus, ifsegment, ifmul
     else:
         ifsegment = False
 
-    if ifsegment is False:
-        filelistdir = os.path.join(audiorefdir, "text")
-        with open(filelistdir) as filelists:
-            filelist = filelists.readlines()
+    segments, videos = list_jobs(audiorefdir, dset, corpus, ifsegment)
+    jobs = {}
+    for i in segments:
+        jobs[list(i.keys())[0]] = (
+            product_helperpretrain,
+            (i, savedir, csvdir, corpus, ifuint8),
+        )
+    for i in videos:
+        jobs[i] = (product_helper, (sourcedir, i, savedir, csvdir, dset, ifuint8))
 
-        for i in range(len(filelist)):
-            filelist[i] = filelist[i].strip("\n")
-            filelist[i] = filelist[i].split(" ")[0]
-            filelist[i] = "/".join(
-                [filelist[i].split("_")[1], filelist[i].split("_")[2][:-1]]
-            )
-        if ifmulticore is True:
-            pool = mp.Pool()
-            job_args = [(sourcedir, i, savedir, csvdir, dset) for i in filelist]
-            pool.map(product_helper, job_args)
-        else:
-            for i in filelist:
-                segvideo(sourcedir, i, savedir, csvdir, dset)
-    else:
-        filelistdir = os.path.join(audiorefdir, "text")
-        with open(filelistdir) as filelists:
-            filelist = filelists.readlines()
-        nosegmentlist = []
-        for i in range(len(filelist)):
-            filelist[i] = filelist[i].strip("\n")
-            filelist[i] = filelist[i].split(" ")[0]
-            filelist[i] = filelist[i].split("_")
-            if len(filelist[i]) == 5:
-                pass
-            else:
-                nosegmentlist.append(("/".join([filelist[i][1], filelist[i][2][:-1]])))
-        if dset == "pretrain":
-            segfiledir = os.path.join(audiorefdir, "seginfo.txt")
-            segdict = {}
-            with open(segfiledir) as segfilelists:
-                seglist = segfilelists.readlines()
-            for i in seglist:
-                segdict.update({i.split(" ")[1]: []})
-            for j in seglist:
-                splittext = j.split(" ")
-                name = splittext[1]
-
-                values = " ".join([splittext[0], splittext[2], splittext[3]])
-                segdict[name].append(values)
-            segmentdictkey = segdict.keys()
-            if corpus == "LRS2":
-                if ifmulticore is True:
-                    pool = mp.Pool()
-                    job_args = [
-                        ({i: segdict[i]}, savedir, csvdir, corpus)
-                        for i in segmentdictkey
-                    ]
-                    pool.map(product_helperpretrain, job_args)
-                else:
-                    for i in segmentdictkey:
-                        segpretrainvideo({i: segdict[i]}, savedir, csvdir, corpus)
-                if ifmulticore is True:
-                    pool = mp.Pool()
-                    job_args = [
-                        (sourcedir, i, savedir, csvdir, dset) for i in nosegmentlist
-                    ]
-                    pool.map(product_helper, job_args)
-                else:
-                    for i in nosegmentlist:
-                        segvideo(sourcedir, i, savedir, csvdir, dset)
-            else:
-                if ifmulticore is True:
-                    pool = mp.Pool()
-                    job_args = [
-                        ({i: segdict[i]}, savedir, csvdir, corpus)
-                        for i in segmentdictkey
-                    ]
-                    pool.map(product_helperpretrain, job_args)
-                else:
-                    for i in segmentdictkey:
-                        segpretrainvideo({i: segdict[i]}, savedir, csvdir, corpus)
+    def isdone(key):
+        helper, args = jobs[key]
+        if helper is product_helper:
+            return outputs_done(savedir, video_name(key, dset))
+        return all(outputs_done(savedir, segment_name(i, corpus)) for i in args[0][key])
 
+    if jobdir:
+        shards = JobManifest(jobdir, list(jobs.keys()), isdone)
+    else:
+        shards = [list(jobs.keys())]
+    if ifmulticore is True:
+        pool = mp.Pool()
+    for keys in shards:
+        if ifmulticore is True:
+            pool.map(product_helperjob, [jobs[i] for i in keys])
         else:
-            if ifmulticore is True:
-                pool = mp.Pool()
-                job_args = [
-                    (sourcedir, i, savedir, csvdir, dset) for i in nosegmentlist
-                ]
-                pool.map(product_helper, job_args)
-            else:
-                for i in nosegmentlist:
-                    segvideo(sourcedir, i, savedir, csvdir, dset)
+            for i in keys:
+                product_helperjob(jobs[i])
 
 
 # hand over parameter overview
@@ -445,14 +529,44 @@ def main(sourcedir, savedir, csvdir, audiorefdir, dset, corpus, ifsegment, ifmul
 # sys.argv[6] = corpus (str): Corpus name, LRS2 or LRS3
 # sys.argv[7] = ifsegment: If segmentation for pretrain set is used
 # sys.argv[8] = ifmulticore: If use multi processes.
-
-main(
-    sys.argv[1],
-    sys.argv[2],
-    sys.argv[3],
-    sys.argv[4],
-    sys.argv[5],
-    sys.argv[6],
-    sys.argv[7],
-    sys.argv[8],
-)
+# optional
+# sys.argv[9] = ifuint8: If the frames are stored as uint8 gray values.
+# sys.argv[10] = jobdir: Shared job directory to run on many hosts at once.
+
+if __name__ == "__main__":
+    if len(sys.argv) > 10:
+        main(
+            sys.argv[1],
+            sys.argv[2],
+            sys.argv[3],
+            sys.argv[4],
+            sys.argv[5],
+            sys.argv[6],
+            sys.argv[7],
+            sys.argv[8],
+            sys.argv[9],
+            sys.argv[10],
+        )
+    elif len(sys.argv) > 9:
+        main(
+            sys.argv[1],
+            sys.argv[2],
+            sys.argv[3],
+            sys.argv[4],
+            sys.argv[5],
+            sys.argv[6],
+            sys.argv[7],
+            sys.argv[8],
+            sys.argv[9],
+        )
+    else:
+        main(
+            sys.argv[1],
+            sys.argv[2],
+            sys.argv[3],
+            sys.argv[4],
+            sys.argv[5],
+            sys.argv[6],
+            sys.argv[7],
+            sys.argv[8],
+        )
@@ -3,6 +3,9 @@ import json
 import os
 import sys
 
+from espnet.finetuneav.conditions import CONDITION_INDEX
+from espnet.finetuneav.conditions import write_condition_index
+
 
 def checkkeylist(keylist, vklist):
     vdict = {}
@@ -35,7 +38,23 @@ def checktrainkeylist(keylist, vklist):
     return keylistnew
 
 
-def splitsnr(srcdir, noisecombination, snrdir):
+def splitsnr(srcdir, noisecombination, snrdir, ifcopy="true"):
+    """Write the condition index of a test set dump
+
+    Each utterance is mapped to its audio noise type, its SNR bucket (-12 ... 12,
+    "clean" or "reverb", "None" if it is in no bucket) and its video degradation.
+    asr_recog_avrms.py decodes a subset of the dump with --recog-filter. By
+    default the dump of each SNR bucket is written as well, as the recognition
+    scripts without --recog-filter read these copies.
+
+    Args:
+        srcdir (str): Directory of the test set dumps
+        noisecombination (str): Audio and video noise type, e.g. noise_blur
+        snrdir (str): Directory with the SNR lists of the test set
+        ifcopy (str): If the dump of each SNR bucket should be written,
+                      false to only write the condition index
+
+    """
     audionoise = noisecombination.split("_")[0]
     videonoise = noisecombination.split("_")[1]
     if videonoise == "None":
@@ -57,34 +76,39 @@ def splitsnr(srcdir, noisecombination, snrdir):
     with open(dumpfile, encoding="UTF-8") as json_file:
         data = json.load(json_file)
 
-    outdict = {}
-    snrlist = ["-12", "-9", "-6", "-3", "0", "3", "6", "9", "12"]
-    for snr in snrlist:
-        outdict.update({snr: {"utts": {}}})
-    outdict.update({"clean": {"utts": {}}})
-    outdict.update({"reverb": {"utts": {}}})
-    uttskey = data["utts"].keys()
-    for utts in uttskey:
+    conditions = {}
+    for utts in data["utts"].keys():
         if "-reverb" in utts:
-            outdict["reverb"]["utts"].update({utts: data["utts"][utts]})
-        if "-" not in utts:
-            outdict["clean"]["utts"].update({utts: data["utts"][utts]})
+            noise, snr = "reverb", "reverb"
+        elif "-" not in utts:
+            noise, snr = "None", "clean"
+        else:
+            noise, snr = audionoise, "None"
+        conditions[utts] = {"noise": noise, "snr": snr, "video": videonoise}
+    snrlist = ["-12", "-9", "-6", "-3", "0", "3", "6", "9", "12"]
     for snr in snrlist:
         snrfiledir = os.path.join(snrsdir, "Test_" + snr)
         with open(snrfiledir, "r") as f:
-            snrfilelist = f.readlines()
-            f.close()
-        for j in snrfilelist:
-            splitname = j.split(" ")[0]
-            outdict[snr]["utts"].update({splitname: data["utts"][splitname]})
+            for j in f:
+                conditions[j.split(" ")[0]]["snr"] = snr
+    write_condition_index(os.path.join(dumpdir, CONDITION_INDEX), conditions)
 
+    if ifcopy != "true":
+        return
     snrlist.extend(["clean", "reverb"])
     for snr in snrlist:
+        output = {
+            "utts": {
+                utts: data["utts"][utts]
+                for utts in data["utts"].keys()
+                if conditions[utts]["snr"] == snr
+            }
+        }
         savefilename = dumpfile.replace(dumpdir, os.path.join(dumpdir, snr))
         if not os.path.exists(savefilename.replace(jsonname, "")):
             os.makedirs(savefilename.replace(jsonname, ""))
         with open(savefilename, "w", encoding="utf-8") as f:
-            json.dump(outdict[snr], f, ensure_ascii=False, indent=4)
+            json.dump(output, f, ensure_ascii=False, indent=4)
 
 
 # hand over parameter overview
@@ -92,6 +116,10 @@ def splitsnr(srcdir, noisecombination, snrdir):
 # sys.argv[2] = noisecombination(str), Noise combination
 #               (noise_None' 'music_None' 'noise_blur' 'noise_saltandpepper)
 # sys.argv[3] = snrdir(str)
+# optional
+# sys.argv[4] = ifcopy (str), If the dump of each SNR bucket should be written
+#               besides the condition index (default true, false to only
+#               write the index for --recog-filter)
 
 
-splitsnr(sys.argv[1], sys.argv[2], sys.argv[3])
+splitsnr(*sys.argv[1:5])
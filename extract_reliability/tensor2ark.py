@@ -1,4 +1,6 @@
 from kaldiio import WriteHelper
+import multiprocessing as mp
+import numpy as np
 import os
 import sys
 import torch
@@ -9,34 +11,77 @@ def split(a, n):
     return (a[i * k + min(i, m) : (i + 1) * k + min(i + 1, m)] for i in range(n))
 
 
-def make_ark(srcdir, savedir, nj):
+def write_ark(filedir, filelist, arkfile, scpfile, iffloat16=False):
+    """Write the tensors of a list of files into one ark and scp file.
+
+    Args:
+        filedir (str): The dir of the .pt files
+        filelist (list): The .pt files of this ark file
+        arkfile (str): Path of the ark file
+        scpfile (str): Path of the scp file
+        iffloat16 (bool): If the data is stored uncompressed as float16
+                          (numpy format of kaldiio), else compressed as kaldi
+                          matrices
+
+    """
+    arksavedir = "ark,scp:" + arkfile + "," + scpfile
+    if iffloat16 is True:
+        helper = WriteHelper(arksavedir, write_function="numpy")
+    else:
+        helper = WriteHelper(arksavedir, compression_method=2)
+    with helper as writer:
+        for filename in filelist:
+            dsetsrcdata = torch.load(
+                os.path.join(filedir, filename), map_location="cpu"
+            )
+            dsetsrcdata = dsetsrcdata.detach().numpy()
+            if iffloat16 is True:
+                dsetsrcdata = dsetsrcdata.astype(np.float16)
+            writer(filename.split(".")[0], dsetsrcdata)
+    print("made " + arkfile + " from " + str(len(filelist)) + " files")
+
+
+def product_helper(args):
+    return write_ark(*args)
+
+
+def make_ark(srcdir, savedir, nj, iffloat16="false"):
     nj = int(nj)
+    iffloat16 = iffloat16 == "true"
+    job_args = []
     datatypes = os.listdir(srcdir)
     for datatype in datatypes:
         Resultsdir = os.path.join(savedir, datatype)
         if not os.path.exists(Resultsdir):
             os.makedirs(Resultsdir)
-        print("make ark files")
         filedir = os.path.join(srcdir, datatype)
-        filelist = os.listdir(filedir)
+        filelist = [name for name in os.listdir(filedir) if name.endswith(".pt")]
         filelists = list(split(filelist, nj))
 
         for i in range(len(filelists)):
-            arksavedir = (
-                "ark,scp:"
-                + os.path.join(Resultsdir, "feats_" + str(i) + ".ark")
-                + ","
-                + os.path.join(Resultsdir, "feats_" + str(i) + ".scp")
+            job_args.append(
+                (
+                    filedir,
+                    filelists[i],
+                    os.path.join(Resultsdir, "feats_" + str(i) + ".ark"),
+                    os.path.join(Resultsdir, "feats_" + str(i) + ".scp"),
+                    iffloat16,
+                )
             )
-            with WriteHelper(arksavedir, compression_method=2) as writer:
-                for filename in filelists[i]:
-                    dsetsrcdata = torch.load(os.path.join(filedir, filename))
-                    name = filename.split(".")[0]
-                    print(os.path.join(filedir, filename))
-                    if dsetsrcdata.detach().is_cuda:
-                        writer(name, dsetsrcdata.detach().cpu().numpy())
-                    else:
-                        writer(name, dsetsrcdata.detach().numpy())
-
-
-make_ark(sys.argv[1], sys.argv[2], sys.argv[3])
+
+    print("make ark files")
+    # every ark file is written by one process
+    with mp.Pool(nj) as pool:
+        pool.map(product_helper, job_args, chunksize=1)
+
+
+# hand over parameter overview
+# sys.argv[1] = srcdir (str): The dir of the datatype dirs with .pt files
+# sys.argv[2] = savedir (str): Save directory of the ark and scp files
+# sys.argv[3] = nj (int): Number of ark files per datatype and of processes
+# optional
+# sys.argv[4] = iffloat16: If the data is stored uncompressed as float16.
+if len(sys.argv) > 4:
+    make_ark(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4])
+else:
+    make_ark(sys.argv[1], sys.argv[2], sys.argv[3])
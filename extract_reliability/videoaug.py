@@ -1,60 +1,184 @@
 import cv2
+import multiprocessing as mp
 import numpy as np
 import os
+import scipy.ndimage
 import sys
-from vidaug import augmentors as va
+import zlib
 
+from segvideo import MEAN
+from segvideo import RESIZE
+from segvideo import ROI_SIZE
+from segvideo import STD
 
-def videoaugmentation(filelist, srcdir, savedir, noisetype):
-    savedir = os.path.join(savedir, noisetype)
-    srcdir = os.path.join(srcdir, "data", "lrs2_v1", "mvlrs_v1", "main")
-    lists = []
-    with open(filelist) as fls:
-        filelists = fls.readlines()
-    for i in range(len(filelists)):
-        lists.append(filelists[i].strip("\n") + ".mp4")
-
-    for i in lists:
-        videodir = os.path.join(srcdir, i)
-        filename = os.path.join(savedir, i.split("/")[0])
-        if not os.path.exists(filename):
-            os.makedirs(filename)
-        savevideodir = os.path.join(savedir, i)
-        cap = cv2.VideoCapture(videodir)
-
-        frames = []
-        while cap.isOpened():
+# standard deviation of the gaussian blur, in pixels of the video frames
+BLUR_SIGMA = 1.2
+# each gray value is set to white with a probability of 1 / SALT_RATIO and
+# then to black with the same probability
+SALT_RATIO = 100
+
+
+def utterance_rng(name, seed=0):
+    """Get the random generator of an utterance.
+
+    The noise of an utterance only depends on its name and the seed, not on
+    the process or the order in which the utterances are degraded. The hash
+    of python is salted for every process, so crc32 is used.
+
+    Args:
+        name (str): The utterance name
+        seed (int): The seed of the noise condition
+
+    Returns:
+        np.random.Generator: random generator of the utterance
+
+    """
+    return np.random.default_rng([int(seed), zlib.crc32(name.encode())])
+
+
+def gaussian_blur(frames, sigma=BLUR_SIGMA):
+    """Blur all frames of a clip at once with a gaussian kernel.
+
+    The frames are not blurred over time. The color channels are blurred like
+    the rows and columns, as by vidaug.GaussianBlur.
+
+    Args:
+        frames (np.ndarray): frames (frames, height, width[, channels])
+        sigma (float): standard deviation of the kernel in pixels
+
+    Returns:
+        np.ndarray: blurred frames of the same dtype
+
+    """
+    return scipy.ndimage.gaussian_filter(
+        frames, sigma=(0,) + (sigma,) * (frames.ndim - 1)
+    )
+
+
+def salt_and_pepper(frames, rng, ratio=SALT_RATIO, white=255, black=0):
+    """Set random gray values of all frames of a clip to white and black.
+
+    Like vidaug.Salt followed by vidaug.Pepper, every value of every channel
+    is salted and then peppered independently.
+
+    Args:
+        frames (np.ndarray): frames (frames, height, width[, channels])
+        rng (np.random.Generator): random generator of the utterance
+        ratio (int): one in ratio values is salted and one in ratio peppered
+        white: value of a salted pixel
+        black: value of a peppered pixel
+
+    Returns:
+        np.ndarray: noisy frames of the same dtype
+
+    """
+    salt = rng.random(frames.shape, dtype=np.float32) < 1.0 / ratio
+    pepper = rng.random(frames.shape, dtype=np.float32) < 1.0 / ratio
+    frames = frames.copy()
+    frames[salt] = white
+    frames[pepper] = black
+    return frames
+
+
+def degrade(frames, noisetype, rng, ifroi=False):
+    """Apply a video noise condition to all frames of a clip.
+
+    Args:
+        frames (np.ndarray): uint8 video frames (frames, height, width, 3) or
+                             mouth regions of segvideo (frames, RESIZE, RESIZE)
+        noisetype (str): blur or saltandpepper
+        rng (np.random.Generator): random generator of the utterance
+        ifroi (bool): If the frames are mouth regions, uint8 or normalized.
+                      The blur is then scaled by the resizing of the regions,
+                      and the noise uses the white and black of the
+                      normalization. The noise is applied after the
+                      conversion to gray values, so it is not identical to
+                      the noise of a degraded video.
+
+    Returns:
+        np.ndarray: degraded frames of the same dtype
+
+    """
+    if ifroi is True:
+        sigma = BLUR_SIGMA * RESIZE / ROI_SIZE
+    else:
+        sigma = BLUR_SIGMA
+    if ifroi is True and frames.dtype != np.uint8:
+        white = (1.0 - MEAN) / STD
+        black = -MEAN / STD
+    else:
+        white = 255
+        black = 0
+    if noisetype == "blur":
+        return gaussian_blur(frames, sigma)
+    elif noisetype == "saltandpepper":
+        return salt_and_pepper(frames, rng, white=white, black=black)
+    raise ValueError("Unknown video noise type " + noisetype)
+
+
+def augmentvideo(filelist, srcdir, savedir, noisetype, seed=0):
+    """Degrade a video file and save it as a new mp4 file.
+
+    Args:
+        filelist (str): The name of the video, like '5535415699068794046/00001'
+        srcdir (str): Directory of the videos
+        savedir (str): Directory to save the augmented videos
+        noisetype (str): blur or saltandpepper
+        seed (int): The seed of the noise condition
+
+    """
+    videodir = os.path.join(srcdir, filelist + ".mp4")
+    savevideodir = os.path.join(savedir, filelist + ".mp4")
+    os.makedirs(os.path.dirname(savevideodir), exist_ok=True)
+    cap = cv2.VideoCapture(videodir)
+    frames = []
+    try:
+        while True:
             ret, frame = cap.read()
-            if ret is True:
-                frames.append(frame)
-                if cv2.waitKey(1) & 0xFF == ord("q"):
-                    break
-            else:
+            if ret is not True:
                 break
-
+            frames.append(frame)
+    finally:
         # When everything done, release the capture
         cap.release()
-        cv2.destroyAllWindows()
-        frames = np.asarray(frames)
-
-        if noisetype == "blur":
-            seq = va.Sequential([va.GaussianBlur(1.2), va.Add()])
-        else:
-            seq = va.Sequential(
-                [
-                    va.Salt(),
-                    va.Pepper(),
-                ]
-            )
-        frames = seq(frames)
-
-        frame_width = frames[0].shape[0]
-        frame_height = frames[0].shape[1]
-        fourcc = cv2.VideoWriter_fourcc("m", "p", "4", "v")
-        out = cv2.VideoWriter(savevideodir, fourcc, 25.0, (frame_width, frame_height))
-        for i in frames:
-            out.write(i)
-        out.release()
+    if len(frames) == 0:
+        print("No frames in " + videodir)
+        return
+    frames = degrade(np.stack(frames), noisetype, utterance_rng(filelist, seed))
+
+    frame_width = frames[0].shape[1]
+    frame_height = frames[0].shape[0]
+    fourcc = cv2.VideoWriter_fourcc("m", "p", "4", "v")
+    out = cv2.VideoWriter(savevideodir, fourcc, 25.0, (frame_width, frame_height))
+    for i in frames:
+        out.write(i)
+    out.release()
+
+
+def product_helper(args):
+    return augmentvideo(*args)
+
+
+def videoaugmentation(filelist, srcdir, savedir, noisetype, nj=1, seed=0):
+    """Degrade the videos of a file list, in parallel.
+
+    Args:
+        filelist (str): The file list of the videos which are augmented
+        srcdir (str): Directory where the dataset is saved
+        savedir (str): Directory to save augmented files
+        noisetype (str): blur or saltandpepper
+        nj (int): Number of processes
+        seed (int): The seed of the noise condition
+
+    """
+    savedir = os.path.join(savedir, noisetype)
+    srcdir = os.path.join(srcdir, "data", "lrs2_v1", "mvlrs_v1", "main")
+    with open(filelist) as fls:
+        lists = [line.strip("\n") for line in fls if line.strip("\n")]
+
+    job_args = [(i, srcdir, savedir, noisetype, int(seed)) for i in lists]
+    with mp.Pool(int(nj)) as pool:
+        pool.map(product_helper, job_args)
 
 
 # hand over parameter overview
@@ -62,7 +186,10 @@ def videoaugmentation(filelist, srcdir, savedir, noisetype):
 #               which are files augmentated
 # sys.argv[2] = srcdir (str), Directory where save the dataset
 # sys.argv[3] = savedir (str), Directory to save augmented files
-# sys.argv[4] = noisetype (str), Video feature directory
-
+# sys.argv[4] = noisetype (str), Video noise type blur or saltandpepper
+# optional
+# sys.argv[5] = nj (int), Number of processes, default is 1
+# sys.argv[6] = seed (int), The seed of the noise condition, default is 0
 
-videoaugmentation(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4])
+if __name__ == "__main__":
+    videoaugmentation(*sys.argv[1:7])
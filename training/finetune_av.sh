@@ -16,6 +16,7 @@ bpemode=unigram
 nj=32
 do_delta=false
 preprocess_config=conf/specaug.yaml
+noise_mix_config=		# json configuration of the noise mixed into the training data while loading, optional
 train_config=conf/train.yaml
 lm_config=conf/lm.yaml
 decode_config=conf/decode.yaml
@@ -104,6 +105,7 @@ if [ ${stage} -le 0 ] && [ ${stop_stage} -ge 0 ]; then
         asr_train_avrms.py \
         --ngpu ${ngpu} \
         --preprocess-conf ${preprocess_config} \
+        ${noise_mix_config:+--noise-mix-conf ${noise_mix_config}} \
         --config $(change_yaml.py ${train_config} -o conf/finetuneav.yaml -a model-module=espnet.finetuneav.e2e_asr_transformer:E2E -a batch-size=1 -a epochs=10 -a transformer-lr=0.05 -a transformer-warmup-steps=2500)  \
         --backend ${backend} \
         --outdir ${expdir}/results \
@@ -131,13 +133,12 @@ if [ ${stage} -le 1 ] && [ ${stop_stage} -ge 1 ]; then
 			       --num ${n_average}  || exit 1;
     fi
     echo "stage 1: Decoding"
+    # split data once, each SNR condition is selected from the condition index
+    feat_recog_dir=${dumpdecodedir}/Test_${noisetype}/delta${do_delta}
+    splitjson.py --parts ${nj} ${feat_recog_dir}/data_${bpemode}${nbpe}.json  || exit 1;
     for rtask in $recog_evalset; do   ####################### the file you want to decode
         pids=() # initialize pids
         (decode_dir=decode_${rtask}_$(basename ${decode_config%.*})
-         feat_recog_dir=${dumpdecodedir}/Test_${noisetype}/${rtask}/delta${do_delta}
-
-         # split data
-         splitjson.py --parts ${nj} ${feat_recog_dir}/data_${bpemode}${nbpe}.json  || exit 1;
 
          #### use CPU for decoding
          ngpu=0
@@ -149,6 +150,8 @@ if [ ${stage} -le 1 ] && [ ${stop_stage} -ge 1 ]; then
             --debugmode ${debugmode} \
             --verbose 1 \
             --recog-json ${feat_recog_dir}/split${nj}utt/data_${bpemode}${nbpe}.JOB.json \
+            --recog-condition-index ${dumpdecodedir}/Test_${noisetype}/conditions \
+            --recog-filter "snr=${rtask}" \
             --result-label ${expdir}/${decode_dir}/data.JOB.json \
             --model ${expdir}/results/${recog_model}  \
             --rnnlm ${lmexpdir}/rnnlm.model.best  || exit 1;
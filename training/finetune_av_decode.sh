@@ -76,13 +76,12 @@ for noisetype in noise music blur saltandpepper; do
 #for noisetype in saltandpepper; do
     rm -rf ${expdir}/$noisetype
     mkdir ${expdir}/$noisetype 
+    # split data once, each SNR condition is selected from the condition index
+    feat_recog_dir=${dumpdecodedir}/Test_${noisetype}/delta${do_delta}
+    splitjson.py --parts ${nj} ${feat_recog_dir}/data_${bpemode}${nbpe}.json  || exit 1;
     for rtask in $recog_evalset; do   ####################### the file you want to decode
         pids=() # initialize pids
         (decode_dir=decode_${rtask}_$(basename ${decode_config%.*})
-         feat_recog_dir=${dumpdecodedir}/Test_${noisetype}/${rtask}/delta${do_delta}
-
-         # split data
-         splitjson.py --parts ${nj} ${feat_recog_dir}/data_${bpemode}${nbpe}.json  || exit 1;
 
          #### use CPU for decoding
          ngpu=0
@@ -94,6 +93,8 @@ for noisetype in noise music blur saltandpepper; do
             --debugmode ${debugmode} \
             --verbose 1 \
             --recog-json ${feat_recog_dir}/split${nj}utt/data_${bpemode}${nbpe}.JOB.json \
+            --recog-condition-index ${dumpdecodedir}/Test_${noisetype}/conditions \
+            --recog-filter "snr=${rtask}" \
             --result-label ${expdir}/${decode_dir}/data.JOB.json \
             --model ${expdir}/${recog_model}  \
             --rnnlm ${lmexpdir}/rnnlm.model.best  || exit 1;
@@ -41,6 +41,7 @@ from espnet.asr.pytorch_backend.asr_init import load_trained_modules
 import espnet.lm.pytorch_backend.extlm as extlm_pytorch
 from espnet.nets.asr_interface import ASRInterface
 from espnet.nets.pytorch_backend.e2e_asr import pad_list
+from espnet.nets.pytorch_backend.nets_utils import make_pad_mask
 import espnet.nets.pytorch_backend.lm.default as lm_pytorch
 from espnet.nets.pytorch_backend.streaming.segment import SegmentStreamingE2E
 from espnet.nets.pytorch_backend.streaming.window import WindowStreamingE2E
@@ -50,7 +51,13 @@ from espnet.utils.cli_writers import file_writer_helper
 from espnet.utils.deterministic_utils import set_deterministic_pytorch
 from espnet.utils.dynamic_import import dynamic_import
 from espnet.finetuneav.io_utils import LoadInputsAndTargets
+from espnet.finetuneav.lipreadingmodel import normalize_frames
+from espnet.finetuneav.noisemix import NoiseMixer
+from espnet.finetuneav.iterators import PrefetchIterator
 from espnet.finetuneav.batchfy import make_batchset
+from espnet.finetuneav.catalog import load_utts
+from espnet.finetuneav.conditions import load_condition_index
+from espnet.finetuneav.conditions import select_utts
 from espnet.utils.training.evaluator import BaseEvaluator
 from espnet.utils.training.iterators import ShufflingEnabler
 from espnet.utils.training.iterators import ToggleableShufflingMultiprocessIterator
@@ -247,16 +254,62 @@ class CustomUpdater(StandardUpdater):
 class CustomConverter(object):
     """Custom batch converter for Pytorch.
 
+    For a GPU device, each stream is padded into a host buffer which is
+    allocated once for the largest batch seen so far and reused at each step.
+
     Args:
         subsampling_factor (int): The subsampling factor.
-        dtype (torch.dtype): Data type to convert.
+        dtype (torch.dtype): Data type to convert, e.g. torch.float16 or
+            torch.bfloat16 to transfer half precision inputs.
+        pin_memory (bool): Allocate the buffers in page-locked memory and
+            transfer them to the device without blocking.
 
     """
 
-    def __init__(self, subsampling_factor=1, dtype=torch.float32):
+    def __init__(self, subsampling_factor=1, dtype=torch.float32, pin_memory=False):
         self.subsampling_factor = subsampling_factor
         self.ignore_id = -1
         self.dtype = dtype
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self._buffers = {}
+        self._events = {}
+
+    def _pad(self, name, xs, pad_value, dtype, device):
+        """Pad a list of arrays into one tensor on the device.
+
+        Args:
+            name (str): The name of the stream, which owns one buffer.
+            xs (list): The arrays to pad [(T_1, ...), (T_2, ...), ...].
+            pad_value (float): The value for the padding.
+            dtype (torch.dtype): The data type of the padded tensor.
+            device (torch.device): The device to send to.
+
+        Returns:
+            torch.Tensor: The padded tensor (B, Tmax, ...).
+
+        """
+        shape = (len(xs),) + tuple(max(s) for s in zip(*[x.shape for x in xs]))
+        numel = int(np.prod(shape))
+        if torch.device(device).type == "cpu":
+            # the result would alias the buffer, so it cannot be reused
+            pad = torch.empty(shape, dtype=dtype)
+        else:
+            buffer = self._buffers.get(name)
+            if buffer is None or buffer.numel() < numel or buffer.dtype != dtype:
+                buffer = torch.empty(numel, dtype=dtype, pin_memory=self.pin_memory)
+                self._buffers[name] = buffer
+            elif name in self._events:
+                # wait until the previous batch has left the buffer
+                self._events[name].synchronize()
+            pad = buffer[:numel].view(shape)
+        pad.fill_(pad_value)
+        for i, x in enumerate(xs):
+            pad[i, : x.shape[0]] = torch.as_tensor(x)
+        pad = pad.to(device, non_blocking=self.pin_memory)
+        if self.pin_memory and pad.is_cuda:
+            self._events[name] = torch.cuda.Event()
+            self._events[name].record()
+        return pad
 
     def __call__(self, batch, device):
         """Transforms a batch and send it to a device.
@@ -295,9 +348,7 @@ class CustomConverter(object):
             # because torch.nn.DataParellel can't handle it.
             axs_pad = {"real": axs_pad_real, "imag": axs_pad_imag}
         else:
-            axs_pad = pad_list([torch.from_numpy(ax).float() for ax in axs], 0).to(
-                device, dtype=self.dtype
-            )
+            axs_pad = self._pad("axs", axs, 0, self.dtype, device)
 
         if vxs[0].dtype.kind == "c":
             vxs_pad_real = pad_list(
@@ -311,10 +362,15 @@ class CustomConverter(object):
             # Don't create ComplexTensor and give it E2E here
             # because torch.nn.DataParellel can't handle it.
             vxs_pad = {"real": vxs_pad_real, "imag": vxs_pad_imag}
+        elif vxs[0].dtype == np.uint8:
+            # send the frames as uint8 and normalize them on the device,
+            # the padding is zero after the normalization as for float frames
+            vxs_pad = self._pad("vxs", vxs, 0, torch.uint8, device)
+            vxs_pad = normalize_frames(vxs_pad, self.dtype)
+            vpad_mask = make_pad_mask([x.shape[0] for x in vxs]).to(device)
+            vxs_pad.masked_fill_(vpad_mask[:, :, None, None], 0)
         else:
-            vxs_pad = pad_list([torch.from_numpy(vx).float() for vx in vxs], 0).to(
-                device, dtype=self.dtype
-            )
+            vxs_pad = self._pad("vxs", vxs, 0, self.dtype, device)
 
         if rms[0].dtype.kind == "c":
             rms_pad_real = pad_list(
@@ -329,19 +385,17 @@ class CustomConverter(object):
             # because torch.nn.DataParellel can't handle it.
             rms_pad = {"real": rms_pad_real, "imag": rms_pad_imag}
         else:
-            rms_pad = pad_list(
-                [torch.from_numpy(rm.astype(np.float32)).float() for rm in rms], 0
-            ).to(device, dtype=self.dtype)
+            rms_pad = self._pad("rms", rms, 0, self.dtype, device)
 
         ilens = torch.from_numpy(ilens).to(device)
         # NOTE: this is for multi-task learning (e.g., speech translation)
-        ys_pad = pad_list(
-            [
-                torch.from_numpy(np.array(y[0]) if isinstance(y, tuple) else y).long()
-                for y in ys
-            ],
+        ys_pad = self._pad(
+            "ys",
+            [np.array(y[0]) if isinstance(y, tuple) else y for y in ys],
             self.ignore_id,
-        ).to(device)
+            torch.long,
+            device,
+        )
 
         return axs_pad, vxs_pad, rms_pad, ilens, ys_pad
 
@@ -430,8 +484,7 @@ def train(args):
         logging.warning("cuda is not available")
 
     # get input and output dimension info
-    with open(args.valid_json, "rb") as f:
-        valid_json = json.load(f)["utts"]
+    valid_json = load_utts(args.valid_json)
     utts = list(valid_json.keys())
     audio_idim_list = [
         int(valid_json[utts[0]]["input"][i]["ashape"][-1]) for i in range(args.num_encs)
@@ -516,7 +569,7 @@ def train(args):
 
     # set torch device
     device = torch.device("cuda" if args.ngpu > 0 else "cpu")
-    if args.train_dtype in ("float16", "float32", "float64"):
+    if args.train_dtype in ("float16", "bfloat16", "float32", "float64"):
         dtype = getattr(torch, args.train_dtype)
     else:
         dtype = torch.float32
@@ -569,17 +622,19 @@ def train(args):
 
     # Setup a converter
     if args.num_encs == 1:
-        converter = CustomConverter(subsampling_factor=model.subsample[0], dtype=dtype)
+        converter = CustomConverter(
+            subsampling_factor=model.subsample[0],
+            dtype=dtype,
+            pin_memory=args.ngpu > 0,
+        )
     else:
         converter = CustomConverterMulEnc(
             [i[0] for i in model.subsample_list], dtype=dtype
         )
 
-    # read json data
-    with open(args.train_json, "rb") as f:
-        train_json = json.load(f)["utts"]
-    with open(args.valid_json, "rb") as f:
-        valid_json = json.load(f)["utts"]
+    # read json data, or the catalogs built by dump/avcatalogdump.py
+    train_json = load_utts(args.train_json)
+    valid_json = load_utts(args.valid_json)
 
     use_sortagrad = args.sortagrad == -1 or args.sortagrad > 0
     # make minibatch list (variable length)
@@ -596,6 +651,7 @@ def train(args):
         batch_frames_in=args.batch_frames_in,
         batch_frames_out=args.batch_frames_out,
         batch_frames_inout=args.batch_frames_inout,
+        batch_bytes=getattr(args, "batch_bytes", 0),
         iaxis=0,
         oaxis=0,
     )
@@ -611,22 +667,42 @@ def train(args):
         batch_frames_in=args.batch_frames_in,
         batch_frames_out=args.batch_frames_out,
         batch_frames_inout=args.batch_frames_inout,
+        batch_bytes=getattr(args, "batch_bytes", 0),
         iaxis=0,
         oaxis=0,
     )
 
+    feat_cache_size = getattr(args, "feat_cache_size", 0)
+    n_loader_threads = getattr(args, "n_loader_threads", 0)
+    n_prefetch = getattr(args, "n_prefetch", 0)
+    if getattr(args, "noise_mix_conf", None):
+        noise_mixer = NoiseMixer.from_conf(args.noise_mix_conf, seed=args.seed)
+        logging.info("mix noise into the training data: {}".format(noise_mixer))
+    else:
+        noise_mixer = None
     load_tr = LoadInputsAndTargets(
         mode="asr",
         load_output=True,
         preprocess_conf=args.preprocess_conf,
         preprocess_args={"train": True},  # Switch the mode of preprocessing
+        keep_all_data_on_mem=feat_cache_size > 0,
+        cache_size=feat_cache_size * 1024 * 1024,
+        cache_modalities=["rms", "mfcc", "aRMs", "vRMs", "AUs"],
+        num_threads=n_loader_threads,
+        noise_mixer=noise_mixer,
     )
     load_cv = LoadInputsAndTargets(
         mode="asr",
         load_output=True,
         preprocess_conf=args.preprocess_conf,
         preprocess_args={"train": False},  # Switch the mode of preprocessing
+        keep_all_data_on_mem=feat_cache_size > 0,
+        cache_size=feat_cache_size * 1024 * 1024,
+        num_threads=n_loader_threads,
     )
+    if feat_cache_size > 0:
+        # load before the iterator processes are forked, so that they share it
+        load_cv.preload(valid)
     # hack to make batchsize argument as 1
     # actual bathsize is included in a list
     if args.n_iter_processes > 0:
@@ -654,6 +730,9 @@ def train(args):
         valid_iter = ToggleableShufflingSerialIterator(
             TransformDataset(valid, load_cv), batch_size=1, repeat=False, shuffle=False
         )
+        if n_prefetch > 0:
+            train_iter = PrefetchIterator(train_iter, n_prefetch)
+            valid_iter = PrefetchIterator(valid_iter, n_prefetch)
 
     # Set up a trainer
     updater = CustomUpdater(
@@ -916,6 +995,9 @@ def recog(args):
     # read json data
     with open(args.recog_json, "rb") as f:
         js = json.load(f)["utts"]
+    if args.recog_filter is not None:
+        conditions = load_condition_index(args.recog_condition_index)
+        js = select_utts(js, conditions, args.recog_filter)
     new_js = {}
 
     load_inputs_and_targets = LoadInputsAndTargets(
@@ -1010,7 +1092,7 @@ def recog(args):
         # sort data if batchsize > 1
         keys = list(js.keys())
         if args.batchsize > 1:
-            feat_lens = [js[key]["input"][0]["shape"][0] for key in keys]
+            feat_lens = [js[key]["input"][0]["ashape"][0] for key in keys]
             sorted_index = sorted(range(len(feat_lens)), key=lambda i: -feat_lens[i])
             keys = [keys[i] for i in sorted_index]
 
@@ -1018,17 +1100,13 @@ def recog(args):
             for names in grouper(args.batchsize, keys, None):
                 names = [name for name in names if name]
                 batch = [(name, js[name]) for name in names]
-                feats = (
-                    load_inputs_and_targets(batch)[0]
-                    if args.num_encs == 1
-                    else load_inputs_and_targets(batch)
-                )
+                afeats, vfeats, rms = load_inputs_and_targets(batch)
                 if args.streaming_mode == "window" and args.num_encs == 1:
                     raise NotImplementedError
                 elif args.streaming_mode == "segment" and args.num_encs == 1:
                     if args.batchsize > 1:
                         raise NotImplementedError
-                    feat = feats[0]
+                    feat = afeats[0]
                     nbest_hyps = []
                     for n in range(args.nbest):
                         nbest_hyps.append({"yseq": [], "score": 0.0})
@@ -1056,7 +1134,7 @@ def recog(args):
                     nbest_hyps = [nbest_hyps]
                 else:
                     nbest_hyps = model.recognize_batch(
-                        feats, args, train_args.char_list, rnnlm=rnnlm
+                        afeats, vfeats, rms, args, train_args.char_list, rnnlm=rnnlm
                     )
 
                 for i, nbest_hyp in enumerate(nbest_hyps):
@@ -81,6 +81,19 @@ v2: Experimental API. It supports any models that implements ScorerInterface."""
         type=str,
         help="Filename of recognition data (json)",
     )
+    parser.add_argument(
+        "--recog-condition-index",
+        default=None,
+        type=str,
+        help="Condition index of the recognition data, written by splitsnr.py",
+    )
+    parser.add_argument(
+        "--recog-filter",
+        default=None,
+        type=str,
+        help="Decode only the utterances whose conditions match, "
+        'e.g. "snr=-12,-9 video=None" (requires --recog-condition-index)',
+    )
     parser.add_argument(
         "--result-label",
         default=True,
@@ -205,6 +218,8 @@ def main(args):
 
     if args.ngpu == 0 and args.dtype == "float16":
         raise ValueError(f"--dtype {args.dtype} does not support the CPU backend.")
+    if args.recog_filter is not None and args.recog_condition_index is None:
+        raise ValueError("--recog-filter requires --recog-condition-index.")
 
     # logging info
     if args.verbose == 1:
@@ -16,7 +16,7 @@ import sys
 import configargparse
 import numpy as np
 from espnet.utils.cli_utils import strtobool
-from espnet.utils.training.batchfy import BATCH_COUNT_CHOICES
+from espnet.finetuneav.batchfy import BATCH_COUNT_CHOICES
 
 
 # NOTE: you need this func to generate our sphinx doc
@@ -61,7 +61,7 @@ def get_parser(parser=None, required=True):
     parser.add_argument(
         "--train-dtype",
         default="float32",
-        choices=["float16", "float32", "float64", "O0", "O1", "O2", "O3"],
+        choices=["float16", "bfloat16", "float32", "float64", "O0", "O1", "O2", "O3"],
         help="Data type for training (only pytorch backend). "
         "O0,O1,.. flags require apex. See "
         "https://nvidia.github.io/apex/amp.html#opt-levels",
@@ -125,13 +125,15 @@ def get_parser(parser=None, required=True):
         "--train-json",
         required=True,
         type=str,
-        help="Filename of train label data (json)",
+        help="Filename of train label data (json, or its .npz catalog "
+        "built by dump/avcatalogdump.py)",
     )
     parser.add_argument(
         "--valid-json",
         required=True,
         type=str,
-        help="Filename of validation label data (json)",
+        help="Filename of validation label data (json, or its .npz catalog "
+        "built by dump/avcatalogdump.py)",
     )
     ##############################################################################
     # network architecture
@@ -261,6 +263,14 @@ def get_parser(parser=None, required=True):
         type=int,
         help="Maximum input+output frames in a minibatch (0 to disable)",
     )
+    parser.add_argument(
+        "--batch-bytes",
+        default=0,
+        type=int,
+        help="Maximum bytes of the padded audio, video, reliability measure and "
+        "target tensors in a minibatch (0 to disable). Used with --batch-count "
+        "byte, or auto when batch size, bins and frames are 0",
+    )
     parser.add_argument(
         "--maxlen-in",
         "--batch-seq-maxlen-in",
@@ -285,6 +295,36 @@ def get_parser(parser=None, required=True):
         type=int,
         help="Number of processes of iterator",
     )
+    parser.add_argument(
+        "--feat-cache-size",
+        default=0,
+        type=int,
+        help="Memory budget in MB of the feature cache of each data loader "
+        "(0 = no cache). The validation data is preloaded, the training data "
+        "only caches the reliability measures",
+    )
+    parser.add_argument(
+        "--n-loader-threads",
+        default=0,
+        type=int,
+        help="Number of threads reading the inputs of a mini-batch concurrently",
+    )
+    parser.add_argument(
+        "--n-prefetch",
+        default=0,
+        type=int,
+        help="Number of mini-batches assembled ahead of the updater by a "
+        "background thread when --n-iter-processes is 0 (0 = no prefetching)",
+    )
+    parser.add_argument(
+        "--noise-mix-conf",
+        default=None,
+        type=str,
+        help="Json configuration of the noise mixed into the clean training "
+        "utterances while loading, see espnet.finetuneav.noisemix.NoiseMixer. "
+        "The audio reliability measure is then the oracle SNR. The noise is seeded "
+        "by --seed",
+    )
     parser.add_argument(
         "--preprocess-conf",
         type=str,
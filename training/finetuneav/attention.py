@@ -28,26 +28,44 @@ class MultiHeadedAttention(nn.Module):
         self.attn = None
         self.dropout = nn.Dropout(p=dropout_rate)
 
-    def forward(self, query, key, value, mask, rmvalue):
+    def forward_kv(self, key, value, rmvalue):
+        """Project the memory side of the attention
+
+        :param torch.Tensor key: (batch, time2, size)
+        :param torch.Tensor value: (batch, time2, size)
+        :param torch.Tensor rmvalue: (batch, time2, size)
+        :return tuple: projected `key`, `value` and `rmvalue`,
+             each (batch, head, time2, d_k)
+        """
+        n_batch = key.size(0)
+        k = self.linear_k(key).view(n_batch, -1, self.h, self.d_k)
+        v = self.linear_v(value).view(n_batch, -1, self.h, self.d_k)
+        rmv = self.linear_rmv(rmvalue).view(n_batch, -1, self.h, self.d_k)
+        k = k.transpose(1, 2)  # (batch, head, time2, d_k)
+        v = v.transpose(1, 2)  # (batch, head, time2, d_k)
+        rmv = rmv.transpose(1, 2)  # (batch, head, time2, d_k)
+        return k, v, rmv
+
+    def forward(self, query, key, value, mask, rmvalue, memory_cache=None):
         """Compute 'Scaled Dot Product Attention'
 
         :param torch.Tensor query: (batch, time1, size)
         :param torch.Tensor key: (batch, time2, size)
         :param torch.Tensor value: (batch, time2, size)
         :param torch.Tensor mask: (batch, time1, time2)
-        :param torch.nn.Dropout dropout:
+        :param torch.Tensor rmvalue: (batch, time2, size)
+        :param tuple memory_cache: output of `forward_kv` for the same memory.
+             If given, `key`, `value` and `rmvalue` are not projected again.
         :return torch.Tensor: attentined and transformed `value` (batch, time1, d_model)
              weighted by the query dot key attention (batch, head, time1, time2)
         """
         n_batch = query.size(0)
         q = self.linear_q(query).view(n_batch, -1, self.h, self.d_k)
-        k = self.linear_k(key).view(n_batch, -1, self.h, self.d_k)
-        v = self.linear_v(value).view(n_batch, -1, self.h, self.d_k)
-        rmv = self.linear_rmv(rmvalue).view(n_batch, -1, self.h, self.d_k)
         q = q.transpose(1, 2)  # (batch, head, time1, d_k)
-        k = k.transpose(1, 2)  # (batch, head, time2, d_k)
-        v = v.transpose(1, 2)  # (batch, head, time2, d_k)
-        rmv = rmv.transpose(1, 2)  # (batch, head, time2, d_k)
+        if memory_cache is None:
+            k, v, rmv = self.forward_kv(key, value, rmvalue)
+        else:
+            k, v, rmv = memory_cache
 
         scores = torch.matmul(q, k.transpose(-2, -1)) / math.sqrt(
             self.d_k
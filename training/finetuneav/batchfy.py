@@ -3,6 +3,8 @@ import logging
 
 import numpy as np
 
+from espnet.finetuneav.catalog import UtteranceCatalog
+
 
 def batchfy_by_seq(
     sorted_data,
@@ -288,6 +290,145 @@ def batchfy_by_frame(
     return minibatches
 
 
+# bytes of one element of the padded inputs (float32) and targets (int64)
+FEAT_BYTES = 4
+TOKEN_BYTES = 8
+# dimension of the reliability measures built by io_utils.make_rms
+RMS_DIM = 18
+
+
+def utterance_bytes(info, ikey="input", okey="output"):
+    """Return the bytes of the padded streams of one utterance
+
+    The streams are the audio features, the video frames, the reliability
+    measures and the target tokens, as they are padded by CustomConverter.
+
+    :param Dict[str, Any] info: utterance entry of data.json
+    :param str ikey: key to access input
+    :param str okey: key to access output
+    :return: bytes of each stream (4,)
+    :rtype: np.ndarray
+    """
+    inp = info[ikey][0]
+    rmsshape = inp.get("rmsshape", [inp["ashape"][0], RMS_DIM])
+    return np.array(
+        [
+            np.prod(inp["ashape"]) * FEAT_BYTES,
+            np.prod(inp["vshape"]) * FEAT_BYTES,
+            np.prod(rmsshape) * FEAT_BYTES,
+            int(info[okey][0]["shape"][0]) * TOKEN_BYTES,
+        ],
+        dtype=np.int64,
+    )
+
+
+def padding_ratio(minibatches, ikey="input", okey="output"):
+    """Return the fraction of the padded bytes of a batch set which is padding
+
+    The utterances of a batch are padded to the longest one of each stream.
+
+    :param List[List[Tuple[str, dict]]] minibatches: list of batches
+    :param str ikey: key to access input
+    :param str okey: key to access output
+    :return: padding ratio
+    :rtype: float
+    """
+    used = 0
+    padded = 0
+    for minibatch in minibatches:
+        sizes = np.stack([utterance_bytes(info, ikey, okey) for _, info in minibatch])
+        used += sizes.sum()
+        padded += sizes.max(0).sum() * len(minibatch)
+    return 1.0 - used / padded if padded > 0 else 0.0
+
+
+def batchfy_by_byte(
+    sorted_data,
+    batch_bytes,
+    num_batches=0,
+    min_batch_size=1,
+    shortest_first=False,
+    ikey="input",
+    okey="output",
+):
+    """Make variably sized batch set, which maximizes the bytes of the padded
+    audio, video, reliability measure and target tensors up to `batch_bytes`.
+
+    Unlike `batchfy_by_bin`, the video frames are counted with all their pixels,
+    so a batch of long utterances is as large in memory as one of short ones.
+    The data is sorted by length, so consecutive utterances are batched to keep
+    the padding small.
+
+    :param Dict[str, Dict[str, Any]] sorted_data: dictionary loaded from data.json
+    :param int batch_bytes: Maximum bytes of a batch
+    :param int num_batches: # number of batches to use (for debug)
+    :param int min_batch_size: minimum batch size (for multi-gpu)
+    :param bool shortest_first: Sort from batch with shortest samples to longest
+                                if true, otherwise reverse
+
+    :param str ikey: key to access input
+    :param str okey: key to access output
+
+    :return: List[Tuple[str, Dict[str, List[Dict[str, Any]]]] list of batches
+    """
+    if batch_bytes <= 0:
+        raise ValueError(f"invalid batch_bytes={batch_bytes}")
+    length = len(sorted_data)
+    sizes = [utterance_bytes(info, ikey, okey) for _, info in sorted_data]
+    minibatches = []
+    start = 0
+    while True:
+        # Dynamic batch size depending on the padded size of samples
+        b = 0
+        max_sizes = np.zeros(4, dtype=np.int64)
+        while (start + b) < length:
+            next_max_sizes = np.maximum(max_sizes, sizes[start + b])
+            if next_max_sizes.sum() * (b + 1) > batch_bytes:
+                break
+            max_sizes = next_max_sizes
+            b += 1
+        if b == 0:
+            raise ValueError(
+                f"Can't fit one sample in batch_bytes ({batch_bytes}): \
+                Please increase the value"
+            )
+        end = min(length, start + max(min_batch_size, b))
+        batch = sorted_data[start:end]
+        if shortest_first:
+            batch.reverse()
+        minibatches.append(batch)
+        # Check for min_batch_size and fixes the batches if needed
+        i = -1
+        while len(minibatches[i]) < min_batch_size:
+            missing = min_batch_size - len(minibatches[i])
+            if -i == len(minibatches):
+                minibatches[i + 1].extend(minibatches[i])
+                minibatches = minibatches[1:]
+                break
+            else:
+                minibatches[i].extend(minibatches[i - 1][:missing])
+                minibatches[i - 1] = minibatches[i - 1][missing:]
+                i -= 1
+        if end == length:
+            break
+        start = end
+    if num_batches > 0:
+        minibatches = minibatches[:num_batches]
+    lengths = [len(x) for x in minibatches]
+    logging.info(
+        str(len(minibatches))
+        + " batches containing from "
+        + str(min(lengths))
+        + " to "
+        + str(max(lengths))
+        + " samples "
+        + "(avg "
+        + str(int(np.mean(lengths)))
+        + " samples)."
+    )
+    return minibatches
+
+
 def batchfy_shuffle(data, batch_size, min_batch_size, num_batches, shortest_first):
     import random
 
@@ -323,7 +464,7 @@ def batchfy_shuffle(data, batch_size, min_batch_size, num_batches, shortest_firs
     return minibatches
 
 
-BATCH_COUNT_CHOICES = ["auto", "seq", "bin", "frame"]
+BATCH_COUNT_CHOICES = ["auto", "seq", "bin", "frame", "byte"]
 BATCH_SORT_KEY_CHOICES = ["input", "output", "shuffle"]
 
 
@@ -343,6 +484,7 @@ def make_batchset(
     batch_frames_in=0,
     batch_frames_out=0,
     batch_frames_inout=0,
+    batch_bytes=0,
     iaxis=0,
     oaxis=0,
 ):
@@ -360,12 +502,15 @@ def make_batchset(
     Note that if any utts doesn't have "category",
     perform as same as batchfy_by_{count}
 
-    :param Dict[str, Dict[str, Any]] data: dictionary loaded from data.json
+    :param Union[Dict[str, Dict[str, Any]], UtteranceCatalog] data: dictionary
+        loaded from data.json, or its catalog
     :param int batch_size: maximum number of sequences in a minibatch.
     :param int batch_bins: maximum number of bins (frames x dim) in a minibatch.
     :param int batch_frames_in:  maximum number of input frames in a minibatch.
     :param int batch_frames_out: maximum number of output frames in a minibatch.
     :param int batch_frames_out: maximum number of input+output frames in a minibatch.
+    :param int batch_bytes: maximum bytes of the padded audio, video, reliability
+        measure and target tensors in a minibatch.
     :param str count: strategy to count maximum size of batch.
         For choices, see espnet.asr.batchfy.BATCH_COUNT_CHOICES
 
@@ -429,38 +574,64 @@ def make_batchset(
             count = "bin"
         elif batch_frames_in != 0 or batch_frames_out != 0 or batch_frames_inout != 0:
             count = "frame"
+        elif batch_bytes != 0:
+            count = "byte"
         else:
             raise ValueError(
                 f"cannot detect `count` manually set one of {BATCH_COUNT_CHOICES}"
             )
         logging.info(f"count is auto detected as {count}")
+    if batch_bytes != 0 and count != "byte":
+        logging.warning(
+            f"batch_bytes={batch_bytes} is ignored, as batches are counted by "
+            f"{count}. Set batch_count=byte, or batch_size, batch_bins and "
+            "batch_frames_* to 0"
+        )
 
     if count != "seq" and batch_sort_key == "shuffle":
         raise ValueError(f"batch_sort_key=shuffle is only available if batch_count=seq")
 
-    category2data = {}  # Dict[str, dict]
-    for k, v in data.items():
-        category2data.setdefault(v.get("category"), {})[k] = v
+    category2data = {}  # Dict[str, Union[dict, np.ndarray]]
+    if isinstance(data, UtteranceCatalog):
+        # index arrays of the catalog, the entries are only built for the
+        # utterances which are kept
+        categories, first = np.unique(data.category, return_index=True)
+        for category in categories[np.argsort(first)]:
+            category2data[category] = np.flatnonzero(data.category == category)
+    else:
+        for k, v in data.items():
+            category2data.setdefault(v.get("category"), {})[k] = v
 
     batches_list = []  # List[List[List[Tuple[str, dict]]]]
     for d in category2data.values():
         if batch_sort_key == "shuffle":
+            if isinstance(data, UtteranceCatalog):
+                d = dict(data.item(i) for i in d)
             batches = batchfy_shuffle(
                 d, batch_size, min_batch_size, num_batches, shortest_first
             )
             batches_list.append(batches)
             continue
 
-        # sort it by input lengths (long to short)
-        sorted_data = sorted(
-            d.items(),
-            key=lambda data: int(data[1][batch_sort_key][batch_sort_axis]["vshape"][0]),
-            reverse=not shortest_first,
-        )
-        datanew = []
-        for i in sorted_data:
-            if i[1]["input"][0]["ashape"][0] > 10:
-                datanew.append(i)
+        if isinstance(data, UtteranceCatalog):
+            d = d[data.shapes["ashape"][d, 0] > 10]
+            vlens = data.shapes["vshape"][d, 0]
+            # sort it by input lengths (long to short), stable as sorted()
+            order = np.argsort(vlens if shortest_first else -vlens, kind="stable")
+            datanew = [data.item(i) for i in d[order]]
+        else:
+            # sort it by input lengths (long to short)
+            sorted_data = sorted(
+                d.items(),
+                key=lambda data: int(
+                    data[1][batch_sort_key][batch_sort_axis]["vshape"][0]
+                ),
+                reverse=not shortest_first,
+            )
+            datanew = []
+            for i in sorted_data:
+                if i[1]["input"][0]["ashape"][0] > 10:
+                    datanew.append(i)
 
         logging.info("# utts: " + str(len(datanew)))
         if count == "seq":
@@ -496,6 +667,15 @@ def make_batchset(
                 ikey=ikey,
                 okey=okey,
             )
+        if count == "byte":
+            batches = batchfy_by_byte(
+                datanew,
+                batch_bytes=batch_bytes,
+                min_batch_size=min_batch_size,
+                shortest_first=shortest_first,
+                ikey=ikey,
+                okey=okey,
+            )
         batches_list.append(batches)
 
     if len(batches_list) == 1:
@@ -508,6 +688,9 @@ def make_batchset(
     if num_batches > 0:
         batches = batches[:num_batches]
     logging.info("# minibatches: " + str(len(batches)))
+    logging.info(
+        "padding ratio: {:.3f}".format(padding_ratio(batches, ikey=ikey, okey=okey))
+    )
 
     # batch: List[List[Tuple[str, dict]]]
     return batches
@@ -0,0 +1,191 @@
+from collections.abc import Mapping
+import json
+import logging
+
+import numpy as np
+
+# input modalities whose file paths are kept in the catalog
+MODALITIES = ["afeat", "vfeat", "rms", "mfcc", "aRMs", "vRMs", "AUs"]
+
+
+def split_path(path):
+    """Split a path after its last ":" or "/", e.g. "feats.ark:123" into
+    "feats.ark:" and "123", so the common prefixes are stored only once"""
+    cut = max(path.rfind(":"), path.rfind("/")) + 1
+    return path[:cut], path[cut:]
+
+
+class UtteranceCatalog(Mapping):
+    """Columnar catalog of the utterances of a data.json file
+
+    The shapes are kept in integer arrays, the file paths as indices into a
+    table of path prefixes plus their suffixes, and the token ids of all targets
+    in one flat array with the offsets of each utterance, so the catalog is
+    loaded without parsing json or token id strings. It maps each utterance id
+    to the same dict as data.json, built when the utterance is looked up, with
+    "tokenid" given as an int64 array. Only one input and one output per
+    utterance are supported, and the fields not read for training, e.g.
+    "text", are dropped.
+
+    >>> catalog = UtteranceCatalog.from_utts(json.load(f)["utts"])
+    >>> catalog.save("dump/train/data_unigram5000.npz")
+    >>> catalog = UtteranceCatalog.load("dump/train/data_unigram5000.npz")
+    >>> catalog.shapes["vshape"][:, 0]  # number of video frames
+    >>> catalog["utt1"]["output"][0]["tokenid"]
+    array([1, 2, 3])
+
+    :param dict arrays: arrays of the catalog, as written by `save`
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.uttids = arrays["uttids"]
+        self.category = arrays["category"]
+        self.shapes = {
+            key[len("shape_") :]: value
+            for key, value in arrays.items()
+            if key.startswith("shape_")
+        }
+        self.modalities = [
+            key[len("prefixes_") :] for key in arrays if key.startswith("prefixes_")
+        ]
+        self.tokens = arrays["tokens"]
+        self.token_offsets = arrays["token_offsets"]
+        self.input_name = str(arrays["input_name"])
+        self.output_name = str(arrays["output_name"])
+        self._index = {str(uttid): i for i, uttid in enumerate(self.uttids)}
+
+    @classmethod
+    def from_utts(cls, utts):
+        """Build the catalog from the "utts" of a data.json file
+
+        :param dict utts: utterances loaded from data.json
+        :return: catalog
+        :rtype: UtteranceCatalog
+        """
+        uttids = list(utts)
+        infos = [utts[uttid] for uttid in uttids]
+        inps = [info["input"][0] for info in infos]
+        outs = [info["output"][0] for info in infos]
+        arrays = {
+            "uttids": np.array(uttids, dtype=np.str_),
+            "category": np.array(
+                [info.get("category", "") for info in infos], dtype=np.str_
+            ),
+            "input_name": np.array(inps[0].get("name", "input1")),
+            "output_name": np.array(outs[0].get("name", "target1")),
+        }
+
+        # shapes, which must be given with the same rank for all utterances
+        for key, value in inps[0].items():
+            if not key.endswith("shape") or not isinstance(value, list):
+                continue
+            shapes = [inp.get(key) for inp in inps]
+            if any(shape is None or len(shape) != len(value) for shape in shapes):
+                logging.warning("%s is not given for all utterances, skipped", key)
+                continue
+            arrays["shape_" + key] = np.array(shapes, dtype=np.int64)
+        arrays["shape_oshape"] = np.array(
+            [out["shape"] for out in outs], dtype=np.int64
+        )
+
+        # file paths and loader types
+        for name in MODALITIES + ["filetype"]:
+            if not any(name in inp for inp in inps):
+                continue
+            prefix_table = {}
+            prefix_ids = []
+            suffixes = []
+            for inp in inps:
+                if name not in inp:
+                    prefix_ids.append(-1)
+                    suffixes.append("")
+                    continue
+                prefix, suffix = split_path(inp[name])
+                prefix_ids.append(prefix_table.setdefault(prefix, len(prefix_table)))
+                suffixes.append(suffix)
+            arrays["prefixes_" + name] = np.array(list(prefix_table), dtype=np.str_)
+            arrays["prefix_ids_" + name] = np.array(prefix_ids, dtype=np.int32)
+            arrays["suffixes_" + name] = np.array(suffixes, dtype=np.str_)
+
+        # token ids
+        if not all("tokenid" in out for out in outs):
+            raise ValueError("The catalog needs the tokenid of all utterances")
+        tokens = [np.array(out["tokenid"].split(), dtype=np.int64) for out in outs]
+        arrays["token_offsets"] = np.cumsum([0] + [len(t) for t in tokens])
+        arrays["tokens"] = (
+            np.concatenate(tokens) if tokens else np.zeros(0, dtype=np.int64)
+        )
+        return cls(arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Load a catalog saved by `save`
+
+        :param str path: path of the .npz file
+        :return: catalog
+        :rtype: UtteranceCatalog
+        """
+        with np.load(path) as f:
+            return cls({key: f[key] for key in f.files})
+
+    def save(self, path):
+        """Save the catalog
+
+        :param str path: path of the .npz file
+        """
+        np.savez(path, **self.arrays)
+
+    def info(self, i):
+        """Build the data.json entry of the i-th utterance
+
+        :param int i: index of the utterance
+        :return: utterance entry with the keys "input" and "output"
+        :rtype: dict
+        """
+        inp = {"name": self.input_name}
+        for name in self.modalities:
+            prefix_id = self.arrays["prefix_ids_" + name][i]
+            if prefix_id >= 0:
+                inp[name] = str(self.arrays["prefixes_" + name][prefix_id]) + str(
+                    self.arrays["suffixes_" + name][i]
+                )
+        for key, shapes in self.shapes.items():
+            if key != "oshape":
+                inp[key] = shapes[i].tolist()
+        out = {
+            "name": self.output_name,
+            "shape": self.shapes["oshape"][i].tolist(),
+            "tokenid": self.tokens[self.token_offsets[i] : self.token_offsets[i + 1]],
+        }
+        info = {"input": [inp], "output": [out]}
+        if self.category[i]:
+            info["category"] = str(self.category[i])
+        return info
+
+    def item(self, i):
+        """Return the utterance id and the data.json entry of the i-th utterance"""
+        return str(self.uttids[i]), self.info(i)
+
+    def __getitem__(self, uttid):
+        return self.info(self._index[uttid])
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self.uttids)
+
+
+def load_utts(path):
+    """Load the utterances of a data.json file, or of a catalog if the path
+    ends with ".npz"
+
+    :param str path: path of data.json or of the catalog
+    :return: utterances
+    :rtype: Union[dict, UtteranceCatalog]
+    """
+    if path.endswith(".npz"):
+        return UtteranceCatalog.load(path)
+    with open(path, "rb") as f:
+        return json.load(f)["utts"]
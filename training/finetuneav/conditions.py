@@ -0,0 +1,82 @@
+import logging
+
+# name of the condition index in the directory of a test set dump
+CONDITION_INDEX = "conditions"
+
+
+def write_condition_index(path, conditions):
+    """Write the condition index of a dump
+
+    Each line is the utterance id followed by its conditions, e.g.
+    "LRS2_5535415699068794046_00001m-noise noise=noise snr=-12 video=None".
+
+    :param str path: path of the condition index
+    :param Dict[str, Dict[str, str]] conditions: conditions of each utterance
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        for uttid, condition in conditions.items():
+            f.write(
+                " ".join([uttid] + [k + "=" + str(v) for k, v in condition.items()])
+                + "\n"
+            )
+
+
+def load_condition_index(path):
+    """Load the condition index written by `write_condition_index`
+
+    :param str path: path of the condition index
+    :return: conditions of each utterance
+    :rtype: Dict[str, Dict[str, str]]
+    """
+    conditions = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            uttid, *items = line.split()
+            conditions[uttid] = dict(item.split("=", 1) for item in items)
+    return conditions
+
+
+def parse_condition_filter(expr):
+    """Parse a condition filter
+
+    The filter is a list of terms separated by spaces, which must all hold.
+    A term "key=value1,value2" holds if the condition `key` of an utterance is
+    one of the values, e.g. "snr=-12,-9 video=None".
+
+    :param str expr: filter expression
+    :return: allowed values of each condition
+    :rtype: Dict[str, Set[str]]
+    """
+    terms = {}
+    for term in expr.split():
+        if "=" not in term:
+            raise ValueError(f"invalid condition filter term: {term}")
+        key, values = term.split("=", 1)
+        terms[key] = set(values.split(","))
+    return terms
+
+
+def select_utts(utts, conditions, expr):
+    """Select the utterances whose conditions match a filter
+
+    :param dict utts: utterances loaded from data.json
+    :param Dict[str, Dict[str, str]] conditions: condition index
+    :param str expr: filter expression, see `parse_condition_filter`
+    :return: matching utterances, in the order of `utts`
+    :rtype: dict
+    """
+    terms = parse_condition_filter(expr)
+    selected = {}
+    for uttid, info in utts.items():
+        condition = conditions.get(uttid)
+        if condition is None:
+            continue
+        if all(condition.get(key) in values for key, values in terms.items()):
+            selected[uttid] = info
+    logging.info(
+        "condition filter '%s' selects %d of %d utterances",
+        expr,
+        len(selected),
+        len(utts),
+    )
+    return selected
@@ -115,10 +115,11 @@ class CTC(torch.nn.Module):
 
         return self.loss
 
-    def log_softmax(self, aenc_output, venc_output, ctcinfo):
+    def log_softmax(self, aenc_output, venc_output, ctcinfo, hlens=None):
         """log_softmax of frame activations
 
         :param torch.Tensor hs_pad: 3d tensor (B, Tmax, eprojs)
+        :param List[int] hlens: lengths of the padded sequences (B)
         :return: log softmax applied 3d tensor (B, Tmax, odim)
         :rtype: torch.Tensor
         """
@@ -128,7 +129,7 @@ class CTC(torch.nn.Module):
             (torch.softmax(ays_hat, dim=-1), torch.softmax(vys_hat, dim=-1), ctcinfo),
             dim=-1,
         )
-        hs_pad = self.avctc_lo(catctcfeats)
+        hs_pad = self.avctc_lo(catctcfeats, hlens)
         return hs_pad
 
     def argmax(self, hs_pad):
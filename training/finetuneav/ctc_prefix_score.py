@@ -0,0 +1,140 @@
+import torch
+
+from espnet.nets.pytorch_backend.nets_utils import make_pad_mask
+
+
+class CTCPrefixScoreTH(object):
+    """Batch processing of the CTC prefix scores of the fused AV CTC posteriors
+
+    All live hypotheses of all utterances are scored at once for a set of
+    candidate labels, so a decoding step costs one vectorized recursion over
+    the frames instead of one recursion per hypothesis. The hypotheses are
+    stacked along the batch dimension and mapped to their utterance by
+    `utt_ids`, so the utterances may keep different numbers of hypotheses.
+    See also Seki et al. "Vectorized Beam Search for CTC-Attention-Based
+    Speech Recognition," In INTERSPEECH (pp. 3825-3829), 2019.
+
+    :param torch.Tensor x: CTC log posteriors (batch, maxlen_in, odim)
+    :param list xlens: input length of each utterance
+    :param int blank: blank label id
+    :param int eos: end-of-sequence id
+    :param int margin: number of frames kept around the attention peak,
+        0 computes the recursion over all frames
+    """
+
+    def __init__(self, x, xlens, blank, eos, margin=0):
+        self.logzero = -10000000000.0
+        self.blank = blank
+        self.eos = eos
+        self.margin = margin
+        self.input_length = x.size(1)
+        xlens = torch.as_tensor(xlens, device=x.device)
+        # the padded frames only emit blank, so they do not change the scores
+        pad_mask = make_pad_mask(xlens.tolist(), x[:, :, 0]).to(x.device)
+        x = x.masked_fill(pad_mask.unsqueeze(-1), self.logzero)
+        x[:, :, blank] = x[:, :, blank].masked_fill(pad_mask, 0.0)
+        self.x = x.transpose(0, 1)  # (maxlen_in, batch, odim)
+        self.end_frames = xlens - 1
+        if margin > 0:
+            self.frame_ids = torch.arange(
+                self.input_length, dtype=x.dtype, device=x.device
+            )
+
+    def initial_state(self):
+        """Get the initial state of one hypothesis per utterance
+
+        :return: forward probabilities (maxlen_in, 2, batch) of the empty prefix,
+            and the first and last attended frames
+        :rtype: tuple
+        """
+        r = self.x.new_full(
+            (self.input_length, 2, self.x.size(1)), self.logzero
+        )  # (maxlen_in, 2, batch)
+        r[:, 1] = torch.cumsum(self.x[:, :, self.blank], 0)
+        return r, 0, 1
+
+    def __call__(self, y, utt_ids, state, scoring_ids, att_w=None):
+        """Compute the CTC prefix scores of the candidate labels
+
+        :param torch.Tensor y: prefix label sequences including sos (n_hyps, len)
+        :param torch.Tensor utt_ids: utterance index of each hypothesis (n_hyps)
+        :param tuple state: state of the hypotheses
+        :param torch.Tensor scoring_ids: candidate labels (n_hyps, n_cands)
+        :param torch.Tensor att_w: source attention weights (n_hyps, maxlen_in)
+            used to decide the frame window if `margin` > 0
+        :return log_psi: prefix scores of the extended hypotheses (n_hyps, n_cands)
+        :rtype: torch.Tensor
+        :return new_state: state of the extended hypotheses
+        :rtype: tuple
+        """
+        r_prev, f_min_prev, f_max_prev = state
+        output_length = y.size(1) - 1  # ignore sos
+        n_hyps, n_cands = scoring_ids.size()
+
+        xs = self.x[:, utt_ids.unsqueeze(1), scoring_ids]  # (T, n_hyps, n_cands)
+        xb = self.x[:, utt_ids, self.blank].unsqueeze(2).expand_as(xs)
+        x_ = torch.stack([xs, xb], dim=1)  # (T, 2, n_hyps, n_cands)
+
+        # forward probabilities r_t^n(h) and r_t^b(h) of the extended prefixes
+        r = self.x.new_full((self.input_length, 2, n_hyps, n_cands), self.logzero)
+        if output_length == 0:
+            r[0, 0] = xs[0]
+
+        r_sum = torch.logsumexp(r_prev, 1)  # (T, n_hyps)
+        log_phi = r_sum.unsqueeze(2).repeat(1, 1, n_cands)
+        if output_length > 0:
+            is_repeat = scoring_ids == y[:, -1:]
+            log_phi = torch.where(
+                is_repeat.unsqueeze(0), r_prev[:, 1].unsqueeze(2), log_phi
+            )
+
+        # decide the frame window from the attention peaks
+        if att_w is not None and self.margin > 0:
+            f_arg = torch.matmul(att_w, self.frame_ids)
+            f_min = max(int(f_arg.min()), f_min_prev)
+            f_max = max(int(f_arg.max()), f_max_prev)
+            start = min(f_max_prev, max(f_min - self.margin, output_length, 1))
+            end = min(f_max + self.margin, self.input_length)
+        else:
+            f_min, f_max = f_min_prev, f_max_prev
+            start = max(output_length, 1)
+            end = self.input_length
+
+        for t in range(start, end):
+            rp = r[t - 1]
+            rr = torch.stack([rp[0], log_phi[t - 1], rp[0], rp[1]]).view(
+                2, 2, n_hyps, n_cands
+            )
+            r[t] = torch.logsumexp(rr, 1) + x_[t]
+
+        # prefix probabilities psi
+        log_psi = torch.logsumexp(
+            torch.cat(
+                (log_phi[start - 1 : end - 1] + xs[start:end], r[start - 1, 0][None]),
+                dim=0,
+            ),
+            dim=0,
+        )
+        eos_scores = r_sum[
+            self.end_frames[utt_ids], torch.arange(n_hyps, device=r.device)
+        ]
+        log_psi = torch.where(scoring_ids == self.eos, eos_scores.unsqueeze(1), log_psi)
+        # exclude blank probs
+        log_psi = log_psi.masked_fill(scoring_ids == self.blank, self.logzero)
+
+        return log_psi, (r, f_min, f_max)
+
+    def index_select_state(self, state, hyp_ids, cand_ids=None):
+        """Select the states of the kept hypotheses
+
+        :param tuple state: state of the hypotheses
+        :param torch.Tensor hyp_ids: indices of the kept hypotheses
+        :param torch.Tensor cand_ids: indices of the chosen candidates,
+            if `state` was returned by `__call__`
+        :return: selected state
+        :rtype: tuple
+        """
+        r, f_min, f_max = state
+        if cand_ids is None:
+            return r[:, :, hyp_ids], f_min, f_max
+        return r[:, :, hyp_ids, cand_ids], f_min, f_max
@@ -4,51 +4,47 @@ from torch import nn
 import torch.nn.functional as F
 
 
-def cal_weights(attlogp, ctclogp, beam):
-    ctclogp, bestid = torch.sort(ctclogp, descending=True)
-    suminteratt = []
-    suminterctc = []
+def cal_weights(attlogp, ctclogp, beam, K=15):
+    """Calculate the dynamic attention and CTC stream weights
+
+    The weights are the mean of the entropy, dispersion and difference
+    weights of the attention and CTC log probabilities of the candidates.
+
+    :param torch.Tensor attlogp: attention log probabilities of the candidates,
+        sorted in descending order (B, beam)
+    :param torch.Tensor ctclogp: CTC log probabilities of the same candidates
+        (B, beam) or (beam)
+    :param int beam: number of candidates
+    :param int K: number of best candidates used for dispersion and difference
+    :return: attention and CTC weights (B, 1)
+    :rtype: Tuple[torch.Tensor, torch.Tensor]
+    """
+    if ctclogp.dim() == 1:
+        ctclogp = ctclogp.unsqueeze(0)
+    attlogp = attlogp[:, :beam]
+    ctclogp, bestid = torch.sort(ctclogp[:, :beam], dim=-1, descending=True)
 
     # Calculate entropy
-    attent = 0
-    ctcent = 0
-    for k in range(beam):
-        attent = attent + torch.exp(attlogp[:, k]) * attlogp[:, k]
-        ctcent = ctcent + torch.exp(ctclogp[k]) * ctclogp[k]
-    attent = 1 / (-attent)
-    ctcent = 1 / (-ctcent)
+    attent = 1 / -(torch.exp(attlogp) * attlogp).sum(-1, keepdim=True)
+    ctcent = 1 / -(torch.exp(ctclogp) * ctclogp).sum(-1, keepdim=True)
     sument = attent + ctcent
     entattw = attent / sument
     entctcw = ctcent / sument
 
-    # Calculate dispersion
-    K = 15
-    for s in range(K):
-        sumtemp = 0
-        for m in range(s + 1, K - 1):
-            sumtemp = sumtemp + (attlogp[:, s] - attlogp[:, m])
-        suminteratt.append(sumtemp)
-        sumtemp = 0
-        for m in range(s + 1, K - 1):
-            sumtemp = sumtemp + (ctclogp[s] - ctclogp[m])
-        suminterctc.append(sumtemp)
+    # Calculate dispersion, sum over s < m < K - 1 of (logp[s] - logp[m])
+    coef = K - 2 - 2 * torch.arange(K - 1, dtype=attlogp.dtype, device=attlogp.device)
     scale = 2 / (K * (K - 1))
-    attdis = scale * sum(suminteratt)
-    ctcdis = scale * sum(suminterctc)
+    attdis = scale * (attlogp[:, : K - 1] * coef).sum(-1, keepdim=True)
+    ctcdis = scale * (ctclogp[:, : K - 1] * coef).sum(-1, keepdim=True)
     sumdis = attdis + ctcdis
     disattw = attdis / sumdis
     disctcw = ctcdis / sumdis
 
     # Calculate difference
-    maxatt = max(attlogp[0, :])
-    maxctc = max(ctclogp)
-    attdiff = 0
-    ctcdiff = 0
-    for j in range(1, K):
-        attdiff = attdiff + abs(maxatt - attlogp[:, j])
-        ctcdiff = ctcdiff + abs(maxctc - ctclogp[j])
-    attdiff = 1 / (K - 1) * attdiff
-    ctcdiff = 1 / (K - 1) * ctcdiff
+    maxatt = attlogp.max(-1, keepdim=True)[0]
+    maxctc = ctclogp[:, :1]
+    attdiff = (maxatt - attlogp[:, 1:K]).abs().mean(-1, keepdim=True)
+    ctcdiff = (maxctc - ctclogp[:, 1:K]).abs().mean(-1, keepdim=True)
     sumdiff = attdiff + ctcdiff
     diffattw = attdiff / sumdiff
     diffctcw = ctcdiff / sumdiff
@@ -148,6 +148,76 @@ class Decoder(ScorerInterface, torch.nn.Module):
         else:
             return x_
 
+    def precompute_memory(self, memory, rmmemory):
+        """project the encoded memories once for all decoding steps
+
+        :param torch.Tensor memory: encoded memory, float32  (batch, maxlen_in, feat)
+        :param torch.Tensor rmmemory: encoded reliability memory,
+                                      float32  (batch, maxlen_in, feat)
+        :return: projected source attention memory of each decoder layer
+        :rtype: List[tuple]
+        """
+        return [
+            decoder.src_attn.forward_kv(memory, memory, rmmemory)
+            for decoder in self.decoders
+        ]
+
+    def forward_one_step(
+        self,
+        tgt,
+        tgt_mask,
+        memory,
+        rmmemory,
+        cache=None,
+        memory_cache=None,
+        memory_mask=None,
+    ):
+        """recognize one step with cached outputs of the previous steps
+
+        :param torch.Tensor tgt: input token ids, int64 (batch, maxlen_out)
+        :param torch.Tensor tgt_mask: input token mask, uint8  (batch, maxlen_out)
+        :param torch.Tensor memory: encoded memory, float32  (batch, maxlen_in, feat)
+        :param torch.Tensor rmmemory: encoded reliability memory,
+                                      float32  (batch, maxlen_in, feat)
+        :param List[torch.Tensor] cache: outputs of each decoder layer for the
+                                         previous step (batch, maxlen_out - 1, feat)
+        :param List[tuple] memory_cache: output of `precompute_memory`
+        :param torch.Tensor memory_mask: encoded memory mask, uint8  (batch, maxlen_in)
+        :return y: token probabilities of the last position (batch, token)
+        :rtype: torch.Tensor
+        :return rmx: reliability output of the last position (batch, feat)
+        :rtype: torch.Tensor
+        :return new_cache: outputs of each decoder layer (batch, maxlen_out, feat)
+        :rtype: List[torch.Tensor]
+        """
+        x = self.embed(tgt)
+        rmx = torch.zeros(x.size())
+        if cache is None:
+            cache = [None] * len(self.decoders)
+        if memory_cache is None:
+            memory_cache = [None] * len(self.decoders)
+        new_cache = []
+        for c, m, decoder in zip(cache, memory_cache, self.decoders):
+            x, tgt_mask, memory, memory_mask, rmmemory, rmx = decoder(
+                x,
+                tgt_mask,
+                memory,
+                memory_mask,
+                rmmemory,
+                rmx,
+                cache=c,
+                memory_cache=m,
+            )
+            new_cache.append(x)
+
+        if self.normalize_before:
+            y = self.after_norm(x[:, -1])
+        else:
+            y = x[:, -1]
+        if self.output_layer is not None:
+            y = torch.softmax(self.output_layer(y), dim=-1)
+        return y, rmx[:, -1], new_cache
+
     # beam search API (see ScorerInterface)
     def score(self, ys, state, x):
         # TODO(karita) cache previous attentions in state
@@ -48,7 +48,17 @@ class DecoderLayer(nn.Module):
             self.concat_linear1 = nn.Linear(size + size, size)
             self.concat_linear2 = nn.Linear(size + size, size)
 
-    def forward(self, tgt, tgt_mask, memory, memory_mask, rmmemory, rmx):
+    def forward(
+        self,
+        tgt,
+        tgt_mask,
+        memory,
+        memory_mask,
+        rmmemory,
+        rmx,
+        cache=None,
+        memory_cache=None,
+    ):
         """Compute decoded features
 
         :param torch.Tensor tgt: decoded previous target features
@@ -56,17 +66,42 @@ class DecoderLayer(nn.Module):
         :param torch.Tensor tgt_mask: mask for x (batch, max_time_out)
         :param torch.Tensor memory: encoded source features (batch, max_time_in, size)
         :param torch.Tensor memory_mask: mask for memory (batch, max_time_in)
+        :param torch.Tensor rmmemory: encoded reliability features
+                                (batch, max_time_in, size)
+        :param torch.Tensor rmx: reliability output of the previous layer
+        :param torch.Tensor cache: outputs of this layer for all but the last
+                                target position (batch, max_time_out - 1, size).
+                                If given, only the last position is computed.
+        :param tuple memory_cache: projected memory of the source attention,
+                                see `MultiHeadedAttention.forward_kv`
         """
         residual = tgt
         if self.normalize_before:
             tgt = self.norm1(tgt)
+
+        if cache is None:
+            tgt_q = tgt
+            tgt_q_mask = tgt_mask
+        else:
+            # compute only the last frame query keeping dim: max_time_out -> 1
+            assert cache.shape == (
+                tgt.shape[0],
+                tgt.shape[1] - 1,
+                self.size,
+            ), f"{cache.shape} == {(tgt.shape[0], tgt.shape[1] - 1, self.size)}"
+            tgt_q = tgt[:, -1:, :]
+            residual = residual[:, -1:, :]
+            tgt_q_mask = None
+            if tgt_mask is not None:
+                tgt_q_mask = tgt_mask[:, -1:, :]
+
         if self.concat_after:
             tgt_concat = torch.cat(
-                (tgt, self.self_attn(tgt, tgt, tgt, tgt_mask)), dim=-1
+                (tgt_q, self.self_attn(tgt_q, tgt, tgt, tgt_q_mask)), dim=-1
             )
             x = residual + self.concat_linear1(tgt_concat)
         else:
-            x = residual + self.dropout(self.self_attn(tgt, tgt, tgt, tgt_mask))
+            x = residual + self.dropout(self.self_attn(tgt_q, tgt, tgt, tgt_q_mask))
         if not self.normalize_before:
             x = self.norm1(x)
 
@@ -79,7 +114,9 @@ class DecoderLayer(nn.Module):
             )
             x = residual + self.concat_linear2(x_concat)
         else:
-            atten, rmx = self.src_attn(x, memory, memory, memory_mask, rmmemory)
+            atten, rmx = self.src_attn(
+                x, memory, memory, memory_mask, rmmemory, memory_cache=memory_cache
+            )
             x = residual + self.dropout(atten)
         if not self.normalize_before:
             x = self.norm2(x)
@@ -91,4 +128,7 @@ class DecoderLayer(nn.Module):
         if not self.normalize_before:
             x = self.norm3(x)
 
+        if cache is not None:
+            x = torch.cat([cache, x], dim=1)
+
         return x, tgt_mask, memory, memory_mask, rmmemory, rmx
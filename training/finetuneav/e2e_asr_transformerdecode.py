@@ -7,6 +7,7 @@ import logging
 import torch.nn.functional as F
 import math
 import numpy as np
+import six
 
 import torch
 import os
@@ -15,16 +16,19 @@ from espnet.finetuneav.ctc import CTC
 from espnet.nets.pytorch_backend.e2e_asr import CTC_LOSS_THRESHOLD
 from espnet.nets.pytorch_backend.e2e_asr import Reporter
 from espnet.nets.pytorch_backend.nets_utils import make_pad_mask
+from espnet.nets.pytorch_backend.nets_utils import pad_list
 from espnet.finetuneav.nets_utils import th_accuracy
 from espnet.nets.pytorch_backend.transformer.attention import MultiHeadedAttention
 from espnet.finetuneav.attention import MultiHeadedAttention as transfMultiHeadedAttention
 from espnet.finetuneav.weighttransfn import transformerNet
 from espnet.finetuneav.decoder import Decoder
 from espnet.nets.pytorch_backend.transformer.encoder import Encoder
+from espnet.finetuneav.lipreadingmodel import normalize_frames
 from espnet.finetuneav.videoencoder import Encoder as vEncoder
 from espnet.finetuneav.rmencoder import Encoder as rmEncoder
 from espnet.finetuneav.ctcencoder import Encoder as ctcEncoder
 from espnet.nets.pytorch_backend.transformer.initializer import initialize
+from espnet.nets.pytorch_backend.transformer.subsampling import Conv2dSubsampling
 from espnet.finetuneav.label_smoothing_loss import LabelSmoothingLoss
 from espnet.nets.pytorch_backend.transformer.mask import subsequent_mask
 from espnet.finetuneav.plot import PlotAttentionReport
@@ -363,218 +367,338 @@ class E2E(ASRInterface, torch.nn.Module):
         return avhs_output.squeeze(0)
 
 
-    def recognize(self, afeat, vfeat, rms, recog_args, char_list=None, rnnlm=None, use_jit=False):
+    def recognize(
+        self, afeat, vfeat, rms, recog_args, char_list=None, rnnlm=None, use_jit=False
+    ):
         '''recognize feat
 
-        :param ndnarray x: input acouctic feature (B, T, D) or (T, D)
+        :param ndnarray afeat: input acouctic feature (T, D)
+        :param ndnarray vfeat: input video frames (Tv, H, W)
+        :param ndnarray rms: input reliability measures (T, 18)
         :param namespace recog_args: argment namespace contraining options
         :param list char_list: list of characters
         :param torch.nn.Module rnnlm: language model module
         :return: N-best decoding results
         :rtype: list
-
-        TODO(karita): do not recompute previous attention for faster decoding
         '''
-        arms = rms[:, :11]
-        vrms = rms[:, -7:]
-        audiolength = len(afeat)#[0]
-        aenc_output = self.aencode(afeat).unsqueeze(0)
-        venc_output = self.vencode(vfeat, audiolength).unsqueeze(0)
-        arm_output = self.armencode(np.float32(arms)).unsqueeze(0)
-        vrm_output = self.vrmencode(np.float32(vrms)).unsqueeze(0)
-
-        ctcinfos = torch.cat((arm_output, vrm_output), dim=-1)
-
-
-        '''avenc_output = torch.unsqueeze(ctcweight[:, :, 0], 2).mul(aenc_output) + torch.unsqueeze(ctcweight[:, :, 1], 2).mul(venc_output)'''
-        actc_output = self.actcencode(aenc_output)
-        vctc_output = self.vctcencode(venc_output)
+        return self.recognize_batch(
+            [afeat], [vfeat], [rms], recog_args, char_list, rnnlm
+        )[0]
+
+    def recognize_batch(
+        self, afeats, vfeats, rms, recog_args, char_list=None, rnnlm=None
+    ):
+        '''recognize a batch of utterances with a joint beam search
+
+        :param list afeats: list of input acouctic features [(T_1, D), ...]
+        :param list vfeats: list of input video frames [(Tv_1, H, W), ...]
+        :param list rms: list of input reliability measures [(T_1, 18), ...]
+        :param namespace recog_args: argment namespace contraining options
+        :param list char_list: list of characters
+        :param torch.nn.Module rnnlm: language model module
+        :return: N-best decoding results of each utterance
+        :rtype: list
+        '''
+        self.eval()
+        device = next(self.parameters()).device
+        n_utt = len(afeats)
+        alens = [len(x) for x in afeats]
+        vlens = [len(x) for x in vfeats]
+
+        # 1. encode all streams of all utterances in one pass
+        axs_pad = pad_list([torch.as_tensor(x) for x in afeats], 0.0).to(device)
+        # uint8 frames are normalized before they are padded with zeros
+        vxs_pad = pad_list(
+            [normalize_frames(torch.as_tensor(x)) for x in vfeats], 0.0
+        ).to(device)
+        rms_pad = pad_list([torch.as_tensor(np.float32(x)) for x in rms], 0.0)
+        rms_pad = rms_pad.to(device)
+        if isinstance(self.aencoder.embed, Conv2dSubsampling):
+            # Conv2dSubsampling derives its output mask as
+            # mask[:, :, :-2:2][:, :, :-2:2], which keeps one padded frame per
+            # stage, so leave out the 6 frames consumed by the two convolutions
+            src_mask = ~make_pad_mask([alen - 6 for alen in alens], axs_pad[:, :, 0])
+        else:
+            src_mask = ~make_pad_mask(alens, axs_pad[:, :, 0])
+        src_mask = src_mask.unsqueeze(-2)
+        aenc_output, hs_mask = self.aencoder(axs_pad, src_mask)
+        venc_output, _ = self.vencoder(vxs_pad, src_mask, alens, vlens)
+        arm_output, _ = self.armencoder(rms_pad[:, :, :11], src_mask)
+        vrm_output, _ = self.vrmencoder(rms_pad[:, :, -7:], src_mask)
+        amemory_cache = self.adecoder.precompute_memory(aenc_output, arm_output)
+        vmemory_cache = self.vdecoder.precompute_memory(venc_output, vrm_output)
+        hlens = hs_mask.view(n_utt, -1).sum(1).tolist()
 
-        #avenc_output, _ = self.ctcencoders(avenc_output, None)
         if recog_args.ctc_weight > 0.0:
-            lpz = self.ctc.log_softmax(actc_output, vctc_output, ctcinfos)
-            lpz = lpz.squeeze(0)
+            actc_output, _ = self.actcencoder(aenc_output, hs_mask)
+            vctc_output, _ = self.vctcencoder(venc_output, hs_mask)
+            ctcinfos = torch.cat((arm_output, vrm_output), dim=-1)
+            lpz = self.ctc.log_softmax(actc_output, vctc_output, ctcinfos, hlens)
         else:
             lpz = None
 
-        h = venc_output.squeeze(0)
-
-        logging.info('input lengths: ' + str(h.size(0)))
+        logging.info('input lengths: ' + str(hlens))
         # search parms
         beam = recog_args.beam_size
         penalty = recog_args.penalty
         ctc_weight = recog_args.ctc_weight
 
-        # preprare sos
-        y = self.sos
-        vy = h.new_zeros(1).long()
-
         if recog_args.maxlenratio == 0:
-            maxlen = h.shape[0]
+            maxlens = hlens
         else:
             # maxlen >= 1
-            maxlen = max(1, int(recog_args.maxlenratio * h.size(0)))
-        minlen = int(recog_args.minlenratio * h.size(0))
-        logging.info('max output length: ' + str(maxlen))
-        logging.info('min output length: ' + str(minlen))
-
-        # initialize hypothesis
-        if rnnlm:
-            hyp = {'score': 0.0, 'yseq': [y], 'rnnlm_prev': None}
-        else:
-            hyp = {'score': 0.0, 'yseq': [y]}
+            maxlens = [max(1, int(recog_args.maxlenratio * h)) for h in hlens]
+        minlens = [int(recog_args.minlenratio * h) for h in hlens]
+        logging.info('max output length: ' + str(maxlens))
+        logging.info('min output length: ' + str(minlens))
+
+        # initialize hypotheses, the live hypotheses of all utterances are
+        # stacked along dim 0 and grouped by their utterance index
+        utt_ids = torch.arange(n_utt, device=device)
+        yseq = utt_ids.new_full((n_utt, 1), self.sos)
+        score = aenc_output.new_zeros(n_utt, dtype=torch.float64)
+        acache = None
+        vcache = None
+        rnnlm_state = None
         if lpz is not None:
-            import numpy
-
-            from espnet.nets.ctc_prefix_score import CTCPrefixScore
-
-            ctc_prefix_score = CTCPrefixScore(lpz.detach().numpy(), 0, self.eos, numpy)
-            hyp['ctc_state_prev'] = ctc_prefix_score.initial_state()
-            hyp['ctc_score_prev'] = 0.0
+            from espnet.finetuneav.ctc_prefix_score import CTCPrefixScoreTH
+
+            ctc_margin = getattr(recog_args, 'ctc_window_margin', 0)
+            ctc_prefix_score = CTCPrefixScoreTH(
+                lpz.detach(), hlens, 0, self.eos, ctc_margin
+            )
+            ctc_state_prev = ctc_prefix_score.initial_state()
+            ctc_score_prev = lpz.new_zeros(n_utt)
             if ctc_weight != 1.0:
                 # pre-pruning based on attention scores
                 from espnet.nets.pytorch_backend.rnn.decoders import CTC_SCORING_RATIO
+
                 ctc_beam = min(lpz.shape[-1], int(beam * CTC_SCORING_RATIO))
             else:
                 ctc_beam = lpz.shape[-1]
-        hyps = [hyp]
-        ended_hyps = []
+        ended_hyps = [[] for _ in six.moves.range(n_utt)]
 
-        import six
-        traced_decoder = None
-        for i in six.moves.range(maxlen):
+        for i in six.moves.range(max(maxlens)):
             logging.debug('position ' + str(i))
+            n_hyps = yseq.size(0)
 
-            hyps_best_kept = []
-            for hyp in hyps:
-                vy.unsqueeze(1)
-                vy[0] = hyp['yseq'][i]
-
-                # get nbest local scores and their ids
-                ys_mask = subsequent_mask(i + 1).unsqueeze(0)
-                ys = torch.tensor(hyp['yseq']).unsqueeze(0)
-                # FIXME: jit does not match non-jit result
-                if use_jit:
-                    if traced_decoder is None:
-                        traced_decoder = torch.jit.trace(self.decoder.recognize, (ys, ys_mask, enc_output))
-                    local_att_scores = traced_decoder(ys, ys_mask, enc_output)
+            # get local scores of all hypotheses at once
+            if n_utt > 1:
+                amemory = [tuple(m[utt_ids] for m in c) for c in amemory_cache]
+                vmemory = [tuple(m[utt_ids] for m in c) for c in vmemory_cache]
+                memory_mask = hs_mask[utt_ids]
+            else:
+                amemory = amemory_cache
+                vmemory = vmemory_cache
+                memory_mask = None
+            ys_mask = subsequent_mask(i + 1, device=device).unsqueeze(0)
+            a_att_scores, armpred, acache = self.adecoder.forward_one_step(
+                yseq,
+                ys_mask,
+                aenc_output,
+                arm_output,
+                cache=acache,
+                memory_cache=amemory,
+                memory_mask=memory_mask,
+            )
+            v_att_scores, vrmpred, vcache = self.vdecoder.forward_one_step(
+                yseq,
+                ys_mask,
+                venc_output,
+                vrm_output,
+                cache=vcache,
+                memory_cache=vmemory,
+                memory_mask=memory_mask,
+            )
+            cattransfeats = torch.cat(
+                (a_att_scores, v_att_scores, armpred, vrmpred), dim=-1
+            )
+            local_att_scores = self.transformerweightnets(cattransfeats)
+
+            if rnnlm:
+                rnnlm_state, local_lm_scores = rnnlm.buff_predict(
+                    rnnlm_state, yseq[:, -1], n_hyps
+                )
+                local_scores = local_att_scores + recog_args.lm_weight * local_lm_scores
+            else:
+                local_scores = local_att_scores
+
+            if lpz is not None:
+                local_best_scores, local_best_ids = torch.topk(
+                    local_att_scores, ctc_beam, dim=1
+                )
+                if ctc_margin > 0:
+                    # source attention of the last layer, averaged over the
+                    # heads of both streams
+                    att_w = (
+                        self.adecoder.decoders[-1].src_attn.attn[:, :, -1].mean(1)
+                        + self.vdecoder.decoders[-1].src_attn.attn[:, :, -1].mean(1)
+                    ) / 2
                 else:
-                    #local_att_scores = self.decoder.recognize(ys, ys_mask, aenc_output, venc_output, rm_output)
-                    #a_att_scores, aweight = self.adecoder.recognize(ys, ys_mask, aenc_output, rm_output)
-                    #v_att_scores, vweight = self.vdecoder.recognize(ys, ys_mask, venc_output, rm_output)
-                    a_att_scores, armpred = self.adecoder.recognize(ys, ys_mask, aenc_output, arm_output)
-                    v_att_scores, vrmpred = self.vdecoder.recognize(ys, ys_mask, venc_output, vrm_output)
-                    transinfos = torch.cat((armpred, vrmpred), -1)
-                    cattransfeats = torch.cat(
-                        (a_att_scores, v_att_scores, transinfos), dim=-1)
-                    local_att_scores = self.transformerweightnets(cattransfeats)
-
-
+                    att_w = None
+                ctc_scores, ctc_states = ctc_prefix_score(
+                    yseq, utt_ids, ctc_state_prev, local_best_ids, att_w
+                )
+                ctclog = ctc_scores - ctc_score_prev.unsqueeze(1)
+                attw, ctcw = cal_weights(local_best_scores, ctclog, ctc_beam)
+                local_scores = attw * local_best_scores + ctcw * ctclog
                 if rnnlm:
-                    rnnlm_state, local_lm_scores = rnnlm.predict(hyp['rnnlm_prev'], vy)
-                    local_scores = local_att_scores + recog_args.lm_weight * local_lm_scores
-                else:
-                    local_scores = local_att_scores
-
-                if lpz is not None:
-                    local_best_scores, local_best_ids = torch.topk(
-                        local_att_scores, ctc_beam, dim=1)
-                    ctc_scores, ctc_states = ctc_prefix_score(
-                        hyp['yseq'], local_best_ids[0], hyp['ctc_state_prev'])
-                    attlog = local_att_scores[:, local_best_ids[0]]
-                    ctclog = torch.from_numpy(ctc_scores - hyp['ctc_score_prev'])
-                    attw, ctcw = cal_weights(attlog, ctclog, ctc_beam)
-                    local_scores = \
-                        attw * local_att_scores[:, local_best_ids[0]] \
-                        + ctcw * torch.from_numpy(ctc_scores - hyp['ctc_score_prev'])
-                    if rnnlm:
-                        local_scores += recog_args.lm_weight * local_lm_scores[:, local_best_ids[0]]
-                    local_best_scores, joint_best_ids = torch.topk(local_scores, beam, dim=1)
-                    local_best_ids = local_best_ids[:, joint_best_ids[0]]
-                else:
-                    local_best_scores, local_best_ids = torch.topk(local_scores, beam, dim=1)
-
-                for j in six.moves.range(beam):
-                    new_hyp = {}
-                    new_hyp['score'] = hyp['score'] + float(local_best_scores[0, j])
-                    new_hyp['yseq'] = [0] * (1 + len(hyp['yseq']))
-                    new_hyp['yseq'][:len(hyp['yseq'])] = hyp['yseq']
-                    new_hyp['yseq'][len(hyp['yseq'])] = int(local_best_ids[0, j])
-                    if rnnlm:
-                        new_hyp['rnnlm_prev'] = rnnlm_state
-                    if lpz is not None:
-                        new_hyp['ctc_state_prev'] = ctc_states[joint_best_ids[0, j]]
-                        new_hyp['ctc_score_prev'] = ctc_scores[joint_best_ids[0, j]]
-                    # will be (2 x beam) hyps at most
-                    hyps_best_kept.append(new_hyp)
-
-                hyps_best_kept = sorted(
-                    hyps_best_kept, key=lambda x: x['score'], reverse=True)[:beam]
-
-            # sort and get nbest
-            hyps = hyps_best_kept
-            logging.debug('number of pruned hypothes: ' + str(len(hyps)))
+                    local_scores += recog_args.lm_weight * torch.gather(
+                        local_lm_scores, 1, local_best_ids
+                    )
+                local_best_scores, joint_best_ids = torch.topk(
+                    local_scores, beam, dim=1
+                )
+                local_best_ids = torch.gather(local_best_ids, 1, joint_best_ids)
+            else:
+                local_best_scores, local_best_ids = torch.topk(
+                    local_scores, beam, dim=1
+                )
+
+            # keep the best (beam) out of the (n_hyps x beam) expanded hypotheses
+            # of each utterance
+            expanded_scores = score.unsqueeze(1) + local_best_scores.double()
+            n_utt_hyps = torch.bincount(utt_ids, minlength=n_utt)
+            offsets = torch.cumsum(n_utt_hyps, 0) - n_utt_hyps
+            pos = torch.arange(n_hyps, device=device) - offsets[utt_ids]
+            beam_scores = expanded_scores.new_full(
+                (n_utt, int(n_utt_hyps.max()) * beam), float('-inf')
+            )
+            beam_scores[
+                utt_ids.unsqueeze(1),
+                pos.unsqueeze(1) * beam + torch.arange(beam, device=device),
+            ] = expanded_scores
+            active = torch.nonzero(n_utt_hyps).view(-1)
+            score, best_ids = torch.topk(beam_scores[active], beam, dim=1)
+            score = score.view(-1)
+            prev_ids = (offsets[active].unsqueeze(1) + best_ids // beam).view(-1)
+            best_ids = prev_ids * beam + (best_ids % beam).view(-1)
+            utt_ids = utt_ids[prev_ids]
+            yseq = torch.cat(
+                (yseq[prev_ids], local_best_ids.view(-1)[best_ids].unsqueeze(1)),
+                dim=1,
+            )
+            acache = [c[prev_ids] for c in acache]
+            vcache = [c[prev_ids] for c in vcache]
+            if rnnlm:
+                rnnlm_state = self._index_select_lm_state(rnnlm_state, 0, prev_ids)
+            if lpz is not None:
+                ctc_ids = joint_best_ids.view(-1)[best_ids]
+                ctc_state_prev = ctc_prefix_score.index_select_state(
+                    ctc_states, prev_ids, ctc_ids
+                )
+                ctc_score_prev = ctc_scores[prev_ids, ctc_ids]
+
+            logging.debug('number of pruned hypothes: ' + str(yseq.size(0)))
             if char_list is not None:
                 logging.debug(
-                    'best hypo: ' + ''.join([char_list[int(x)] for x in hyps[0]['yseq'][1:]]))
+                    'best hypo: ' + ''.join([char_list[int(x)] for x in yseq[0, 1:]])
+                )
 
             # add eos in the final loop to avoid that there are no ended hyps
-            if i == maxlen - 1:
+            is_last = torch.tensor(
+                [i == maxlens[u] - 1 for u in utt_ids.tolist()], device=device
+            )
+            if bool(is_last.any()):
                 logging.info('adding <eos> in the last postion in the loop')
-                for hyp in hyps:
-                    hyp['yseq'].append(self.eos)
 
             # add ended hypothes to a final list, and removed them from current hypothes
             # (this will be a probmlem, number of hyps < beam)
-            remained_hyps = []
-            for hyp in hyps:
-                if hyp['yseq'][-1] == self.eos:
-                    # only store the sequence that has more than minlen outputs
-                    # also add penalty
-                    if len(hyp['yseq']) > minlen:
-                        hyp['score'] += (i + 1) * penalty
-                        if rnnlm:  # Word LM needs to add final <eos> score
-                            hyp['score'] += recog_args.lm_weight * rnnlm.final(
-                                hyp['rnnlm_prev'])
-                        ended_hyps.append(hyp)
-                else:
-                    remained_hyps.append(hyp)
+            is_ended = (yseq[:, -1] == self.eos) | is_last
+            stop_search = [False] * n_utt
+            for k in torch.nonzero(is_ended).view(-1).tolist():
+                u = int(utt_ids[k])
+                hyp_yseq = yseq[k].tolist()
+                if is_last[k]:
+                    hyp_yseq.append(self.eos)
+                # only store the sequence that has more than minlen outputs
+                # also add penalty
+                if len(hyp_yseq) > minlens[u]:
+                    hyp = {'score': float(score[k]), 'yseq': hyp_yseq}
+                    hyp['score'] += (i + 1) * penalty
+                    if rnnlm:  # Word LM needs to add final <eos> score
+                        hyp['score'] += recog_args.lm_weight * rnnlm.final(
+                            rnnlm_state, index=k
+                        )
+                    ended_hyps[u].append(hyp)
 
             # end detection
             from espnet.nets.e2e_asr_common import end_detect
-            if end_detect(ended_hyps, i) and recog_args.maxlenratio == 0.0:
-                logging.info('end detected at %d', i)
-                break
 
-            hyps = remained_hyps
-            if len(hyps) > 0:
-                logging.debug('remeined hypothes: ' + str(len(hyps)))
+            for u in set(utt_ids.tolist()):
+                if end_detect(ended_hyps[u], i) and recog_args.maxlenratio == 0.0:
+                    logging.info('end detected at %d', i)
+                    stop_search[u] = True
+            is_ended |= torch.tensor(stop_search, device=device)[utt_ids]
+
+            remained_ids = torch.nonzero(~is_ended).view(-1)
+            if len(remained_ids) > 0:
+                logging.debug('remeined hypothes: ' + str(len(remained_ids)))
             else:
                 logging.info('no hypothesis. Finish decoding.')
                 break
+            utt_ids = utt_ids[remained_ids]
+            yseq = yseq[remained_ids]
+            score = score[remained_ids]
+            acache = [c[remained_ids] for c in acache]
+            vcache = [c[remained_ids] for c in vcache]
+            if rnnlm:
+                rnnlm_state = self._index_select_lm_state(rnnlm_state, 0, remained_ids)
+            if lpz is not None:
+                ctc_state_prev = ctc_prefix_score.index_select_state(
+                    ctc_state_prev, remained_ids
+                )
+                ctc_score_prev = ctc_score_prev[remained_ids]
 
             if char_list is not None:
-                for hyp in hyps:
+                for ys in yseq:
                     logging.debug(
-                        'hypo: ' + ''.join([char_list[int(x)] for x in hyp['yseq'][1:]]))
-
-            logging.debug('number of ended hypothes: ' + str(len(ended_hyps)))
-
-        nbest_hyps = sorted(
-            ended_hyps, key=lambda x: x['score'], reverse=True)[:min(len(ended_hyps), recog_args.nbest)]
-
-        # check number of hypotheis
-        if len(nbest_hyps) == 0:
-            logging.warning('there is no N-best results, perform recognition again with smaller minlenratio.')
-            # should copy becasuse Namespace will be overwritten globally
-            recog_args = Namespace(**vars(recog_args))
-            recog_args.minlenratio = max(0.0, recog_args.minlenratio - 0.1)
-            return self.recognize(feat, recog_args, char_list, rnnlm)
-
-        logging.info('total log probability: ' + str(nbest_hyps[0]['score']))
-        logging.info('normalized log probability: ' + str(nbest_hyps[0]['score'] / len(nbest_hyps[0]['yseq'])))
+                        'hypo: ' + ''.join([char_list[int(x)] for x in ys[1:]])
+                    )
+
+            logging.debug(
+                'number of ended hypothes: ' + str([len(h) for h in ended_hyps])
+            )
+
+        nbest_hyps = []
+        for u in six.moves.range(n_utt):
+            nbest = sorted(ended_hyps[u], key=lambda x: x['score'], reverse=True)[
+                : min(len(ended_hyps[u]), recog_args.nbest)
+            ]
+
+            # check number of hypotheis
+            if len(nbest) == 0:
+                logging.warning(
+                    'there is no N-best results, perform recognition again'
+                    ' with smaller minlenratio.'
+                )
+                # should copy becasuse Namespace will be overwritten globally
+                retry_args = Namespace(**vars(recog_args))
+                retry_args.minlenratio = max(0.0, recog_args.minlenratio - 0.1)
+                nbest = self.recognize(
+                    afeats[u], vfeats[u], rms[u], retry_args, char_list, rnnlm
+                )
+            else:
+                logging.info('total log probability: ' + str(nbest[0]['score']))
+                logging.info(
+                    'normalized log probability: '
+                    + str(nbest[0]['score'] / len(nbest[0]['yseq']))
+                )
+            nbest_hyps.append(nbest)
         return nbest_hyps
 
+    @staticmethod
+    def _index_select_lm_state(rnnlm_state, dim, vidx):
+        if isinstance(rnnlm_state, dict):
+            new_state = {}
+            for k, v in rnnlm_state.items():
+                new_state[k] = [torch.index_select(vi, dim, vidx) for vi in v]
+        elif isinstance(rnnlm_state, list):
+            new_state = []
+            for i in vidx:
+                new_state.append(rnnlm_state[int(i)][:])
+        return new_state
+
     def calculate_all_attentions(self, axs_pad, vxs_pad, rms_pad, ilens, ys_pad):
         '''E2E attention calculation
 
@@ -1,7 +1,11 @@
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import io
+import json
 import logging
 import os
+import threading
 import torch
 
 import h5py
@@ -11,6 +15,17 @@ import soundfile
 
 from espnet.transform.transformation import Transformation
 
+# input modalities of data.json, with the loader type used if no "filetype" is given
+INPUT_FILETYPES = {
+    "afeat": "mat",
+    "vfeat": "pt",
+    "rms": "mat",
+    "mfcc": "mat",
+    "aRMs": "pt",
+    "vRMs": "pt",
+    "AUs": "pt",
+}
+
 
 class LoadInputsAndTargets(object):
     """Create a mini-batch from a list of dicts
@@ -36,6 +51,16 @@ class LoadInputsAndTargets(object):
     :param: bool use_second_target: Used for tts mode only
     :param: dict preprocess_args: Set some optional arguments for preprocessing
     :param: Optional[dict] preprocess_args: Used for tts mode only
+    :param: bool keep_all_data_on_mem: Keep the loaded inputs in a feature cache
+    :param: Optional[int] cache_size: Memory budget of the feature cache in bytes,
+        None for no limit
+    :param: Optional[List[str]] cache_modalities: Input modalities kept in the
+        feature cache, e.g. ["aRMs", "vRMs", "AUs"], None for all
+    :param: int num_threads: Number of threads reading the inputs of a mini-batch
+        concurrently, 0 reads them one after another
+    :param: Optional[NoiseMixer] noise_mixer: Mixes noise into the clean
+        utterances while loading, and replaces their audio input, MFCCs and
+        audio reliability measure, None to load them as dumped
     """
 
     def __init__(
@@ -49,6 +74,10 @@ class LoadInputsAndTargets(object):
         use_second_target=False,
         preprocess_args=None,
         keep_all_data_on_mem=False,
+        cache_size=None,
+        cache_modalities=None,
+        num_threads=0,
+        noise_mixer=None,
     ):
         self._loaders = {}
         if mode not in ["asr", "tts", "mt"]:
@@ -86,6 +115,21 @@ class LoadInputsAndTargets(object):
             self.preprocess_args = dict(preprocess_args)
 
         self.keep_all_data_on_mem = keep_all_data_on_mem
+        if keep_all_data_on_mem:
+            self.cache = FeatureCache(cache_size)
+        else:
+            self.cache = None
+        self.cache_modalities = cache_modalities
+        self.num_threads = num_threads
+        self.noise_mixer = noise_mixer
+        self._executor = None
+        self._executor_pid = None
+
+    def __getstate__(self):
+        # The thread pool is created again in each worker process
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        return state
 
     def __call__(self, batch):
         """Function to load inputs and targets from list of dicts
@@ -107,6 +151,11 @@ class LoadInputsAndTargets(object):
         y_feats_dict = OrderedDict()  # OrderedDict[str, List[np.ndarray]]
         uttid_list = []  # List[str]
 
+        if self.load_input and self.num_threads > 0:
+            loaded = self._load_inputs_async(batch)
+        else:
+            loaded = None
+
         for uttid, info in batch:
             uttid_list.append(uttid)
 
@@ -117,37 +166,27 @@ class LoadInputsAndTargets(object):
                     #  [{"feat": "some/path.h5:F01_050C0101_PED_REAL",
                     #    "filetype": "hdf5",
                     #    "name": "input1", ...}], ...}
-                    ax = self._get_from_loader(
-                        filepath=inp["afeat"], filetype=inp.get("filetype", "mat")
-                    )
-                    mfcc = self._get_from_loader(
-                        filepath=inp["mfcc"], filetype=inp.get("filetype", "mat")
-                    )
-                    vx = self._get_from_loader(
-                        filepath=inp["vfeat"], filetype=inp.get("filetype", "pt")
-                    )
-                    arms = self._get_from_loader(
-                        filepath=inp["aRMs"], filetype=inp.get("filetype", "pt")
+                    ax = self._load_input(inp, "afeat", "mat", loaded)
+                    vx = self._load_input(inp, "vfeat", "pt", loaded)
+                    mixed = self.noise_mixer is not None and self.noise_mixer.sample(
+                        uttid
                     )
+                    if mixed:
+                        # the pitch of the clean audio input is kept
+                        ax, mfcc, arms = self.noise_mixer(uttid, ax)
+                    if "rms" in inp:
+                        # fused reliability measures written by dump/avrmsdump.py
+                        rms = self._load_input(inp, "rms", "mat", loaded)
+                        if mixed:
+                            rms = replace_audio_rms(rms, mfcc, arms)
+                    else:
+                        if not mixed:
+                            mfcc = self._load_input(inp, "mfcc", "mat", loaded)
+                            arms = self._load_input(inp, "aRMs", "pt", loaded)
 
-                    vrms = self._get_from_loader(
-                        filepath=inp["vRMs"], filetype=inp.get("filetype", "pt")
-                    )
-                    AUs = self._get_from_loader(
-                        filepath=inp["AUs"], filetype=inp.get("filetype", "pt")
-                    )
-                    pitch = ax[:, -3:]
-
-                    alen = len(ax)
-                    arms = dda(arms, alen)
-                    vrms = dda(vrms, alen)
-                    AUs = dda(AUs, alen)
-                    arms = np.expand_dims(arms, axis=1)
-                    vrms = np.expand_dims(vrms, axis=1)
-                    rms = np.concatenate((mfcc[:, :7], pitch), axis=1)
-                    rms = np.concatenate((rms, arms), axis=1)
-                    rms = np.concatenate((rms, vrms), axis=1)
-                    rms = np.concatenate((rms, AUs), axis=1)
+                        vrms = self._load_input(inp, "vRMs", "pt", loaded)
+                        AUs = self._load_input(inp, "AUs", "pt", loaded)
+                        rms = make_rms(ax, mfcc, arms, vrms, AUs)
 
                     ax_feats_dict.setdefault(inp["name"], []).append(ax)
                     vx_feats_dict.setdefault(inp["name"], []).append(vx)
@@ -176,7 +215,10 @@ class LoadInputsAndTargets(object):
                     # if int(info['input'][idx]['ashape'][0] / 4.0 ) == 0:
                     # pass
                     # else:
-                    if "tokenid" in inp:
+                    if "tokenid" in inp and not isinstance(inp["tokenid"], str):
+                        # token ids parsed by UtteranceCatalog
+                        x = inp["tokenid"]
+                    elif "tokenid" in inp:
                         # ======= Legacy format for output =======
                         # {"output": [{"tokenid": "1 2 3 4"}])
                         x = np.fromiter(
@@ -434,6 +476,83 @@ class LoadInputsAndTargets(object):
             return_batch = OrderedDict([(x_name, xs)])
         return return_batch, uttid_list
 
+    def preload(self, batches):
+        """Load the inputs of the mini-batches into the feature cache
+
+        Loading stops once the memory budget is used up. Worker processes
+        forked afterwards share the cached arrays with this process.
+
+        :param List[List[Tuple[str, dict]]] batches: mini-batches of data.json
+        """
+        for batch in batches:
+            for uttid, info in batch:
+                for inp in info["input"]:
+                    for name in self._input_names(inp):
+                        self._load_input(inp, name, INPUT_FILETYPES[name])
+                        if self.cache.full:
+                            logging.info("feature cache: {}".format(self.cache))
+                            return
+        logging.info("feature cache: {}".format(self.cache))
+
+    @staticmethod
+    def _input_names(inp):
+        """Return the modalities of an input which are read to build a mini-batch
+
+        :param dict inp: input of an utterance in data.json
+        :rtype: List[str]
+        """
+        if "rms" in inp:
+            return ["afeat", "vfeat", "rms"]
+        return ["afeat", "vfeat", "mfcc", "aRMs", "vRMs", "AUs"]
+
+    def _load_inputs_async(self, batch):
+        """Issue the reads of all inputs of a mini-batch to the thread pool
+
+        :param List[Tuple[str, dict]] batch: list of dict which is subset of
+            loaded data.json
+        :return: futures of the loaded inputs, keyed by file path
+        :rtype: Dict[str, concurrent.futures.Future]
+        """
+        if self._executor is None or self._executor_pid != os.getpid():
+            # threads do not survive a fork, so each process has its own pool
+            self._executor = ThreadPoolExecutor(max_workers=self.num_threads)
+            self._executor_pid = os.getpid()
+        loaded = {}
+        for uttid, info in batch:
+            for inp in info["input"]:
+                for name in self._input_names(inp):
+                    if inp[name] not in loaded:
+                        loaded[inp[name]] = self._executor.submit(
+                            self._load_input, inp, name, INPUT_FILETYPES[name]
+                        )
+        return loaded
+
+    def _load_input(self, inp, name, filetype, loaded=None):
+        """Return one modality of an input, from the feature cache if enabled
+
+        :param dict inp: input of an utterance in data.json
+        :param str name: modality, e.g. "vfeat"
+        :param str filetype: loader type if `inp` does not give one
+        :param dict loaded: output of `_load_inputs_async`
+        :return:
+        :rtype: np.ndarray
+        """
+        filepath = inp[name]
+        if loaded is not None and filepath in loaded:
+            return loaded[filepath].result()
+        filetype = inp.get("filetype", filetype)
+        if (
+            self.cache is None
+            or filetype == "packed"  # already memory-mapped
+            or (self.cache_modalities is not None and name not in self.cache_modalities)
+        ):
+            return self._get_from_loader(filepath=filepath, filetype=filetype)
+        data = self.cache.get(filepath)
+        if data is None:
+            data = self._get_from_loader(filepath=filepath, filetype=filetype)
+            self.cache.put(filepath, data)
+        return data
+
     def _get_from_loader(self, filepath, filetype):
         """Return ndarray
 
@@ -480,13 +599,8 @@ class LoadInputsAndTargets(object):
             #    {"input": [{"feat": "some/path.wav",
             #                "filetype": "sound"},
             # Assume PCM16
-            if not self.keep_all_data_on_mem:
-                array, _ = soundfile.read(filepath, dtype="int16")
-                return array
-            if filepath not in self._loaders:
-                array, _ = soundfile.read(filepath, dtype="int16")
-                self._loaders[filepath] = array
-            return self._loaders[filepath]
+            array, _ = soundfile.read(filepath, dtype="int16")
+            return array
         elif filetype == "npz":
             # e.g.
             #    {"input": [{"feat": "some/path.npz:F01_050C0101_PED_REAL",
@@ -503,22 +617,14 @@ class LoadInputsAndTargets(object):
             # e.g.
             #    {"input": [{"feat": "some/path.npy",
             #                "filetype": "npy"},
-            if not self.keep_all_data_on_mem:
-                return np.load(filepath)
-            if filepath not in self._loaders:
-                self._loaders[filepath] = np.load(filepath)
-            return self._loaders[filepath]
+            return np.load(filepath)
         elif filetype in ["mat", "vec"]:
             # e.g.
             #    {"input": [{"feat": "some/path.ark:123",
             #                "filetype": "mat"}]},
             # In this case, "123" indicates the starting points of the matrix
             # load_mat can load both matrix and vector
-            if not self.keep_all_data_on_mem:
-                return kaldiio.load_mat(filepath)
-            if filepath not in self._loaders:
-                self._loaders[filepath] = kaldiio.load_mat(filepath)
-            return self._loaders[filepath]
+            return kaldiio.load_mat(filepath)
         elif filetype == "scp":
             # e.g.
             #    {"input": [{"feat": "some/path.scp:F01_050C0101_PED_REAL",
@@ -533,84 +639,251 @@ class LoadInputsAndTargets(object):
         elif filetype == "pt":
             data = torch.load(filepath)
             return data
+        elif filetype == "packed":
+            # e.g.
+            #    {"input": [{"vfeat": "some/path/vfeat.bin:F01_050C0101_PED_REAL",
+            #                "filetype": "packed",
+            # -> filepath = "some/path/vfeat.bin", key = "F01_050C0101_PED_REAL"
+            filepath, key = filepath.split(":", 1)
+
+            loader = self._loaders.get(filepath)
+            if loader is None:
+                # To avoid disk access, create loader only for the first time
+                loader = PackedFeatureReader(filepath)
+                self._loaders[filepath] = loader
+            return loader[key]
         else:
             raise NotImplementedError("Not supported: loader_type={}".format(filetype))
 
 
-def downsample(data, c2):
-    c1 = len(data)
-    if c1 > c2:
-        dx = c1
-        dy = c2
-    else:
-        dx = c2
-        dy = c1
-    arr = np.zeros((dx))
-    d = 2 * dy - dx
-    dO = 2 * dy
-    dNO = 2 * (dy - dx)
-    y = 0
-    x = 0
-    err = d
-    arr[x] = y
-    for x in range(1, dx):
-        if err <= 0:
-            err = err + dO
-        else:
-            y = y + 1
-            err = err + dNO
-        arr[x] = y
-    arr[arr > dy - 1] = dy - 1
-    arr = arr.astype(int)
+def make_rms(ax, mfcc, arms, vrms, AUs):
+    """Build the reliability measures of one utterance
+
+    The first 7 MFCCs, the pitch features of the audio input, the audio and
+    video reliability measures and the action units, aligned to the audio frames.
+
+    :param np.ndarray ax: audio input features (T, D)
+    :param np.ndarray mfcc: MFCC features (T, 13)
+    :param np.ndarray arms: audio reliability measure (T_a)
+    :param np.ndarray vrms: video reliability measure (T_v)
+    :param np.ndarray AUs: action units (T_v, 6)
+    :return: reliability measures (T, 18)
+    :rtype: np.ndarray
+    """
+    alen = len(ax)
+    pitch = ax[:, -3:]
+    arms = np.expand_dims(dda(arms, alen), axis=1)
+    vrms = np.expand_dims(dda(vrms, alen), axis=1)
+    AUs = dda(AUs, alen)
+    return np.concatenate((mfcc[:, :7], pitch, arms, vrms, AUs), axis=1)
+
+
+def replace_audio_rms(rms, mfcc, arms):
+    """Replace the MFCCs and the audio reliability measure of `make_rms` output
+
+    :param np.ndarray rms: reliability measures (T, 18)
+    :param np.ndarray mfcc: MFCC features (T', 13), T' <= T
+    :param np.ndarray arms: audio reliability measure (T_a)
+    :return: reliability measures (T', 18)
+    :rtype: np.ndarray
+    """
+    alen = len(mfcc)
+    rms = np.array(rms[:alen])
+    rms[:, :7] = mfcc[:, :7]
+    rms[:, 10] = dda(arms, alen)
+    return rms
+
+
+@lru_cache(maxsize=4096)
+def alignment_ids(c1, c2):
+    """Return the DDA line between a sequence of length c1 and one of length c2
+
+    The line runs along the longer sequence, and entry x is the position on
+    the shorter sequence which frame x is aligned to. It is the closed form of
+    the Bresenham recursion, i.e. the smallest y with 2 * dx * y >= 2 * dy * x - dx.
+    The result is cached for each pair of lengths and must not be modified.
+
+    :param int c1: length of the source sequence
+    :param int c2: length of the target sequence
+    :return: aligned positions on the shorter sequence (max(c1, c2),)
+    :rtype: np.ndarray
+    """
+    dx = max(c1, c2)
+    dy = min(c1, c2)
+    x = np.arange(dx)
+    arr = np.maximum(-((dx - 2 * dy * x) // (2 * dx)), 0)
+    arr = np.minimum(arr, dy - 1)
+    arr.setflags(write=False)
+    return arr
+
+
+@lru_cache(maxsize=4096)
+def last_alignment_ids(c1, c2):
+    """Return the last frame of the longer sequence aligned to each position
+
+    :param int c1: length of the source sequence
+    :param int c2: length of the target sequence
+    :return: indices on the longer sequence, one per aligned position
+    :rtype: np.ndarray
+    """
+    arr = alignment_ids(c1, c2)
+    ids = np.flatnonzero(np.append(arr[1:] != arr[:-1], True))
+    ids.setflags(write=False)
+    return ids
 
-    idxdict = {}
-    for i in range(len(arr)):
-        idxdict[arr[i]] = i
-    dataexp = []
-    for i in range(len(idxdict)):
-        id = idxdict[i]
-        dataexp.append(data[id])
 
-    return np.asarray(dataexp)
+def downsample(data, c2):
+    return np.asarray(data)[last_alignment_ids(len(data), c2)]
 
 
 def dda(data, c2):
     c1 = len(data)
-    if c1 > c2:
-        dx = c1
-        dy = c2
-    else:
-        dx = c2
-        dy = c1
-    arr = np.zeros((dx))
-    d = 2 * dy - dx
-    dO = 2 * dy
-    dNO = 2 * (dy - dx)
-    y = 0
-    x = 0
-    err = d
-    arr[x] = y
-    for x in range(1, dx):
-        if err <= 0:
-            err = err + dO
-        else:
-            y = y + 1
-            err = err + dNO
-        arr[x] = y
-    arr[arr > dy - 1] = dy - 1
-    arr = arr.astype(int)
     if c1 < c2:
-        arr = arr
-    else:
-        dict = {}
-        for i in range(len(arr)):
-            dict.update({arr[i]: i})
-        arr = dict.values()
-    dataexp = []
-    for i in arr:
-        dataexp.append(data[i])
-
-    return np.asarray(dataexp)
+        return np.asarray(data)[alignment_ids(c1, c2)]
+    return np.asarray(data)[last_alignment_ids(c1, c2)]
+
+
+class FeatureCache(object):
+    """Least recently used cache of loaded features with a memory budget
+
+    >>> cache = FeatureCache(2 ** 30)
+    >>> cache.put('some/path.pt', array)
+    >>> array = cache.get('some/path.pt')
+
+    :param: Optional[int] max_bytes: memory budget in bytes, None for no limit
+    :param: int report_interval: log the counters after this many lookups
+    """
+
+    def __init__(self, max_bytes=None, report_interval=10000):
+        self.max_bytes = max_bytes
+        self.report_interval = report_interval
+        self.data = OrderedDict()
+        self.nbytes = 0
+        self.full = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return (
+            "<FeatureCache {} entries, {} / {} bytes, "
+            "{} hits, {} misses, {} evictions>".format(
+                len(self.data),
+                self.nbytes,
+                self.max_bytes,
+                self.hits,
+                self.misses,
+                self.evictions,
+            )
+        )
+
+    def get(self, key):
+        with self.lock:
+            data = self.data.get(key)
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.data.move_to_end(key)
+        if (self.hits + self.misses) % self.report_interval == 0:
+            logging.info("feature cache (pid {}): {}".format(os.getpid(), self))
+        return data
+
+    def put(self, key, data):
+        size = self._sizeof(data)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.data:
+                return
+            self.nbytes += size
+            self.data[key] = data
+            while self.max_bytes is not None and self.nbytes > self.max_bytes:
+                self.full = True
+                _, evicted = self.data.popitem(last=False)
+                self.nbytes -= self._sizeof(evicted)
+                self.evictions += 1
+
+    @staticmethod
+    def _sizeof(data):
+        if isinstance(data, torch.Tensor):
+            return data.element_size() * data.nelement()
+        return np.asarray(data).nbytes
+
+    def info(self):
+        """Return the counters of the cache
+
+        :return: number of entries, bytes, hits, misses and evictions
+        :rtype: dict
+        """
+        return dict(
+            entries=len(self.data),
+            nbytes=self.nbytes,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
+
+
+class PackedFeatureReader(object):
+    """Random access to the utterances of a packed feature store
+
+    The store of one modality is written by ``dump/avpackdump.py``. The data
+    file holds the C-ordered arrays of all utterances back to back, and the
+    index ``filepath + ".json"`` maps each utterance id to the byte offset,
+    shape and dtype of its array. The data file is memory-mapped copy-on-write,
+    so an utterance is returned as a view without reading it up front.
+
+    >>> f = PackedFeatureReader('dump/packed/train/vfeat.bin')
+    >>> array = f['utt1']
+
+    :param: str filepath: path of the data file
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        with open(filepath + ".json", encoding="utf-8") as f:
+            self.index = json.load(f)
+        self.data = None
+
+    def __repr__(self):
+        return '<PackedFeatureReader file "{}" ({} utterances)>'.format(
+            self.filepath, len(self.index)
+        )
+
+    def __getstate__(self):
+        # The mapping is opened again in each worker process
+        state = self.__dict__.copy()
+        state["data"] = None
+        return state
+
+    def __getitem__(self, key):
+        if self.data is None:
+            self.data = np.memmap(self.filepath, dtype=np.uint8, mode="c")
+        offset, shape, dtype = self.index[key]
+        return np.ndarray(shape, dtype=dtype, buffer=self.data, offset=offset)
+
+    def keys(self):
+        return self.index.keys()
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __contains__(self, item):
+        return item in self.index
+
+    def __len__(self):
+        return len(self.index)
 
 
 class SoundHDF5File(object):
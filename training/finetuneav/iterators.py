@@ -0,0 +1,217 @@
+import collections
+import copy
+import logging
+import queue
+import threading
+import time
+
+from chainer.serializer import Deserializer
+
+
+class StateRecorder(object):
+    """Serializer which records the state of an iterator in nested dicts
+
+    The recorded state is written to another serializer with `save`, so that a
+    snapshot can store the state of an iterator at an earlier time.
+    """
+
+    def __init__(self):
+        self.state = {}
+
+    def __getitem__(self, key):
+        child = StateRecorder()
+        self.state[key] = child
+        return child
+
+    def __call__(self, key, value):
+        self.state[key] = copy.deepcopy(value)
+        return value
+
+    def save(self, serializer):
+        for key, value in self.state.items():
+            if isinstance(value, StateRecorder):
+                value.save(serializer[key])
+            else:
+                serializer(key, value)
+
+
+def record_state(iterator):
+    recorder = StateRecorder()
+    iterator.serialize(recorder)
+    return recorder
+
+
+class PrefetchIterator(object):
+    """Iterator which assembles the mini-batches of another iterator ahead of time
+
+    A background thread takes the mini-batches from `iterator`, i.e. reads and
+    transforms them, and keeps up to `n_prefetch` of them in a queue. The epoch
+    attributes are those of the last returned mini-batch. The time spent waiting
+    for the queue is accumulated in `stall_time` and logged at each new epoch.
+
+    The state of `iterator` is recorded after each mini-batch, and a snapshot
+    stores the state after the last returned mini-batch, not the position of
+    the background thread. The thread is stopped while the state of `iterator`
+    is loaded or its shuffling is changed, and the mini-batches already
+    assembled from the old state are returned first.
+
+    :param chainer.dataset.Iterator iterator: iterator to prefetch from, e.g.
+        ToggleableShufflingSerialIterator
+    :param int n_prefetch: number of mini-batches assembled ahead of time
+    """
+
+    def __init__(self, iterator, n_prefetch=4):
+        self.iterator = iterator
+        self.n_prefetch = n_prefetch
+        self._copy_epoch()
+        self.stall_time = 0.0
+        self.n_batches = 0
+        self._epoch_stall_time = 0.0
+        self._thread = None
+        self._pending = collections.deque()
+        self._state = record_state(iterator)
+        self._start()
+
+    def __getattr__(self, name):
+        # e.g. dataset, batch_size, repeat of the prefetched iterator
+        if name == "iterator":
+            raise AttributeError(name)
+        return getattr(self.iterator, name)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._pending:
+            item = self._pending.popleft()
+        else:
+            if self._error is not None:
+                raise self._error
+            start = time.time()
+            item = self._queue.get()
+            stall = time.time() - start
+            self.stall_time += stall
+            self._epoch_stall_time += stall
+        if isinstance(item, BaseException):
+            self._thread.join()
+            self._thread = None
+            self._error = item
+            raise item
+        (
+            batch,
+            self.epoch,
+            self.is_new_epoch,
+            self.epoch_detail,
+            self.previous_epoch_detail,
+            self._state,
+        ) = item
+        self.n_batches += 1
+        if self.is_new_epoch:
+            logging.info(
+                "prefetch: waited %.1f s for the mini-batches of epoch %d",
+                self._epoch_stall_time,
+                self.epoch,
+            )
+            self._epoch_stall_time = 0.0
+        return batch
+
+    next = __next__
+
+    def reset(self):
+        self._stop()
+        self._pending.clear()
+        self.iterator.reset()
+        self._copy_epoch()
+        self._state = record_state(self.iterator)
+        self._start()
+
+    def start_shuffle(self):
+        # applies to the mini-batches which are not prefetched yet
+        self._stop(keep=True)
+        self.iterator.start_shuffle()
+        self._start()
+
+    def serialize(self, serializer):
+        if isinstance(serializer, Deserializer):
+            # the mini-batches prefetched from the old state are dropped
+            self._stop()
+            self._pending.clear()
+            self.iterator.serialize(serializer)
+            self._copy_epoch()
+            self._state = record_state(self.iterator)
+        else:
+            self._stop(keep=True)
+            self._state.save(serializer)
+        self._start()
+
+    def finalize(self):
+        self._stop()
+        self.iterator.finalize()
+
+    def _copy_epoch(self):
+        self.epoch = self.iterator.epoch
+        self.is_new_epoch = self.iterator.is_new_epoch
+        self.epoch_detail = self.iterator.epoch_detail
+        self.previous_epoch_detail = self.iterator.previous_epoch_detail
+
+    def _start(self):
+        self._error = None
+        self._queue = queue.Queue(maxsize=self.n_prefetch)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def _stop(self, keep=False):
+        """Stop the background thread
+
+        :param bool keep: If the mini-batches in the queue are returned later.
+            An error in the queue is dropped, the restarted thread raises it again
+        """
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        while self._thread.is_alive():
+            try:
+                item = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if keep and not isinstance(item, BaseException):
+                self._pending.append(item)
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if keep and not isinstance(item, BaseException):
+                self._pending.append(item)
+        self._thread = None
+
+    def _put(self, item):
+        while not self._stop_event.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _worker(self):
+        iterator = self.iterator
+        while not self._stop_event.is_set():
+            try:
+                batch = iterator.next()
+            except BaseException as e:
+                # StopIteration at the end of a non-repeating iterator, or an
+                # error raised while loading, is raised again by __next__
+                self._put(e)
+                return
+            item = (
+                batch,
+                iterator.epoch,
+                iterator.is_new_epoch,
+                iterator.epoch_detail,
+                iterator.previous_epoch_detail,
+                record_state(iterator),
+            )
+            if not self._put(item):
+                return
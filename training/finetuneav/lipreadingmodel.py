@@ -7,6 +7,24 @@ from torch.autograd import Variable
 import torch.nn as nn
 from torch.utils.data import Dataset
 
+# statistics of the gray values of the mouth regions, see segvideo.py
+MEAN = 0.4161
+STD = 0.1688
+
+
+def normalize_frames(x, dtype=torch.float32):
+    """Normalize mouth regions which are stored as uint8 gray values
+
+    :param torch.Tensor x: frames (..., H, W)
+    :param torch.dtype dtype: data type of the normalized frames
+    :return: normalized frames, frames which are not uint8 are already
+        normalized and returned unchanged
+    :rtype: torch.Tensor
+    """
+    if x.dtype != torch.uint8:
+        return x
+    return ((x.float() / 255.0 - MEAN) / STD).to(dtype)
+
 
 def conv3x3(in_planes, out_planes, stride=1):
     return nn.Conv2d(
@@ -127,6 +145,7 @@ class Lipreading(nn.Module):
 
     def forward(self, x):
         ifcuda = x.is_cuda
+        x = normalize_frames(x)
         x = x.unsqueeze(1)
         if self.training is True:
             x = RandomCrop(x, (88, 88))
@@ -0,0 +1,353 @@
+import json
+import logging
+import zlib
+
+import kaldiio
+import numpy as np
+
+from espnet.transform.cmvn import CMVN
+
+# frame length and shift in samples of the Kaldi features at 16 kHz
+FRAME_LENGTH = 400
+FRAME_SHIFT = 160
+# number of pitch features at the end of the audio input
+NUM_PITCH = 3
+# floor of the energies before the logarithm, as in Kaldi
+EPSILON = np.finfo(np.float32).eps
+# range of the a priori SNR in dB of DeepXi, the ratio of each bin is clipped
+MIN_SNR_DB = -10.0
+MAX_SNR_DB = 30.0
+
+
+def mel_scale(freq):
+    return 1127.0 * np.log(1.0 + np.asarray(freq) / 700.0)
+
+
+def mel_banks(num_bins, padded_length, fs, low_freq=20.0, high_freq=0.0):
+    """Return the triangular mel filters of Kaldi
+
+    The filters are triangles on the mel scale, evaluated at the center
+    frequencies of the FFT bins, as in kaldi::MelBanks without VTLN.
+
+    :param int num_bins: number of mel bins
+    :param int padded_length: FFT length
+    :param int fs: sampling frequency
+    :param float low_freq: lowest frequency of the filters
+    :param float high_freq: highest frequency, <= 0 is an offset from Nyquist
+    :return: filter weights (num_bins, padded_length // 2 + 1)
+    :rtype: np.ndarray
+    """
+    nyquist = 0.5 * fs
+    if high_freq <= 0.0:
+        high_freq += nyquist
+    mel_low = mel_scale(low_freq)
+    mel_delta = (mel_scale(high_freq) - mel_low) / (num_bins + 1)
+    left = mel_low + mel_delta * np.arange(num_bins)[:, None]
+    center = left + mel_delta
+    right = center + mel_delta
+    # the Nyquist bin is not used by Kaldi
+    mel = mel_scale(np.arange(padded_length // 2) * fs / padded_length)[None, :]
+    weights = np.where(
+        mel <= center, (mel - left) / (center - left), (right - mel) / (right - center)
+    )
+    weights = np.where((mel > left) & (mel < right), weights, 0.0)
+    return np.pad(weights, ((0, 0), (0, 1)))
+
+
+def dct_matrix(num_ceps, num_bins):
+    """Return the first num_ceps rows of the orthonormal DCT-II of Kaldi
+
+    :param int num_ceps: number of cepstral coefficients
+    :param int num_bins: number of mel bins
+    :rtype: np.ndarray
+    """
+    k = np.arange(num_ceps)[:, None]
+    n = np.arange(num_bins)[None, :]
+    dct = np.sqrt(2.0 / num_bins) * np.cos(np.pi / num_bins * (n + 0.5) * k)
+    dct[0] = np.sqrt(1.0 / num_bins)
+    return dct
+
+
+def povey_window(length):
+    return (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(length) / (length - 1))) ** 0.85
+
+
+def frame_signal(wav):
+    """Split a signal into the frames of the Kaldi features (snip edges)
+
+    :param np.ndarray wav: signal (N,)
+    :return: frames (T, FRAME_LENGTH)
+    :rtype: np.ndarray
+    """
+    wav = np.asarray(wav, dtype=np.float64)
+    if len(wav) < FRAME_LENGTH:
+        return np.zeros((0, FRAME_LENGTH))
+    frames = np.lib.stride_tricks.sliding_window_view(wav, FRAME_LENGTH)
+    return frames[::FRAME_SHIFT]
+
+
+def power_spectrum(frames, window, preemph=0.97, padded_length=512):
+    """Kaldi power spectrum and raw log energy of each frame
+
+    :param np.ndarray frames: frames (T, FRAME_LENGTH)
+    :param np.ndarray window: analysis window (FRAME_LENGTH,)
+    :param float preemph: pre-emphasis coefficient
+    :param int padded_length: FFT length
+    :return: power spectra (T, padded_length // 2 + 1) and log energies (T,)
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    frames = frames - frames.mean(axis=1, keepdims=True)
+    log_energy = np.log(np.maximum((frames**2).sum(axis=1), EPSILON))
+    frames = np.concatenate(
+        (frames[:, :1] * (1.0 - preemph), frames[:, 1:] - preemph * frames[:, :-1]),
+        axis=1,
+    )
+    spectrum = np.fft.rfft(frames * window, n=padded_length)
+    return spectrum.real**2 + spectrum.imag**2, log_energy
+
+
+def snr_per_frame(speech, noise, window, padded_length=512):
+    """Oracle a priori SNR of each frame, averaged over the frequency bins
+
+    It corresponds to the mean over the frequency bins of the a priori SNR
+    estimated by DeepXi, which extract_reliability/convertsnr.py converts into
+    the audio reliability measure. The ratio of each bin is clipped to the
+    range of DeepXi, MIN_SNR_DB to MAX_SNR_DB, before the mean, so that bins
+    of silent noise do not dominate it.
+
+    :param np.ndarray speech: frames of the clean speech (T, FRAME_LENGTH)
+    :param np.ndarray noise: frames of the scaled noise (T, FRAME_LENGTH)
+    :param np.ndarray window: analysis window (FRAME_LENGTH,)
+    :param int padded_length: FFT length
+    :return: linear a priori SNR (T,)
+    :rtype: np.ndarray
+    """
+    speech = np.abs(np.fft.rfft(speech * window, n=padded_length)) ** 2
+    noise = np.abs(np.fft.rfft(noise * window, n=padded_length)) ** 2
+    ratio = np.clip(
+        speech / np.maximum(noise, EPSILON),
+        10.0 ** (MIN_SNR_DB / 10.0),
+        10.0 ** (MAX_SNR_DB / 10.0),
+    )
+    return np.mean(ratio, axis=1).astype(np.float32)
+
+
+class NoiseMixer(object):
+    """Mix noise into the clean speech of the training data while loading
+
+    Instead of a noisy copy of the corpus for every condition, noise is added
+    to the waveform of an utterance at a sampled SNR, and the audio features
+    are computed from the noisy waveform. The oracle SNR of each frame is
+    returned as the audio reliability measure, in place of the DeepXi estimate.
+
+    The log mel filterbank and the MFCCs are computed like Kaldi's
+    compute-fbank-feats and compute-mfcc-feats, without dither. Kaldi's pitch
+    can not be computed while loading, so the pitch features of the clean
+    audio input are kept.
+
+    The noise of an utterance only depends on the seed and the utterance id,
+    not on the loader process or the order of the batches. Like a noisy copy
+    of the corpus, an utterance gets the same noise in every epoch.
+
+    The configuration is a json file, e.g.
+
+    >>> {"wav_scp": "data/audio/clean/LRS2/pretrain/wav.scp",
+    ...  "segments": "data/audio/clean/LRS2/pretrain/segments",
+    ...  "noise_scp": {"noise": "data/audio/musan_noise/wav.scp",
+    ...                "music": "data/audio/musan_music/wav.scp"},
+    ...  "snrs": [-9, -6, -3, 0, 3, 6, 9],
+    ...  "prob": 0.5,
+    ...  "cmvn": "data/pretrain/cmvn.ark",
+    ...  "mfcc_cmvn": "data/pretrain/cmvn_mfcc.ark"}
+
+    :param: str wav_scp: Kaldi wav.scp of the clean utterances
+    :param: Optional[str] segments: Kaldi segments file of wav_scp
+    :param: Dict[str, str] noise_scp: Kaldi wav.scp of each noise type
+    :param: List[float] snrs: SNRs in dB, one is sampled for each utterance
+    :param: float prob: Probability that noise is mixed into an utterance
+    :param: str cmvn: Global CMVN statistics of the audio input
+    :param: str mfcc_cmvn: Global CMVN statistics of the MFCCs, as the dumped
+        MFCCs are normalized
+    :param: bool norm_vars: If the variances of the audio input are normalized
+    :param: int fs: sampling frequency
+    :param: int num_mel_bins: number of mel bins of the MFCCs
+    :param: int num_ceps: number of MFCCs
+    :param: float cepstral_lifter: lifter coefficient of the MFCCs
+    :param: bool use_energy: If the first MFCC is replaced by the log energy
+    :param: int seed: seed of the noise, --seed of the training
+    """
+
+    def __init__(
+        self,
+        wav_scp,
+        noise_scp,
+        cmvn,
+        mfcc_cmvn,
+        snrs=(-9, -6, -3, 0, 3, 6, 9),
+        prob=0.5,
+        segments=None,
+        norm_vars=True,
+        fs=16000,
+        num_mel_bins=23,
+        num_ceps=13,
+        cepstral_lifter=22.0,
+        use_energy=True,
+        seed=0,
+    ):
+        self.wav_scp = wav_scp
+        self.segments = segments
+        if isinstance(noise_scp, str):
+            noise_scp = {"noise": noise_scp}
+        self.noise_scp = dict(noise_scp)
+        self.cmvn = cmvn
+        self.snrs = list(snrs)
+        self.prob = prob
+        self.norm_vars = norm_vars
+        self.mfcc_cmvn = mfcc_cmvn
+        self.fs = fs
+        self.num_mel_bins = num_mel_bins
+        self.num_ceps = num_ceps
+        self.cepstral_lifter = cepstral_lifter
+        self.use_energy = use_energy
+        self.seed = seed
+        self.window = povey_window(FRAME_LENGTH)
+        self.mfcc_banks = mel_banks(num_mel_bins, 512, fs)
+        self.dct = dct_matrix(num_ceps, num_mel_bins)
+        self.lifter = 1.0 + 0.5 * cepstral_lifter * np.sin(
+            np.pi * np.arange(num_ceps) / cepstral_lifter
+        )
+        self.fbank_banks = None
+        self._fbank_cmvn = None
+        self._mfcc_cmvn = None
+        self._clean = None
+        self._noises = None
+
+    @classmethod
+    def from_conf(cls, path, **kwargs):
+        """Create the mixer from a json configuration file
+
+        :param str path: path of the configuration
+        :param kwargs: arguments which replace those of the configuration
+        :rtype: NoiseMixer
+        """
+        with open(path, encoding="utf-8") as f:
+            conf = json.load(f)
+        conf.update(kwargs)
+        return cls(**conf)
+
+    def __repr__(self):
+        return "{}(wav_scp={}, noise_scp={}, snrs={}, prob={})".format(
+            self.__class__.__name__, self.wav_scp, self.noise_scp, self.snrs, self.prob
+        )
+
+    def __getstate__(self):
+        # The scp readers are created again in each worker process
+        state = self.__dict__.copy()
+        state["_clean"] = None
+        state["_noises"] = None
+        return state
+
+    def utterance_rng(self, uttid, stream):
+        """Get a random generator of an utterance
+
+        The hash of python is salted for every process, so crc32 is used.
+
+        :param str uttid: utterance id
+        :param int stream: 0 for the decision of sample, 1 for the noise of mix
+        :rtype: np.random.Generator
+        """
+        return np.random.default_rng([self.seed, zlib.crc32(uttid.encode()), stream])
+
+    def _load_scps(self):
+        if self._clean is None:
+            self._clean = kaldiio.load_scp(self.wav_scp, segments=self.segments)
+            self._noises = {}
+            for name, scp in self.noise_scp.items():
+                loader = kaldiio.load_scp(scp)
+                # the keys are listed once for sampling
+                self._noises[name] = (loader, list(loader.keys()))
+
+    def _load_cmvn(self, num_fbank_bins):
+        stats = kaldiio.load_mat(self.cmvn)
+        # only the filterbank, the pitch of the clean audio input stays normalized
+        stats = np.concatenate((stats[:, :num_fbank_bins], stats[:, -1:]), axis=1)
+        self._fbank_cmvn = CMVN({None: stats}, norm_vars=self.norm_vars)
+        self._mfcc_cmvn = CMVN(self.mfcc_cmvn, norm_vars=self.norm_vars)
+        self.fbank_banks = mel_banks(num_fbank_bins, 512, self.fs)
+
+    def __contains__(self, uttid):
+        self._load_scps()
+        return uttid in self._clean
+
+    def sample(self, uttid):
+        """Decide if noise is mixed into an utterance
+
+        :param str uttid: utterance id
+        :rtype: bool
+        """
+        return (
+            self.prob > 0
+            and uttid in self
+            and self.utterance_rng(uttid, 0).random() < self.prob
+        )
+
+    def mix(self, uttid):
+        """Mix a random noise into an utterance at a random SNR
+
+        :param str uttid: utterance id in wav_scp
+        :return: clean speech, scaled noise (N,), noise type and SNR in dB
+        :rtype: Tuple[np.ndarray, np.ndarray, str, float]
+        """
+        self._load_scps()
+        rate, speech = self._clean[uttid]
+        if rate != self.fs:
+            raise ValueError(
+                "{} has a sampling rate of {}, not {}".format(uttid, rate, self.fs)
+            )
+        speech = np.asarray(speech, dtype=np.float64)
+        rng = self.utterance_rng(uttid, 1)
+        noisetype = list(self._noises)[rng.integers(len(self._noises))]
+        loader, keys = self._noises[noisetype]
+        _, noise = loader[keys[rng.integers(len(keys))]]
+        noise = np.asarray(noise, dtype=np.float64)
+        if noise.ndim > 1:
+            noise = noise[:, 0]
+        # a random excerpt, the noise is repeated if it is shorter than the speech
+        start = rng.integers(len(noise))
+        noise = np.take(noise, np.arange(start, start + len(speech)), mode="wrap")
+        snr = float(self.snrs[rng.integers(len(self.snrs))])
+        speech_power = np.mean(speech**2)
+        noise_power = max(np.mean(noise**2), EPSILON)
+        noise *= np.sqrt(speech_power / (noise_power * 10.0 ** (snr / 10.0)))
+        return speech, noise, noisetype, snr
+
+    def __call__(self, uttid, ax):
+        """Compute the noisy audio features of an utterance
+
+        :param str uttid: utterance id in wav_scp
+        :param np.ndarray ax: clean audio input (T, D), whose last NUM_PITCH
+            dimensions are the pitch features
+        :return: noisy audio input (T', D), MFCCs (T', num_ceps) and
+            oracle audio reliability measure (T',)
+        :rtype: Tuple[np.ndarray, np.ndarray, np.ndarray]
+        """
+        if self._fbank_cmvn is None:
+            self._load_cmvn(ax.shape[1] - NUM_PITCH)
+        speech, noise, noisetype, snr = self.mix(uttid)
+        logging.debug("mixed {} into {} at {} dB".format(noisetype, uttid, snr))
+
+        frames = frame_signal(speech + noise)
+        spectrum, log_energy = power_spectrum(frames, self.window)
+        fbank = np.log(np.maximum(spectrum @ self.fbank_banks.T, EPSILON))
+        fbank = self._fbank_cmvn(fbank)
+        mfcc = np.log(np.maximum(spectrum @ self.mfcc_banks.T, EPSILON))
+        mfcc = (mfcc @ self.dct.T) * self.lifter
+        if self.use_energy:
+            mfcc[:, 0] = log_energy
+        mfcc = self._mfcc_cmvn(mfcc)
+        arms = snr_per_frame(frame_signal(speech), frame_signal(noise), self.window)
+
+        # Kaldi's pitch has as many frames as the filterbank, up to rounding
+        alen = min(len(fbank), len(ax))
+        ax = np.concatenate((fbank[:alen], ax[:alen, -NUM_PITCH:]), axis=1)
+        return ax.astype(np.float32), mfcc[:alen].astype(np.float32), arms[:alen]
@@ -0,0 +1,175 @@
+from functools import lru_cache
+import io
+import os
+import pickle
+import struct
+import zipfile
+
+# name of the shape index in each directory of .pt files
+SHAPE_INDEX = "shapes.txt"
+# magic number at the start of a .pt file in the legacy (non-zip) format
+LEGACY_MAGIC_NUMBER = 0x1950A86A20F9469CFC6C
+# strings and bytes up to this size are read, longer ones are skipped
+MAX_READ_BYTES = 1024
+
+
+def append_shape(filepath, shape):
+    """Add the shape of a saved array to the shape index of its directory
+
+    Each line of the index is the file name followed by the dimensions, e.g.
+    "LRS2_5535415699068794046_00001m.pt 75 96 96". A line is appended with a
+    single write, so processes writing into the same directory do not interleave.
+    If a file is written again, its later line is used.
+
+    :param str filepath: path of the .pt file
+    :param tuple shape: shape of the saved array
+    """
+    directory, filename = os.path.split(filepath)
+    line = " ".join([filename] + [str(int(d)) for d in shape]) + "\n"
+    with open(os.path.join(directory, SHAPE_INDEX), "a") as f:
+        f.write(line)
+
+
+@lru_cache(maxsize=None)
+def load_shape_index(directory):
+    """Load the shape index of a directory
+
+    :param str directory: directory of the .pt files
+    :return: shape of each file name, empty if there is no index
+    :rtype: Dict[str, List[int]]
+    """
+    index = {}
+    indexfile = os.path.join(directory, SHAPE_INDEX)
+    if not os.path.exists(indexfile):
+        return index
+    with open(indexfile) as f:
+        for line in f:
+            filename, *shape = line.split()
+            index[filename] = [int(d) for d in shape]
+    return index
+
+
+def get_shape(filepath):
+    """Get the shape of the array in a .pt file without loading it
+
+    The shape is looked up in the shape index of the directory, else probed
+    from the file header, else the file is loaded.
+
+    :param str filepath: path of the .pt file
+    :return: shape of the array
+    :rtype: List[int]
+    """
+    directory, filename = os.path.split(filepath)
+    shape = load_shape_index(directory).get(filename)
+    if shape is None:
+        shape = probe_shape(filepath)
+    if shape is None:
+        import torch
+
+        shape = list(torch.load(filepath).shape)
+    return shape
+
+
+def probe_shape(filepath):
+    """Read the shape of the tensor or numpy array saved by torch.save
+
+    Only the pickled description of the object is read, the (long) strings and
+    bytes, i.e. the data of a numpy array, are skipped and no class is imported.
+    It supports the zip and the legacy format of torch.save.
+
+    :param str filepath: path of the .pt file
+    :return: shape of the array, None if the object is no tensor or array
+    :rtype: Optional[List[int]]
+    """
+    if zipfile.is_zipfile(filepath):
+        with zipfile.ZipFile(filepath) as zf:
+            pkl = [name for name in zf.namelist() if name.endswith("data.pkl")][0]
+            with zf.open(pkl) as f:
+                obj = _ShapeUnpickler(f).load()
+    else:
+        with open(filepath, "rb") as f:
+            if _ShapeUnpickler(f).load() != LEGACY_MAGIC_NUMBER:
+                return None
+            _ShapeUnpickler(f).load()  # protocol version
+            _ShapeUnpickler(f).load()  # system info
+            obj = _ShapeUnpickler(f).load()
+    shape = getattr(obj, "shape", None)
+    if not isinstance(shape, tuple):
+        return None
+    return [int(d) for d in shape]
+
+
+class _Stub(object):
+    """Placeholder of all classes and functions in the pickle"""
+
+    def __new__(cls, *args, **kwargs):
+        return object.__new__(cls)
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __setstate__(self, state):
+        pass
+
+
+class _ArrayShape(_Stub):
+    """numpy.core.multiarray._reconstruct, its state holds the shape"""
+
+    def __setstate__(self, state):
+        self.shape = tuple(state[1])
+
+
+class _TensorShape(object):
+    """torch._utils._rebuild_tensor_v2"""
+
+    def __init__(self, storage, storage_offset, size, *args, **kwargs):
+        self.shape = tuple(size)
+
+
+class _ShapeUnpickler(pickle._Unpickler):
+    """Unpickler which replaces all classes by placeholders and skips long data"""
+
+    dispatch = dict(pickle._Unpickler.dispatch)
+
+    def __init__(self, file):
+        super().__init__(file, encoding="latin1")
+        self.file = file
+
+    def find_class(self, module, name):
+        if name in ("_rebuild_tensor", "_rebuild_tensor_v2"):
+            return _TensorShape
+        if module.startswith("numpy") and name == "_reconstruct":
+            return _ArrayShape
+        return _Stub
+
+    def persistent_load(self, pid):
+        return None
+
+    def _read_or_skip(self, size_format, decode):
+        (size,) = struct.unpack(size_format, self.read(struct.calcsize(size_format)))
+        if size > MAX_READ_BYTES and self._unframer.current_frame is None:
+            self.file.seek(size, io.SEEK_CUR)
+            self.append(None)
+        else:
+            self.append(decode(self.read(size)))
+
+    def load_binstring(self):
+        self._read_or_skip("<i", lambda data: data.decode("latin1"))
+
+    def load_binunicode(self):
+        self._read_or_skip("<I", lambda data: str(data, "utf-8", "surrogatepass"))
+
+    def load_binunicode8(self):
+        self._read_or_skip("<Q", lambda data: str(data, "utf-8", "surrogatepass"))
+
+    def load_binbytes(self):
+        self._read_or_skip("<I", bytes)
+
+    def load_binbytes8(self):
+        self._read_or_skip("<Q", bytes)
+
+    dispatch[pickle.BINSTRING[0]] = load_binstring
+    dispatch[pickle.BINUNICODE[0]] = load_binunicode
+    dispatch[pickle.BINUNICODE8[0]] = load_binunicode8
+    dispatch[pickle.BINBYTES[0]] = load_binbytes
+    dispatch[pickle.BINBYTES8[0]] = load_binbytes8
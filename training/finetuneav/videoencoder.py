@@ -1,5 +1,6 @@
 import torch
 
+from espnet.nets.pytorch_backend.nets_utils import pad_list
 from espnet.nets.pytorch_backend.transformer.attention import MultiHeadedAttention
 from espnet.nets.pytorch_backend.transformer.embedding import PositionalEncoding
 from espnet.nets.pytorch_backend.transformer.encoder_layer import EncoderLayer
@@ -125,18 +126,31 @@ class Encoder(torch.nn.Module):
             pretrained_video_extractor, mode="temporalConv", inputDim=256, hiddenDim=512
         )
 
-    def forward(self, xs, masks, audio_length):
+    def forward(self, xs, masks, audio_length, vlens=None):
         """Embed positions in tensor
 
         :param torch.Tensor xs: input tensor
         :param torch.Tensor masks: input mask
+        :param int or List[int] audio_length: length of the audio stream,
+            one per sequence if `vlens` is given
+        :param List[int] vlens: number of valid video frames per sequence.
+            If given, each sequence is aligned to its own audio length
         :return: position embedded tensor and mask
         :rtype Tuple[torch.Tensor, torch.Tensor]:
         """
         xs_size = xs.size()
         xs = self.lipreading(xs)
         xs = xs.view(-1, xs_size[1], 256)
-        xs = dda(xs, audio_length)
+        if vlens is None:
+            xs = dda(xs, audio_length)
+        else:
+            xs = pad_list(
+                [
+                    dda(x[None, :vlen], alen)[0]
+                    for x, vlen, alen in zip(xs, vlens, audio_length)
+                ],
+                0.0,
+            )
         if isinstance(self.embed, Conv2dSubsampling):
             xs, masks = self.embed(xs, masks)
         else:
@@ -1,4 +1,6 @@
 import torch
+from torch.nn.utils.rnn import pack_padded_sequence
+from torch.nn.utils.rnn import pad_packed_sequence
 
 
 class LayerNorm(torch.nn.LayerNorm):
@@ -67,10 +69,21 @@ class ctcNet(torch.nn.Module):
         self.fc = torch.nn.Linear(512 * 2, odim)
         self.softmax = torch.nn.LogSoftmax(dim=-1)
 
-    def forward(self, input):
+    def forward(self, input, ilens=None):
         input = self.norm1(self.dropout(torch.relu(self.layer1(input))))
         input = self.norm2(self.dropout(torch.relu(self.layer2(input))))
-        input, _ = self.layer4(input)
+        if ilens is None:
+            input, _ = self.layer4(input)
+        else:
+            # keep the padded frames out of the backward direction
+            total_length = input.size(1)
+            input = pack_padded_sequence(
+                input, ilens, batch_first=True, enforce_sorted=False
+            )
+            input, _ = self.layer4(input)
+            input, _ = pad_packed_sequence(
+                input, batch_first=True, total_length=total_length
+            )
         input = self.fc(self.dropout(torch.tanh(input)))
         output = self.softmax(input)
 